@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+YouTube Audio Downloader Pro - banco de pruebas de rendimiento
+Mide el motor de descarga sin conexión a Internet: un servidor HTTP local sirve
+audio sintético y metadatos de videos y playlists, con latencia, ancho de banda
+y tasa de errores configurables, a través de un extractor de prueba de yt-dlp.
+Cada caso (número de URLs, tamaño de playlist y descargas simultáneas) se
+ejecuta en un proceso aparte y los resultados se guardan en JSON para comparar
+versiones.
+
+    python benchmark.py --urls 10 50 --playlist-size 0 5 -j 1 4 -o resultados.json
+    python benchmark.py --compare resultados.json -o nuevos.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import yt_dlp
+from yt_dlp.extractor.common import InfoExtractor
+
+from content_store import STORE_DIRNAME
+from download_engine import DownloadEngine, DownloadSettings, QUALITIES
+from transcoder import FORMATS
+from download_scheduler import DEFAULT_WORKERS
+from metrics import Metrics
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Seconds of synthetic audio per item (about 16 KB per second at 128 kbps)
+DEFAULT_DURATION = 30
+SERVE_CHUNK = 16 * 1024
+
+
+def make_tone(path, duration):
+    """Write a synthetic AAC track with FFmpeg's sine source; no network needed"""
+    subprocess.run(
+        ['ffmpeg', '-loglevel', 'error', '-y', '-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}',
+         '-c:a', 'aac', '-b:a', '128k', path],
+        check=True,
+    )
+
+
+class FakeMediaServer:
+    """Local stand-in for a media site: metadata JSON, playlists and a ranged audio stream.
+
+    /video/<id>              video metadata
+    /playlist/<id>?size=N    playlist with N entries (<id>-1 ... <id>-N)
+    /media/<id>.m4a          the synthetic audio, with Range support
+
+    latency is added to every response, bandwidth (KB/s) caps each connection
+    and error_rate answers that share of requests with HTTP 503.
+    """
+
+    def __init__(self, audio_path, latency=0.0, bandwidth=0, error_rate=0.0, seed=1):
+        with open(audio_path, 'rb') as file:
+            self.audio = file.read()
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.bytes_sent = 0
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _handler(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-media", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def counters(self):
+        with self._lock:
+            return {'bytes_sent': self.bytes_sent, 'requests': self.requests, 'errors': self.errors}
+
+    def _should_fail(self):
+        with self._lock:
+            self.requests += 1
+            fail = self.error_rate > 0 and self._random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+            return fail
+
+    def _count(self, nbytes):
+        with self._lock:
+            self.bytes_sent += nbytes
+
+
+def _handler(server):
+    class FakeMediaHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            if server.latency:
+                time.sleep(server.latency)
+            if server._should_fail():
+                self._send(503, b'injected error', 'text/plain')
+                return
+            parts = urlsplit(self.path)
+            kind, _, item_id = parts.path.strip('/').partition('/')
+            if kind == 'video' and item_id:
+                self._send_json({'id': item_id, 'title': f"Pista {item_id}",
+                                 'duration': 0, 'filesize': len(server.audio)})
+            elif kind == 'playlist' and item_id:
+                size = int((parse_qs(parts.query).get('size') or ['1'])[0])
+                self._send_json({'id': item_id, 'title': f"Lista {item_id}",
+                                 'entries': [f"{item_id}-{number}" for number in range(1, size + 1)]})
+            elif kind == 'media' and item_id.endswith('.m4a'):
+                self._send_media()
+            else:
+                self._send(404, b'not found', 'text/plain')
+
+        def _send_json(self, data):
+            self._send(200, json.dumps(data).encode('utf-8'), 'application/json')
+
+        def _send(self, status, body, content_type):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_media(self):
+            data = server.audio
+            start, end = 0, len(data)
+            match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range') or '')
+            if match:
+                start = int(match.group(1))
+                end = min(end, int(match.group(2)) + 1) if match.group(2) else end
+                if start >= end:
+                    self.send_response(416)
+                    self.send_header('Content-Range', f"bytes */{len(data)}")
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(206)
+                self.send_header('Content-Range', f"bytes {start}-{end - 1}/{len(data)}")
+            else:
+                self.send_response(200)
+            self.send_header('Content-Type', 'audio/mp4')
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Content-Length', str(end - start))
+            self.end_headers()
+
+            began = time.monotonic()
+            sent = 0
+            for offset in range(start, end, SERVE_CHUNK):
+                chunk = data[offset:min(offset + SERVE_CHUNK, end)]
+                try:
+                    self.wfile.write(chunk)
+                except OSError:
+                    return
+                sent += len(chunk)
+                server._count(len(chunk))
+                if server.bandwidth:
+                    # Sleep until this connection is back under its cap
+                    ahead = sent / (server.bandwidth * 1024) - (time.monotonic() - began)
+                    if ahead > 0:
+                        time.sleep(ahead)
+
+        def log_message(self, format, *args):
+            pass
+
+    return FakeMediaHandler
+
+
+class BenchmarkMediaIE(InfoExtractor):
+    """yt-dlp extractor for the FakeMediaServer's videos and playlists"""
+
+    IE_NAME = 'benchmark'
+    _VALID_URL = r'(?P<base>http://127\.0\.0\.1:\d+)/(?P<kind>video|playlist)/(?P<id>[\w-]+)'
+
+    def _real_extract(self, url):
+        base, kind, item_id = self._match_valid_url(url).group('base', 'kind', 'id')
+        data = self._download_json(url, item_id)
+        if kind == 'playlist':
+            entries = [self.url_result(f"{base}/video/{entry_id}", BenchmarkMediaIE, entry_id)
+                       for entry_id in data['entries']]
+            return self.playlist_result(entries, item_id, data['title'])
+        return {
+            'id': item_id,
+            'title': data['title'],
+            'formats': [{
+                'format_id': 'aac-128',
+                'url': f"{base}/media/{item_id}.m4a",
+                'ext': 'm4a',
+                'acodec': 'aac',
+                'vcodec': 'none',
+                'abr': 128,
+                'filesize': data['filesize'],
+            }],
+        }
+
+
+def case_urls(base_url, urls, playlist_size):
+    """Input URLs of a case; every item has its own ID so nothing is deduplicated"""
+    if playlist_size:
+        return [f"{base_url}/playlist/p{number}?size={playlist_size}" for number in range(1, urls + 1)]
+    return [f"{base_url}/video/v{number}" for number in range(1, urls + 1)]
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile; None for no values"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(fraction * len(ordered)) - 1))]
+
+
+def run_case(case):
+    """Run one benchmark case in this process and return its measurements.
+
+    Called in a fresh child process per case, so CPU time and peak RSS belong
+    to this case alone and no warm caches carry over from the previous one.
+    """
+    workdir = tempfile.mkdtemp(prefix='ytaudio-bench-')
+    try:
+        url_file = os.path.join(workdir, 'urls.txt')
+        with open(url_file, 'w', encoding='utf-8') as file:
+            file.write('\n'.join(case['url_list']) + '\n')
+        output = os.path.join(workdir, 'salida')
+        settings = DownloadSettings(
+            output,
+            format_ext=case['format'],
+            quality=case['quality'],
+            skip_existing=False,
+            retries=case['retries'],
+            concurrency=case['concurrency'],
+            request_interval=case['request_interval'],
+            metadata_cache=False,
+            replaygain=case.get('replaygain', False),
+        )
+
+        started_at = {}
+        latencies = []
+
+        def on_event(event):
+            if event['event'] == 'item_start':
+                started_at[event['index']] = time.perf_counter()
+            elif event['event'] == 'item_done' and event['index'] in started_at:
+                latencies.append(time.perf_counter() - started_at.pop(event['index']))
+
+        engine = DownloadEngine(settings, on_event=on_event, metrics=Metrics(), extractors=(BenchmarkMediaIE,))
+        before_self = resource.getrusage(resource.RUSAGE_SELF)
+        before_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        began = time.perf_counter()
+        stats = engine.run(url_file)
+        wall = time.perf_counter() - began
+        # The transcode pool has been shut down, so its processes (and their FFmpeg runs) are accounted
+        after_self = resource.getrusage(resource.RUSAGE_SELF)
+        after_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+        items = 0
+        for folder, subfolders, names in os.walk(output):
+            # The content store holds a second link to every output
+            subfolders[:] = [name for name in subfolders if name != STORE_DIRNAME]
+            items += sum(1 for name in names if name.endswith(f".{case['format']}"))
+        cpu = sum(after.ru_utime + after.ru_stime - before.ru_utime - before.ru_stime
+                  for before, after in ((before_self, after_self), (before_children, after_children)))
+        return {
+            'wall_seconds': wall,
+            'items': items,
+            'urls_ok': stats.success if stats else 0,
+            'urls_failed': stats.errors if stats else 0,
+            'items_per_second': items / wall if wall else None,
+            'cpu_seconds': cpu,
+            'cpu_seconds_per_item': cpu / items if items else None,
+            # ru_maxrss is in KiB on Linux
+            'peak_rss_mb': after_self.ru_maxrss / 1024,
+            'peak_child_rss_mb': after_children.ru_maxrss / 1024,
+            'latency_p50': percentile(latencies, 0.50),
+            'latency_p95': percentile(latencies, 0.95),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_case_subprocess(case):
+    """Run a case in a child process and return its measurements"""
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__), '--run-case', json.dumps(case)],
+                               capture_output=True, text=True, cwd=APP_DIR)
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip()
+                           else f"el caso terminó con código {completed.returncode}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def environment():
+    """Versions recorded with the results, so runs on different versions can be told apart"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=APP_DIR).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'yt_dlp': yt_dlp.version.__version__,
+            'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def case_id(params):
+    label = f"urls={params['urls']} playlist={params['playlist_size']} j={params['concurrency']}"
+    return f"{label} replaygain" if params.get('replaygain') else label
+
+
+def summarize(results, previous=None):
+    """Text table of the results, with the change against previous results when given"""
+    previous_by_id = {case_id(case['params']): case['results'] for case in (previous or {}).get('cases', [])}
+    lines = [f"{'caso':<34} {'elem/s':>8} {'MB/s':>7} {'CPU/elem':>9} {'RSS MB':>7} {'p50 s':>7} {'p95 s':>7}"]
+    for case in results['cases']:
+        measured = case['results']
+        row = (f"{case_id(case['params']):<34} {_number(measured['items_per_second'], 8, 2)} "
+               f"{_number(measured['mb_per_second'], 7, 2)} {_number(measured['cpu_seconds_per_item'], 9, 3)} "
+               f"{_number(measured['peak_rss_mb'], 7, 0)} {_number(measured['latency_p50'], 7, 2)} "
+               f"{_number(measured['latency_p95'], 7, 2)}")
+        earlier = previous_by_id.get(case_id(case['params']))
+        if earlier and earlier.get('items_per_second') and measured['items_per_second']:
+            change = measured['items_per_second'] / earlier['items_per_second'] - 1
+            row += f"  ({change:+.1%} elem/s)"
+        lines.append(row)
+    return '\n'.join(lines)
+
+
+def _number(value, width, decimals):
+    return f"{'-':>{width}}" if value is None else f"{value:>{width}.{decimals}f}"
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Banco de pruebas del motor de descarga con un servidor de medios local (sin Internet)")
+    parser.add_argument('--urls', type=int, nargs='+', default=[10], metavar='N',
+                        help="URLs de entrada por caso (varios valores = varios casos)")
+    parser.add_argument('--playlist-size', type=int, nargs='+', default=[0], metavar='N',
+                        help="Elementos por playlist; 0 = URLs de videos sueltos")
+    parser.add_argument('-j', '--concurrency', type=int, nargs='+', default=[DEFAULT_WORKERS], metavar='N',
+                        help="Descargas simultáneas")
+    parser.add_argument('-f', '--format', choices=FORMATS, default='mp3', help="Formato de salida")
+    parser.add_argument('-q', '--quality', choices=QUALITIES, default='192', help="Calidad en kbps")
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION, metavar='SEG',
+                        help="Duración del audio sintético de cada elemento")
+    parser.add_argument('--latency', type=float, default=0.0, metavar='SEG',
+                        help="Latencia añadida a cada respuesta del servidor")
+    parser.add_argument('--bandwidth', type=int, default=0, metavar='KB/S',
+                        help="Ancho de banda por conexión del servidor (0 = sin límite)")
+    parser.add_argument('--error-rate', type=float, default=0.0, metavar='FRACCIÓN',
+                        help="Parte de las peticiones respondidas con HTTP 503 (p. ej. 0.05)")
+    parser.add_argument('--request-interval', type=float, default=0.0, metavar='SEG',
+                        help="Pausa mínima entre peticiones al mismo sitio (todas van a 127.0.0.1)")
+    parser.add_argument('--replaygain', action='store_true',
+                        help="Incluir el análisis de sonoridad y las etiquetas ReplayGain")
+    parser.add_argument('-r', '--retries', type=int, default=3, help="Número de reintentos")
+    parser.add_argument('--repeat', type=int, default=1, metavar='N', help="Repeticiones de cada caso")
+    parser.add_argument('--seed', type=int, default=1, help="Semilla de los errores inyectados")
+    parser.add_argument('-o', '--output', metavar='RUTA', help="Guardar los resultados en este archivo JSON")
+    parser.add_argument('--compare', metavar='RUTA',
+                        help="Resultados JSON anteriores con los que comparar elementos por segundo")
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.run_case:
+        print(json.dumps(run_case(json.loads(args.run_case))))
+        return 0
+
+    previous = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            previous = json.load(file)
+
+    with tempfile.TemporaryDirectory(prefix='ytaudio-bench-media-') as media_dir:
+        audio_path = os.path.join(media_dir, 'tone.m4a')
+        make_tone(audio_path, args.duration)
+        server_settings = {'latency': args.latency, 'bandwidth': args.bandwidth,
+                           'error_rate': args.error_rate, 'seed': args.seed}
+        server = FakeMediaServer(audio_path, **server_settings).start()
+        results = {'environment': environment(),
+                   'server': dict(server_settings, audio_bytes=len(server.audio), duration=args.duration),
+                   'cases': []}
+        try:
+            for urls, playlist_size, concurrency in itertools.product(args.urls, args.playlist_size,
+                                                                      args.concurrency):
+                for repetition in range(1, args.repeat + 1):
+                    params = {'urls': urls, 'playlist_size': playlist_size, 'concurrency': concurrency,
+                              'format': args.format, 'quality': args.quality, 'replaygain': args.replaygain,
+                              'repetition': repetition}
+                    print(f"⏱️ {case_id(params)} (repetición {repetition})...", file=sys.stderr)
+                    case = dict(params, retries=args.retries, request_interval=args.request_interval,
+                                url_list=case_urls(server.base_url, urls, playlist_size))
+                    before = server.counters()
+                    measured = run_case_subprocess(case)
+                    after = server.counters()
+                    sent = after['bytes_sent'] - before['bytes_sent']
+                    measured.update(
+                        bytes_served=sent,
+                        mb_per_second=sent / 1024 / 1024 / measured['wall_seconds'],
+                        injected_errors=after['errors'] - before['errors'],
+                    )
+                    results['cases'].append({'params': params, 'results': measured})
+        finally:
+            server.close()
+
+    print(summarize(results, previous))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2, ensure_ascii=False)
+        print(f"💾 Resultados guardados en {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
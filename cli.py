@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+YouTube Audio Downloader Pro - modo sin interfaz
+Usa el mismo motor de descarga que la aplicación gráfica y escribe el progreso
+como líneas JSON en la salida estándar. No importa tkinter.
+"""
+
+import argparse
+import itertools
+import json
+import signal
+import sys
+import threading
+import time
+
+from download_engine import DownloadEngine, DownloadSettings, QUALITIES, DEFAULT_REQUEST_INTERVAL
+from download_scheduler import DEFAULT_WORKERS, MAX_WORKERS
+from transcoder import FORMATS
+from rate_limiter import DEFAULT_CONNECTIONS, MAX_CONNECTIONS
+from job_store import JobStore, DEFAULT_BATCH_SIZE, DEFAULT_LEASE_SECONDS
+from url_ingest import UrlIngest
+from metrics import Metrics, MetricsExporter
+from profiling import BatchProfiler, describe
+
+
+PROGRESS_EVENTS = ('progress', 'playlist_progress', 'entry_done', 'ingest_progress', 'item_queued',
+                   'entry_queued')
+
+
+class JsonLinesWriter:
+    """Write one JSON object per engine event to a stream"""
+
+    def __init__(self, stream, include_progress=True):
+        self.stream = stream
+        self.include_progress = include_progress
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        if event['event'] in PROGRESS_EVENTS and not self.include_progress:
+            return
+        event = dict(event, time=round(time.time(), 3))
+        line = json.dumps(event, ensure_ascii=False, default=str)
+        with self._lock:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+
+
+def parse_output(value):
+    """'mp3:320' -> ('mp3', '320')"""
+    format_ext, _, quality = value.partition(':')
+    quality = quality.rstrip('kK') or '192'
+    if format_ext not in FORMATS or quality not in QUALITIES:
+        raise argparse.ArgumentTypeError(
+            f"salida no válida: {value} (formatos {', '.join(FORMATS)}; calidades {', '.join(QUALITIES)})")
+    return format_ext, quality
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Descarga audio de YouTube sin interfaz gráfica (progreso en líneas JSON)")
+    parser.add_argument('inputs', nargs='*', metavar='URL_O_ARCHIVO',
+                        help="URL de YouTube o lista de URLs (.txt con una por línea, .csv/.tsv con "
+                             "columna 'url' o .jsonl con campo 'url')")
+    parser.add_argument('-o', '--output', required=True, help="Carpeta de descarga")
+    parser.add_argument('-f', '--format', choices=FORMATS, default='mp3', help="Formato de salida")
+    parser.add_argument('-q', '--quality', choices=QUALITIES, default='192', help="Calidad en kbps")
+    parser.add_argument('--also', action='append', type=parse_output, default=[], metavar='FORMATO:KBPS',
+                        help="Salida adicional del mismo audio (p. ej. --also ogg:128); con varias "
+                             "salidas, cada formato va a su subcarpeta")
+    parser.add_argument('-r', '--retries', type=int, default=3, help="Número de reintentos")
+    parser.add_argument('-j', '--concurrency', type=int, default=DEFAULT_WORKERS,
+                        help=f"Descargas simultáneas (1-{MAX_WORKERS})")
+    parser.add_argument('--limit-rate', type=int, default=0, metavar='KB/S',
+                        help="Ancho de banda total máximo en KB/s (0 = sin límite)")
+    parser.add_argument('--worker-limit-rate', type=int, default=0, metavar='KB/S',
+                        help="Ancho de banda máximo por descarga en KB/s (0 = sin límite)")
+    parser.add_argument('--connections', type=int, default=DEFAULT_CONNECTIONS, metavar='N',
+                        help=f"Conexiones máximas por descarga larga (1-{MAX_CONNECTIONS}; "
+                             "se ajustan según la velocidad)")
+    parser.add_argument('--request-interval', type=float, default=DEFAULT_REQUEST_INTERVAL,
+                        metavar='SEG', help="Pausa mínima entre peticiones al mismo sitio")
+    parser.add_argument('--no-playlist', action='store_true',
+                        help="Descargar solo el primer video de cada playlist")
+    parser.add_argument('--no-skip-existing', action='store_true',
+                        help="Volver a descargar videos ya registrados en el archivo")
+    parser.add_argument('--no-metadata-cache', action='store_true',
+                        help="No reutilizar metadatos de ejecuciones anteriores")
+    parser.add_argument('--replaygain', action='store_true',
+                        help="Medir la sonoridad (EBU R128) de cada audio y escribir etiquetas ReplayGain "
+                             "de pista y, en las playlists, de álbum")
+    parser.add_argument('--no-progress', action='store_true',
+                        help="No emitir eventos de progreso por archivo")
+    parser.add_argument('--metrics-file', metavar='RUTA',
+                        help="Escribir métricas en formato Prometheus en este archivo cada pocos segundos "
+                             "(p. ej. para el textfile collector de node_exporter)")
+    parser.add_argument('--metrics-port', type=int, metavar='PUERTO',
+                        help="Servir las métricas en http://127.0.0.1:PUERTO/metrics")
+    parser.add_argument('--profile', action='store_true',
+                        help="Perfilar cada lote con cProfile y tracemalloc; los informes (perfil-*.txt, "
+                             ".prof y .tracemalloc) se guardan en la carpeta de descarga")
+    parser.add_argument('--store', metavar='CARPETA',
+                        help="Trabajo compartido entre varias máquinas (p. ej. en NFS): las URLs dadas "
+                             "se añaden si aún no existe y este proceso reclama lotes hasta terminarlo")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, metavar='N',
+                        help="URLs por lote al crear un trabajo compartido")
+    parser.add_argument('--lease', type=int, default=DEFAULT_LEASE_SECONDS, metavar='SEG',
+                        help="Segundos sin renovar tras los que otro proceso recupera un lote")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not args.inputs and not args.store:
+        parser.error("indica al menos una URL o archivo, o --store")
+
+    settings = DownloadSettings(
+        args.output,
+        quality=args.quality,
+        format_ext=args.format,
+        download_playlist=not args.no_playlist,
+        skip_existing=not args.no_skip_existing,
+        retries=args.retries,
+        concurrency=args.concurrency,
+        rate_limit=args.limit_rate,
+        worker_rate_limit=args.worker_limit_rate,
+        request_interval=args.request_interval,
+        connections=max(1, min(args.connections, MAX_CONNECTIONS)),
+        metadata_cache=not args.no_metadata_cache,
+        extra_outputs=args.also,
+        replaygain=args.replaygain,
+    )
+    writer = JsonLinesWriter(sys.stdout, include_progress=not args.no_progress)
+    metrics = Metrics()
+    engine = DownloadEngine(settings, on_event=writer, metrics=metrics)
+    exporter = None
+    if args.metrics_file or args.metrics_port:
+        exporter = MetricsExporter(metrics, path=args.metrics_file, port=args.metrics_port).start()
+
+    # A supervisor's SIGTERM stops the batch cleanly; unfinished URLs stay in the journal
+    stopping = []
+
+    def on_signal(signum, frame):
+        stopping.append(signum)
+        engine.cancel()
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+
+    try:
+        if args.store:
+            return run_store(args, settings, engine, writer, stopping)
+        # One batch, and so one journal, for every input: a rerun resumes whatever was pending
+        stats = run_batch(args, engine, writer, engine.run, args.inputs)
+    except Exception as e:
+        writer({'event': 'fatal', 'message': f"❌ Error crítico: {str(e)}"})
+        return 2
+    finally:
+        if exporter:
+            exporter.close()
+
+    if stopping:
+        return 128 + stopping[0]
+    return 1 if stats is not None and stats.errors else 0
+
+
+def run_batch(args, engine, writer, run, *run_args):
+    """Run one engine batch, recorded by a BatchProfiler with --profile"""
+    if not args.profile:
+        return run(*run_args)
+    engine.profiler = BatchProfiler(args.output).start()
+    try:
+        return run(*run_args)
+    finally:
+        result = engine.profiler.stop()
+        engine.profiler = None
+        writer(dict(result, event='profile_saved', message=describe(result)))
+
+
+def run_store(args, settings, engine, writer, stopping):
+    """Create the shared job from the inputs (first process only) and work on it"""
+    job_store = JobStore(args.store, lease_seconds=args.lease)
+    if args.inputs and not job_store.load():
+        ingest = UrlIngest(noplaylist=not settings.download_playlist)
+        urls = itertools.chain.from_iterable(ingest.stream(url_or_file) for url_or_file in args.inputs)
+        if job_store.create(urls, settings.journal_settings(), batch_size=max(1, args.batch_size)):
+            writer({'event': 'store_created', 'total': job_store.total, 'duplicates': ingest.duplicates,
+                    'invalid': ingest.invalid,
+                    'message': f"🗂️ Trabajo compartido creado con {job_store.total} URLs"})
+
+    stats = run_batch(args, engine, writer, engine.run_store, job_store)
+    if stopping:
+        return 128 + stopping[0]
+    return 1 if stats is None or stats.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""
+Almacén de contenido por video
+Guarda cada audio convertido una sola vez por ID de video, formato y calidad
+dentro de la carpeta de descarga; los nombres de cada playlist son enlaces
+duros (o copias reflink) al archivo guardado.
+"""
+
+import os
+import re
+import shutil
+import threading
+
+from download_archive import split_archive_id
+
+STORE_DIRNAME = '.store'
+
+# Resolved title of a stored item, for naming its links in other playlists
+TITLE_FILENAME = 'title.txt'
+
+# ioctl that clones a file's extents on Btrfs/XFS (Linux FICLONE)
+_FICLONE = 0x40049409
+
+_UNSAFE_CHARS = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+def _clone(source, target):
+    """Hardlink source to target, falling back to a reflink and then to a copy"""
+    try:
+        os.link(source, target)
+        return
+    except OSError:
+        pass
+    try:
+        import fcntl
+        with open(source, 'rb') as src, open(target, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        return
+    except (ImportError, OSError):
+        if os.path.exists(target):
+            os.remove(target)
+    shutil.copy2(source, target)
+
+
+class ContentStore:
+    """Converted files keyed by (archive ID, format, quality)"""
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_folder(cls, folder):
+        """Open the store kept in a download folder (same filesystem, so hardlinks work)"""
+        return cls(os.path.join(folder, STORE_DIRNAME))
+
+    def path_for(self, archive_id, format_ext, quality):
+        extractor, video_id = split_archive_id(archive_id)
+        return os.path.join(self.root, _UNSAFE_CHARS.sub('_', extractor),
+                            _UNSAFE_CHARS.sub('_', video_id), f"{quality}k.{format_ext}")
+
+    def has(self, archive_id, format_ext, quality):
+        return os.path.isfile(self.path_for(archive_id, format_ext, quality))
+
+    def _title_path(self, archive_id):
+        return os.path.join(os.path.dirname(self.path_for(archive_id, 'tmp', 0)), TITLE_FILENAME)
+
+    def remember_title(self, archive_id, title):
+        """Keep the title the item was downloaded under"""
+        path = self._title_path(archive_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as file:
+            file.write(title)
+        os.replace(tmp, path)
+
+    def title_of(self, archive_id):
+        """Title remembered for a stored item, or None"""
+        try:
+            with open(self._title_path(archive_id), encoding='utf-8') as file:
+                return file.read() or None
+        except OSError:
+            return None
+
+    def link(self, archive_id, format_ext, quality, target):
+        """Make target point at the stored file, replacing any other file there"""
+        stored = self.path_for(archive_id, format_ext, quality)
+        if os.path.exists(target):
+            if os.path.samefile(stored, target):
+                return
+        os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+        tmp = f"{target}.link"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        _clone(stored, tmp)
+        os.replace(tmp, target)
+
+    def adopt(self, archive_id, format_ext, quality, path):
+        """Move a freshly converted file into the store and leave a link in its place.
+
+        If another playlist stored the same item first, path becomes a link to
+        that copy and the duplicate is dropped.
+        """
+        stored = self.path_for(archive_id, format_ext, quality)
+        with self._lock:
+            if not os.path.exists(stored):
+                os.makedirs(os.path.dirname(stored), exist_ok=True)
+                os.replace(path, stored)
+        self.link(archive_id, format_ext, quality, path)
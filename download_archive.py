@@ -0,0 +1,146 @@
+"""
+Archivo persistente de descargas completadas
+Índice SQLite de videos terminados, por extractor e ID, para omitir
+lo que ya se descargó antes de hacer cualquier petición de red
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+ARCHIVE_FILENAME = '.download_archive.sqlite3'
+LEGACY_PROGRESS_FILE = 'download_progress.json'
+
+
+def make_archive_id(extractor, video_id):
+    """Archive key in yt-dlp's format: '<extractor> <id>'"""
+    return f"{extractor.lower()} {video_id}"
+
+
+def split_archive_id(archive_id):
+    extractor, _, video_id = archive_id.partition(' ')
+    return extractor, video_id
+
+
+class DownloadArchive:
+    """Indexed, thread-safe record of finished videos.
+
+    Supports ``in`` with yt-dlp archive IDs ('youtube dQw4w9WgXcQ'), so a
+    read-only view can be passed as yt-dlp's ``download_archive`` option.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS archive ("
+            " extractor TEXT NOT NULL,"
+            " video_id TEXT NOT NULL,"
+            " added_at REAL NOT NULL,"
+            " PRIMARY KEY (extractor, video_id)) WITHOUT ROWID"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS imports (path TEXT PRIMARY KEY, mtime REAL NOT NULL)"
+        )
+
+    @classmethod
+    def for_folder(cls, folder):
+        """Open the archive kept in a download folder"""
+        return cls(os.path.join(folder, ARCHIVE_FILENAME))
+
+    def __contains__(self, archive_id):
+        extractor, video_id = split_archive_id(archive_id)
+        return self.contains(extractor, video_id)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM archive").fetchone()[0]
+
+    def contains(self, extractor, video_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM archive WHERE extractor = ? AND video_id = ?",
+                (extractor.lower(), video_id),
+            ).fetchone()
+        return row is not None
+
+    def record(self, extractor, video_id):
+        """Mark a video as finished"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO archive (extractor, video_id, added_at) VALUES (?, ?, ?)",
+                (extractor.lower(), video_id, time.time()),
+            )
+
+    def add(self, archive_id):
+        self.record(*split_archive_id(archive_id))
+
+    def lookup_only(self):
+        """View for yt-dlp: answers lookups but ignores its own add() calls.
+
+        Items are recorded by the app once conversion has succeeded.
+        """
+        return _ArchiveLookup(self)
+
+    def import_legacy_progress(self, path, extractor='youtube'):
+        """Import a download_progress.json list of video IDs; returns the count added"""
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return 0
+
+        key = os.path.abspath(path)
+        with self._lock:
+            row = self._conn.execute("SELECT mtime FROM imports WHERE path = ?", (key,)).fetchone()
+        if row is not None and row[0] >= mtime:
+            return 0
+
+        with open(path, 'r', encoding='utf-8') as file:
+            video_ids = json.load(file)
+        if not isinstance(video_ids, list):
+            raise ValueError(f"{os.path.basename(path)} no contiene una lista de IDs")
+
+        now = time.time()
+        rows = [(extractor, str(video_id), now) for video_id in video_ids if video_id]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO archive (extractor, video_id, added_at) VALUES (?, ?, ?)", rows
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO imports (path, mtime) VALUES (?, ?)", (key, mtime)
+            )
+            self._conn.execute("COMMIT")
+            return self._conn.total_changes - before - 1
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _ArchiveLookup:
+    """Read-only archive view handed to yt-dlp"""
+
+    def __init__(self, archive):
+        self._archive = archive
+
+    def __contains__(self, archive_id):
+        return archive_id in self._archive
+
+    def __bool__(self):
+        return True
+
+    def add(self, archive_id):
+        pass
@@ -0,0 +1,1095 @@
+"""
+Motor de descarga independiente de la interfaz
+Contiene toda la lógica de descarga y conversión; la interfaz gráfica y el
+modo de línea de comandos solo reciben sus eventos. No importa tkinter.
+"""
+
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from yt_dlp.utils import PlaylistEntries
+
+from download_scheduler import DownloadScheduler, DEFAULT_WORKERS, resolve_with_followups, when_all_done
+from transcoder import TranscodePool, format_selector, can_copy, output_folder
+from content_store import ContentStore
+from ydl_workers import YDLWorkerPool
+from download_archive import DownloadArchive, LEGACY_PROGRESS_FILE, make_archive_id
+import job_journal
+from job_journal import JobJournal
+from rate_limiter import BandwidthLimiter, HostPacer, DEFAULT_REQUEST_INTERVAL, DEFAULT_CONNECTIONS
+from metadata_cache import MetadataCache, cache_key
+from url_ingest import UrlIngest
+from metrics import Metrics, EXTRACT, DOWNLOAD, WRITE
+from retry_policy import RetryPolicy, DeferredQueue, retry_future, classify_error, CATEGORY_LABELS
+import loudness
+from loudness import measure_and_tag, analyze_file, album_measurement, replaygain_tags, write_tags, format_gain
+
+QUALITIES = ('128', '192', '320')
+
+# yt-dlp's own immediate retries; longer outages go through the deferred retry queue
+INPLACE_RETRIES = 1
+
+# Log a playlist expansion update every this many queued entries
+PLAYLIST_LOG_EVERY = 100
+# Seconds between 'ingest_progress' events while a URL file is being read
+INGEST_REPORT_INTERVAL = 1.0
+
+
+class DownloadSettings:
+    """Options for one batch, as chosen in the settings dialog or on the command line"""
+
+    def __init__(self, download_folder, quality='192', format_ext='mp3', download_playlist=True,
+                 skip_existing=True, retries=3, concurrency=DEFAULT_WORKERS,
+                 rate_limit=0, worker_rate_limit=0, request_interval=DEFAULT_REQUEST_INTERVAL,
+                 metadata_cache=True, extra_outputs=(), connections=DEFAULT_CONNECTIONS, replaygain=False):
+        self.download_folder = download_folder
+        self.quality = str(quality)
+        self.format_ext = format_ext
+        self.download_playlist = download_playlist
+        self.skip_existing = skip_existing
+        # Retries of transient failures, with backoff (see retry_policy)
+        self.retries = retries
+        self.concurrency = concurrency
+        # Bandwidth limits in KB/s (0 = unlimited) and seconds between requests per host
+        self.rate_limit = rate_limit
+        self.worker_rate_limit = worker_rate_limit
+        self.request_interval = request_interval
+        # Most connections per download, for byte-range segments and DASH/HLS fragments
+        self.connections = connections
+        # Reuse extract_info results from earlier runs (see metadata_cache)
+        self.metadata_cache = metadata_cache
+        # Additional (format, quality) outputs made from the same download
+        self.extra_outputs = [(fmt, str(q)) for fmt, q in extra_outputs]
+        # Measure loudness after conversion and write ReplayGain tags (see loudness)
+        self.replaygain = replaygain
+
+    @property
+    def outputs(self):
+        """Every (format, quality) to produce; more than one writes per-format subfolders"""
+        outputs = [(self.format_ext, self.quality)]
+        for output in self.extra_outputs:
+            if output not in outputs:
+                outputs.append(output)
+        return outputs
+
+    def journal_settings(self):
+        """Settings that must match for an interrupted job to be resumed"""
+        return {
+            'quality': self.quality,
+            'format': self.format_ext,
+            'download_playlist': self.download_playlist,
+            'extra_outputs': [list(output) for output in self.extra_outputs],
+        }
+
+    def apply_journal_settings(self, settings):
+        self.quality = settings.get('quality', self.quality)
+        self.format_ext = settings.get('format', self.format_ext)
+        self.download_playlist = settings.get('download_playlist', self.download_playlist)
+        self.extra_outputs = [tuple(output) for output in settings.get('extra_outputs', self.extra_outputs)]
+
+
+class _YDLLogger:
+    """Route yt-dlp's own messages into engine events instead of the console"""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def debug(self, message):
+        pass
+
+    def info(self, message):
+        pass
+
+    def warning(self, message):
+        self.engine.emit('ydl_warning', f"⚠️ {message}")
+
+    def error(self, message):
+        self.engine._worker_state.last_error = message
+        self.engine.emit('ydl_error', f"❌ {message}")
+
+
+class DownloadEngine:
+    """Download and convert a URL or URL file, reporting progress as events.
+
+    ``on_event(event)`` receives dicts with an ``event`` type, a human-readable
+    ``message`` and event-specific fields. It is called from worker threads.
+    """
+
+    def __init__(self, settings, on_event=None, limiter=None, pacer=None, metrics=None, profiler=None,
+                 extractors=()):
+        self.settings = settings
+        self.on_event = on_event
+        # Shared limiter/pacer may be passed in so several engines respect one budget
+        self.limiter = limiter or BandwidthLimiter(settings.rate_limit * 1024, settings.worker_rate_limit * 1024)
+        self.pacer = pacer or HostPacer(settings.request_interval)
+        self.metrics = metrics or Metrics()
+        # BatchProfiler of the current batch, if profiling was requested; set per batch by the caller
+        self.profiler = profiler
+        # Extra yt-dlp extractor classes tried before the built-in ones (e.g. the benchmark's fake site)
+        self.extractors = tuple(extractors)
+        self.journal = None
+        self._scheduler = None
+        self._archive = None
+        self._metadata = None
+        self._store = None
+        self._producing = {}
+        self._producing_lock = threading.Lock()
+        # index -> {playlist_index: (paths, measurement or None)} for album gain
+        self._album_tracks = {}
+        self._album_lock = threading.Lock()
+        self._ydl_workers = None
+        self._transcode_pool = None
+        self._owns_transcode_pool = False
+        self._spawn = None
+        self._retry_policy = None
+        self._deferred = None
+        self._job_store = None
+        self._job_leases = None
+        self._cancelled = threading.Event()
+        self._worker_state = threading.local()
+
+    def emit(self, event, message=None, **fields):
+        if self.on_event is None:
+            return
+        fields['event'] = event
+        fields['message'] = message
+        try:
+            self.on_event(fields)
+        except Exception:
+            pass
+
+    def update_limits(self, rate_limit, worker_rate_limit, request_interval):
+        """Apply new bandwidth (KB/s, 0 = unlimited) and pacing limits, also mid-batch"""
+        self.settings.rate_limit = rate_limit
+        self.settings.worker_rate_limit = worker_rate_limit
+        self.settings.request_interval = request_interval
+        self.limiter.set_rates(rate_limit * 1024, worker_rate_limit * 1024)
+        self.pacer.set_interval(request_interval)
+
+    def cancel(self):
+        """Stop after the URLs in progress; the rest stay pending in the journal"""
+        self._cancelled.set()
+        if self._scheduler:
+            self._scheduler.cancel()
+        if self._deferred:
+            # Items waiting for a retry fail with their last error
+            self._deferred.cancel()
+
+    def build_ydl_opts(self):
+        """yt-dlp options (raw audio only; conversion runs in the transcode stage)"""
+        settings = self.settings
+        return {
+            # Prefer a stream in the target codec so it can be copied instead of re-encoded
+            'format': format_selector(settings.format_ext, settings.quality),
+            'outtmpl': os.path.join(
+                settings.download_folder,
+                # The playlist ID keeps the same video at the same index in two playlists apart
+                '%(playlist_index&{:02d} - |)s%(title)s%(playlist_id& [{}]|)s.%(ext)s' if settings.download_playlist
+                else '%(title)s.%(ext)s'
+            ),
+            'noplaylist': not settings.download_playlist,
+            'ignoreerrors': True,
+            'quiet': True,
+            'noprogress': True,
+            'logger': _YDLLogger(self),
+            'progress_hooks': [self.progress_hook],
+            'retries': INPLACE_RETRIES,
+            'fragment_retries': INPLACE_RETRIES,
+            'extractor_retries': INPLACE_RETRIES,
+            'socket_timeout': 30,
+            # Long single streams are split across connections (see segmented_download)
+            'concurrent_fragment_downloads': max(1, int(self.settings.connections)),
+            'continuedl': True,  # resume .part files left by an interrupted job
+        }
+
+    def run(self, url_or_file):
+        """Process a URL or URL file; returns the BatchStats, or None if there was nothing to do.
+
+        A list of URLs and URL files runs as one batch with a single journal, so
+        an interrupted run resumes all of them. URL files are read while the
+        batch runs, so downloads start before a large file has been read to the end.
+        """
+        settings = self.settings
+        inputs = [url_or_file] if isinstance(url_or_file, str) else list(url_or_file)
+        # A single input keeps the plain string, as in journals of earlier versions
+        source = inputs[0] if len(inputs) == 1 else inputs
+
+        for path in inputs:
+            if os.path.isfile(path):
+                self.emit('log', f"📄 Leyendo archivo: {os.path.basename(path)}")
+
+        os.makedirs(settings.download_folder, exist_ok=True)
+        # Resume an interrupted job for the same inputs, or start a new journal
+        journal = JobJournal.for_folder(settings.download_folder)
+        resuming = (journal.load() and journal.source == source
+                    and (journal.unfinished() or not journal.complete))
+        if resuming:
+            # Same settings as the interrupted run so yt-dlp can continue its .part files
+            settings.apply_journal_settings(journal.settings)
+        ingest = UrlIngest(noplaylist=not settings.download_playlist)
+
+        pending = []
+        if resuming:
+            pending = journal.resume()
+            for item in journal.items.values():
+                ingest.mark_seen(item.url)
+            self.emit('log', f"♻️ Reanudando trabajo: {len(pending)} de {len(journal.items)} pendientes",
+                      resumed=True)
+        new_urls = (iter(()) if resuming and journal.complete
+                    else itertools.chain.from_iterable(ingest.stream(path) for path in inputs))
+
+        first_url = next(new_urls, None)
+        if not pending and first_url is None and not journal.items:
+            self.emit('log', "❌ No se encontraron URLs válidas")
+            return None
+        if not resuming:
+            journal.start(source, [], settings.journal_settings(), complete=False)
+        self.journal = journal
+
+        def items():
+            yield from pending
+            if first_url is not None:
+                yield from self._ingested(journal, ingest, itertools.chain([first_url], new_urls))
+            if not journal.complete:
+                journal.mark_complete()
+                self._report_ingest(ingest, known=len(journal.items) - ingest.accepted)
+
+        try:
+            stats = self._run_job(items(), lambda: len(journal.items),
+                                  already_done=len(journal.items) - len(pending))
+        finally:
+            journal.close()
+            self.journal = None
+
+        if stats.completed < stats.total:
+            self.emit('log', "⏹️ Trabajo interrumpido; se reanudará al volver a ejecutarlo")
+        elif stats.errors:
+            self.emit('log', "♻️ Las URLs con errores se reintentarán al volver a descargar")
+        else:
+            journal.discard()
+        self._batch_done(stats)
+        return stats
+
+    def run_store(self, job_store):
+        """Work on a shared JobStore, claiming batches until every batch has results.
+
+        Several processes, also on other machines, may run this on the same
+        store; each one downloads to its own settings.download_folder.
+        """
+        settings = self.settings
+        if not job_store.load():
+            self.emit('log', f"❌ No hay ningún trabajo en {job_store.root}")
+            return None
+        # Every worker produces the same formats as the job's creator asked for
+        settings.apply_journal_settings(job_store.settings)
+        os.makedirs(settings.download_folder, exist_ok=True)
+        self.emit('log', f"🗂️ Trabajo compartido: {job_store.root} (proceso {job_store.worker_id})")
+
+        leases = {}
+        # Highest index claimed so far; the header only has the total once the creator finishes
+        claimed = [0]
+
+        def items():
+            while not self._cancelled.is_set():
+                lease = job_store.claim()
+                if not job_store.complete:
+                    job_store.load()
+                if lease is None:
+                    if job_store.finished():
+                        return
+                    # Other workers still hold leases; wait in case one of them expires
+                    self._cancelled.wait(job_store.poll_interval)
+                    job_store.load()
+                    continue
+                self.emit('log', f"📦 Lote {lease.batch}: {len(lease.items)} URLs")
+                for index, url in lease.items:
+                    leases[index] = lease
+                    claimed[0] = max(claimed[0], index)
+                    yield index, url
+
+        self._job_leases = leases
+        self._job_store = job_store
+        job_store.start_heartbeat()
+        try:
+            stats = self._run_job(items(), lambda: max(job_store.total, claimed[0]))
+        finally:
+            job_store.stop_heartbeat()
+            # Batches this worker did not finish go back to the queue for the others
+            released = job_store.release_held()
+            self._job_store = None
+            self._job_leases = None
+
+        if released:
+            self.emit('log', f"⏹️ {released} lotes sin terminar devueltos al trabajo compartido")
+        status = job_store.status()
+        self.emit('log', f"🗂️ Trabajo compartido: {status['done']} exitosas y {status['failed']} con errores "
+                         f"de {status['total']}", store_status=status)
+        self._batch_done(stats)
+        return stats
+
+    def _ingested(self, journal, ingest, urls):
+        """Journal each URL read from the input and pass it on as an (index, url) item"""
+        last_report = time.monotonic()
+        for url in urls:
+            index = journal.add(url)
+            if self._scheduler:
+                self._scheduler.stats.total = len(journal.items)
+            now = time.monotonic()
+            if now - last_report >= INGEST_REPORT_INTERVAL:
+                last_report = now
+                self.emit('ingest_progress', total=len(journal.items), read=ingest.read,
+                          duplicates=ingest.duplicates, invalid=ingest.invalid)
+            yield index, url
+
+    def _report_ingest(self, ingest, known=0):
+        # URLs already in a resumed journal are read again and counted as duplicates
+        duplicates = max(0, ingest.duplicates - known)
+        total = len(self.journal.items)
+        message = f"📋 Total URLs: {total}"
+        if duplicates or ingest.invalid:
+            message += f" ({duplicates} duplicadas y {ingest.invalid} no válidas descartadas)"
+        self.emit('ingest_done', message, total=total, duplicates=duplicates, invalid=ingest.invalid)
+
+    def open(self, transcode_pool=None, spawn=None):
+        """Acquire the batch resources: archive, per-worker yt-dlp sessions and transcode pool.
+
+        A shared transcode_pool may be passed in (e.g. by the job service); otherwise
+        the engine creates its own. spawn(fn) runs playlist entries on the caller's
+        worker pool and returns a Future.
+        """
+        settings = self.settings
+        self._spawn = spawn
+        ydl_opts = self.build_ydl_opts()
+
+        # Archive of finished videos, checked before any network request
+        self._archive = DownloadArchive.for_folder(settings.download_folder)
+        # Only the folder's own list: the app-wide one does not say which folder its IDs went to
+        try:
+            imported = self._archive.import_legacy_progress(
+                os.path.join(settings.download_folder, LEGACY_PROGRESS_FILE))
+            if imported:
+                self.emit('log', f"📥 Importados {imported} IDs desde {LEGACY_PROGRESS_FILE}")
+        except (OSError, ValueError) as e:
+            self.emit('log', f"⚠️ No se pudo importar {LEGACY_PROGRESS_FILE}: {str(e)}")
+        if settings.skip_existing:
+            ydl_opts['download_archive'] = self._archive.lookup_only()
+            self.emit('log', f"⏭️ Omitiendo descargas previas ({len(self._archive)} en el archivo)")
+
+        self._store = ContentStore.for_folder(settings.download_folder)
+        if settings.metadata_cache:
+            try:
+                self._metadata = MetadataCache()
+            except (OSError, sqlite3.Error) as e:
+                self.emit('log', f"⚠️ Caché de metadatos no disponible: {str(e)}")
+
+        self._owns_transcode_pool = transcode_pool is None
+        self._transcode_pool = transcode_pool or TranscodePool(settings.format_ext, settings.quality,
+                                                               metrics=self.metrics)
+        self._ydl_workers = YDLWorkerPool(ydl_opts, self.extractors)
+        self._retry_policy = RetryPolicy(settings.retries)
+        self._deferred = DeferredQueue()
+        targets = ", ".join(f"{fmt.upper()} {quality}k" for fmt, quality in settings.outputs)
+        self.emit('log', f"🔄 Conversión a {targets} en {self._transcode_pool.max_workers} procesos")
+        if settings.replaygain:
+            method = "NumPy" if loudness.np is not None else "FFmpeg ebur128"
+            self.emit('log', f"🔊 Etiquetas ReplayGain activadas (análisis con {method})")
+
+    def close(self):
+        """Release the resources acquired by open()"""
+        if self._deferred:
+            self._deferred.close()
+            self._deferred = None
+        if self._ydl_workers:
+            self._ydl_workers.close()
+            self._ydl_workers = None
+        if self._transcode_pool and self._owns_transcode_pool:
+            self._transcode_pool.shutdown()
+        self._transcode_pool = None
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+        if self._metadata is not None:
+            self._metadata.close()
+            self._metadata = None
+        self._store = None
+
+    def _run_job(self, items, total, already_done=0):
+        """Download (index, url) items on a bounded worker pool; total() may grow as items arrive"""
+        settings = self.settings
+        self.emit('batch_start', f"⚙️ Descargas simultáneas: {settings.concurrency}",
+                  total=total(), pending=total() - already_done)
+
+        self._scheduler = DownloadScheduler(
+            lambda i, url: self.download_url(url, i, total()),
+            max_workers=settings.concurrency,
+            on_item_done=self.on_item_done,
+            profiler=self.profiler,
+        )
+        self.open(spawn=self._scheduler.spawn)
+        gauges = self._register_gauges(self._scheduler)
+        try:
+            stats = self._scheduler.run_items(self._announced(items), total(), already_done=already_done)
+            self._scheduler = None
+        finally:
+            for name in gauges:
+                self.metrics.set_gauge(name, None)
+            self.close()
+        return stats
+
+    def _announced(self, items):
+        """Emit 'item_queued' for each (index, url) as the scheduler takes it"""
+        for index, url in items:
+            self.emit('item_queued', None, index=index, url=url)
+            yield index, url
+
+    def _register_gauges(self, scheduler):
+        """Expose queue depths and worker utilization of this batch; returns the gauge names"""
+        transcode_pool, deferred = self._transcode_pool, self._deferred
+        gauges = {
+            'download_queue_depth': lambda: scheduler.queued,
+            'workers_busy': lambda: scheduler.busy,
+            'workers_total': lambda: scheduler.max_workers,
+            'transcode_queue_depth': lambda: transcode_pool.pending,
+            'transcode_workers_total': lambda: transcode_pool.max_workers,
+            'retry_queue_depth': lambda: len(deferred),
+        }
+        for name, source in gauges.items():
+            self.metrics.set_gauge(name, source)
+        return list(gauges)
+
+    def _batch_done(self, stats):
+        self.emit('batch_done', f"🎉 Completado! Exitosas: {stats.success}, Errores: {stats.errors}",
+                  total=stats.total, success=stats.success, errors=stats.errors)
+
+    def _set_state(self, index, state, error=None):
+        if self.journal:
+            self.journal.set_state(index, state, error)
+
+    def download_url(self, url, index, total_count):
+        """Download a single URL and queue its conversion (runs on a worker thread).
+
+        Must be called between open() and close(); returns the follow-up futures
+        (retries, conversions and playlist entries).
+        """
+        self.emit('item_start', f"🎵 [{index}/{total_count}] Procesando: {url[:50]}...",
+                  index=index, total=total_count, url=url)
+        return [self._retrying(lambda: self._download_url_once(url, index, total_count), index)]
+
+    def _download_url_once(self, url, index, total_count):
+        session = self._ydl_workers.session()
+        ydl = session.ydl
+        self._worker_state.index = index
+        self._worker_state.entry = None
+        self._worker_state.last_error = None
+        self._set_state(index, job_journal.DOWNLOADING)
+
+        # Resolve the URL once; the same info dict is reused for the download
+        key = None
+        if self._metadata is not None:
+            key = cache_key(url, noplaylist=not self.settings.download_playlist)
+        cached = self._cached(key)
+        if cached and self._already_archived(cached):
+            self.metrics.count_item('skipped')
+            self.emit('item_skipped', f"⏭️ [{index}/{total_count}] Ya descargado, omitido (caché)",
+                      index=index)
+            return []
+
+        if cached and cached.info:
+            info_dict = cached.info
+        else:
+            cached = None
+            self.pacer.wait(url)
+            with self.metrics.time(EXTRACT):
+                info_dict = ydl.extract_info(url, download=False, process=False)
+        if not info_dict:
+            if session.failed:
+                raise self._ydl_failure("No se pudo obtener la información del video")
+            self.metrics.count_item('skipped')
+            self.emit('item_skipped', f"⏭️ [{index}/{total_count}] Ya descargado, omitido", index=index)
+            return []
+
+        if 'entries' in info_dict:
+            return self._expand_playlist(session, info_dict, index, cache_key=None if cached else key,
+                                         from_cache=bool(cached))
+
+        if key and not cached:
+            self._remember(key, info_dict)
+        video_title = info_dict.get('title', 'Unknown Video')
+        self.emit('item_info', f"🎵 Video: '{video_title}'" + (" (caché)" if cached else ""), index=index,
+                  kind='video', title=video_title, cached=bool(cached))
+
+        return self._deduplicated(
+            _archive_id_of(info_dict), lambda: self._base_path(ydl, info_dict), index,
+            lambda: self._download_video(session, url, info_dict, key, bool(cached)))
+
+    def _download_video(self, session, url, info_dict, key, from_cache):
+        session.ydl.process_ie_result(info_dict, download=True)
+        if from_cache and session.failed:
+            # Signed format URLs can be revoked before they expire; extract again once
+            self._metadata.discard(key)
+            session = self._ydl_workers.session()
+            self.pacer.wait(url)
+            with self.metrics.time(EXTRACT):
+                info_dict = session.ydl.extract_info(url, download=False, process=False)
+            if not info_dict:
+                if session.failed:
+                    raise self._ydl_failure("No se pudo obtener la información del video")
+                return []
+            self._remember(key, info_dict)
+            session.ydl.process_ie_result(info_dict, download=True)
+        return self._queue_conversions(session)
+
+    def _expand_playlist(self, session, info_dict, index, cache_key=None, from_cache=False):
+        """Stream playlist entries onto the worker pool as their pages arrive.
+
+        Entries are never materialized up front, so the first download starts while
+        later pages are still being fetched. Returns one future per entry. With a
+        cache_key, the complete listing is stored in the metadata cache.
+        """
+        settings = self.settings
+        ydl = session.ydl
+        playlist_title = info_dict.get('title') or 'Unknown Playlist'
+        entries = PlaylistEntries(ydl, info_dict)
+        known_total = info_dict.get('playlist_count') or entries.get_full_count()
+        if not settings.download_playlist:
+            known_total = min(known_total or 1, 1)
+
+        mode = "Descargando todos" if settings.download_playlist else "Solo el primero"
+        count_text = f"{known_total} elementos" if known_total else "contando elementos"
+        if from_cache:
+            count_text += ", caché"
+        self.emit('item_info', f"🎼 Playlist: '{playlist_title}' ({count_text}) - {mode}", index=index,
+                  kind='playlist', title=playlist_title, entries=known_total, cached=from_cache)
+
+        # Fields yt-dlp adds to every entry (used by the playlist file name template)
+        extra = ydl._playlist_infodict(info_dict, n_entries=known_total)
+
+        children = []
+        listing = {}
+        for playlist_index, entry in entries.get_requested_items():
+            listing[playlist_index] = entry
+            if not entry:
+                continue
+            entry_extra = dict(extra, playlist_index=playlist_index, playlist_autonumber=len(children) + 1)
+            self.emit('entry_queued', None, index=index, entry=playlist_index, title=entry.get('title'),
+                      url=entry.get('url') or entry.get('webpage_url'))
+            children.append(self._spawn(
+                lambda entry=entry, entry_extra=entry_extra, playlist_index=playlist_index: [self._retrying(
+                    lambda: self._download_entry(entry, entry_extra, index), index,
+                    on_settled=lambda error: self.emit('entry_done', None, index=index, entry=playlist_index,
+                                                       error=error))]
+            ))
+            if not settings.download_playlist:
+                break
+
+            queued = len(children)
+            self.emit('playlist_progress', None, index=index, queued=queued, total=known_total)
+            if queued % PLAYLIST_LOG_EVERY == 0:
+                self.emit('log', f"🎼 '{playlist_title}': {queued} elementos en cola...")
+
+        self.emit('playlist_progress', f"🎼 Playlist: '{playlist_title}' ({len(children)} elementos en cola)",
+                  index=index, queued=len(children), total=len(children))
+        if session.failed:
+            if not children:
+                raise self._ydl_failure("No se pudieron obtener los elementos de la playlist")
+            # Some pages failed; keep the queued entries but report the URL as failed
+            failed = Future()
+            failed.set_exception(RuntimeError("No se pudieron obtener todos los elementos de la playlist"))
+            children.append(failed)
+        elif cache_key and settings.download_playlist:
+            # Only complete listings are cached, in playlist order
+            self._remember(cache_key, info_dict,
+                           entries=[listing.get(i) for i in range(1, max(listing, default=0) + 1)])
+        if settings.replaygain and settings.download_playlist and children:
+            # Album gain needs every entry's measurement, so it is the playlist's last follow-up
+            album = Future()
+            when_all_done(list(children), lambda _: self._tag_album(index, playlist_title, album))
+            children.append(album)
+        return children
+
+    def _download_entry(self, entry, extra, index):
+        """Download one playlist entry (runs on a worker thread)"""
+        session = self._ydl_workers.session()
+        self._worker_state.index = index
+        self._worker_state.entry = extra.get('playlist_index')
+        self._worker_state.last_error = None
+        archive_id = _archive_id_of(entry)
+
+        def name():
+            # Linked copies are named after their download, as the flat entry may have no title
+            return self._base_path(session.ydl, dict(self._entry_info(entry, archive_id), **extra))
+
+        def produce():
+            followups = self._fetch_entry(session, entry, extra)
+            if not followups:
+                # Nothing downloaded: the entry is already in the archive
+                self._add_archived_album_track(index, extra.get('playlist_index'), name())
+            return followups
+
+        return self._deduplicated(archive_id, name, index, produce)
+
+    def _entry_info(self, entry, archive_id):
+        """A playlist entry's info for naming its files, without any request.
+
+        Flat entries may have no title; it then comes from the title the item
+        was stored under, or from the metadata cache.
+        """
+        if entry.get('title') or entry.get('_type') != 'url':
+            return entry
+        title = self._store.title_of(archive_id) if self._store is not None and archive_id else None
+        if title:
+            return dict(entry, title=title)
+        if self._metadata is not None:
+            cached = self._cached(cache_key(entry['url'], ie_key=entry.get('ie_key')))
+            if cached and cached.info:
+                return cached.info
+        return entry
+
+    def _fetch_entry(self, session, entry, extra):
+        if entry.get('_type') == 'url' and self._metadata is not None:
+            key = cache_key(entry['url'], ie_key=entry.get('ie_key'))
+            info, from_cache = self._resolve_entry(session, entry, key)
+            if info:
+                session.ydl.process_ie_result(info, download=True, extra_info=dict(extra))
+            if from_cache and session.failed:
+                # Stale signed URLs: extract again once
+                self._metadata.discard(key)
+                session = self._ydl_workers.session()
+                info, _ = self._resolve_entry(session, entry, key)
+                if info:
+                    session.ydl.process_ie_result(info, download=True, extra_info=dict(extra))
+            if not info:
+                return []
+        else:
+            self.pacer.wait(entry.get('url') or entry.get('webpage_url') or '')
+            session.ydl.process_ie_result(dict(entry), download=True, extra_info=extra)
+        return self._queue_conversions(session)
+
+    def _base_path(self, ydl, info):
+        """Output path without extension that yt-dlp's template gives this item"""
+        return os.path.splitext(ydl.prepare_filename(dict(info, ext='tmp')))[0]
+
+    def _output_targets(self, base):
+        """(format, quality, path) of every output written for base"""
+        outputs = self.settings.outputs
+        if len(outputs) == 1:
+            return [(fmt, quality, f"{base}.{fmt}") for fmt, quality in outputs]
+        folder, name = os.path.split(base)
+        return [(fmt, quality, os.path.join(folder, output_folder(fmt, quality, outputs), f"{name}.{fmt}"))
+                for fmt, quality in outputs]
+
+    def _stored(self, archive_id):
+        """Whether every output of an item is in the content store"""
+        return self._store is not None and all(self._store.has(archive_id, fmt, quality)
+                                               for fmt, quality in self.settings.outputs)
+
+    def _link_from_store(self, archive_id, base, index, entry):
+        """Link every output of a stored item under base and count it for the album"""
+        paths = []
+        for fmt, quality, path in self._output_targets(base):
+            self._store.link(archive_id, fmt, quality, path)
+            paths.append(path)
+        self.emit('log', f"🔗 Enlazado desde el almacén: {os.path.basename(base)}", index=index)
+        self._add_album_track(index, entry, paths)
+
+    def _deduplicated(self, archive_id, name, index, produce):
+        """Run produce() unless the item is stored or already being produced for another playlist.
+
+        Stored items are only linked under this playlist's file name, which
+        name() gives once the item is stored. If another worker is fetching the
+        same video, this one links its result when it is ready instead of
+        downloading it again.
+        """
+        if not archive_id or self._store is None:
+            return produce()
+        entry = getattr(self._worker_state, 'entry', None)
+        if self._stored(archive_id):
+            self._link_from_store(archive_id, name(), index, entry)
+            return []
+
+        with self._producing_lock:
+            shared = self._producing.get(archive_id)
+            owner = shared is None
+            if owner:
+                shared = self._producing[archive_id] = Future()
+
+        if not owner:
+            linked = Future()
+
+            def link_when_ready(future):
+                error = future.exception()
+                if error is not None:
+                    linked.set_exception(error)
+                    return
+                try:
+                    # Nothing stored means the other copy was skipped as already archived
+                    if self._stored(archive_id):
+                        self._link_from_store(archive_id, name(), index, entry)
+                    else:
+                        self._add_archived_album_track(index, entry, name())
+                    linked.set_result(None)
+                except OSError as e:
+                    linked.set_exception(e)
+
+            shared.add_done_callback(link_when_ready)
+            return [linked]
+
+        def release(error):
+            with self._producing_lock:
+                self._producing.pop(archive_id, None)
+            if error is None:
+                shared.set_result(None)
+            else:
+                shared.set_exception(error if isinstance(error, Exception) else RuntimeError(error))
+
+        try:
+            followups = produce()
+        except Exception as e:
+            release(e)
+            raise
+        if followups:
+            when_all_done(followups, release)
+        else:
+            release(None)
+        return followups
+
+    def _resolve_entry(self, session, entry, key):
+        """Extraction result for a playlist entry that only references its URL.
+
+        Returns (info, from_cache); info is served from the metadata cache while
+        fresh and is None if the video is already archived.
+        """
+        cached = self._cached(key)
+        if cached and self._already_archived(cached):
+            return None, True
+        if cached and cached.info:
+            return cached.info, True
+
+        self.pacer.wait(entry['url'])
+        with self.metrics.time(EXTRACT):
+            info = session.ydl.extract_info(entry['url'], download=False, process=False,
+                                            ie_key=entry.get('ie_key'))
+        if not info:
+            if session.failed:
+                raise self._ydl_failure("No se pudo obtener la información del video")
+            return None, False
+        if 'entries' not in info:
+            self._remember(key, info)
+        return info, False
+
+    def _cached(self, key):
+        if not key:
+            return None
+        try:
+            return self._metadata.get(key)
+        except (sqlite3.Error, ValueError):
+            return None
+
+    def _remember(self, key, info, entries=None):
+        try:
+            self._metadata.put(key, info, entries=entries)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            self.emit('log', f"⚠️ No se pudo guardar en la caché de metadatos: {str(e)}")
+
+    def _already_archived(self, cached):
+        """Skip-existing check answered from the cache, before any request"""
+        return (self.settings.skip_existing and cached.archive_id is not None
+                and cached.archive_id in self._archive)
+
+    def _ydl_failure(self, message):
+        """Error for a failed yt-dlp call, carrying yt-dlp's reason so it can be classified"""
+        reason = getattr(self._worker_state, 'last_error', None)
+        if reason:
+            message = f"{message}: {reason.replace('ERROR: ', '', 1)}"
+        return RuntimeError(message)
+
+    def _retrying(self, fn, index, on_settled=None):
+        """Run fn() on this worker and retry transient failures later from the deferred queue.
+
+        fn returns follow-up futures; only its own failure is retried, because
+        conversions and playlist entries retry on their own. Returns one future
+        for fn and its follow-ups. on_settled(error) runs once fn and its
+        follow-ups have finished (error None) or one of them has failed.
+        """
+        def start(attempt):
+            # The first attempt runs inline; retries go back onto the worker pool
+            return _call_now(fn) if attempt == 1 else self._on_worker(fn)
+
+        outcome = retry_future(start, self._retry_policy, self._deferred,
+                               on_retry=lambda *retry: self._on_retry(index, *retry))
+        done = Future()
+        if on_settled:
+            done.add_done_callback(lambda future: on_settled(_outcome_error(future)))
+
+        def chain(future):
+            if future.cancelled():
+                done.cancel()
+            else:
+                resolve_with_followups(done, future.result)
+
+        outcome.add_done_callback(chain)
+        return done
+
+    def _on_worker(self, fn):
+        """Future for fn() run on the caller's worker pool (follow-ups are returned, not awaited)"""
+        if self._spawn is None:
+            return _call_now(fn)
+        result = Future()
+
+        def run():
+            try:
+                result.set_result(fn())
+            except Exception as e:
+                result.set_exception(e)
+
+        spawned = self._spawn(run)
+        spawned.add_done_callback(lambda f: f.cancelled() and result.cancel())
+        return result
+
+    def _on_retry(self, index, error, category, attempt, delay):
+        self._set_state(index, job_journal.PENDING)
+        limit = self._retry_policy.retries_for(category)
+        text = str(error) or error.__class__.__name__
+        self.emit('item_retry', f"🔁 [{index}] Reintento {attempt}/{limit} en {delay:.0f}s "
+                                f"({CATEGORY_LABELS[category]}): {text}",
+                  index=index, category=category, attempt=attempt, delay=round(delay, 1), error=text)
+
+    def _queue_conversions(self, session):
+        """Hand raw files to the transcode stage so this worker can fetch the next URL"""
+        settings = self.settings
+        archive = self._archive
+        outputs = settings.outputs
+
+        def record_when_converted(future, archive_id, title):
+            if future.cancelled() or future.exception() is not None:
+                return
+            with self.metrics.time(WRITE):
+                if self._store is not None:
+                    paths = future.result()
+                    paths = [paths] if isinstance(paths, str) else paths
+                    try:
+                        # Before the files, so a stored item always has the title to name its links
+                        if title:
+                            self._store.remember_title(archive_id, title)
+                        for (fmt, quality), path in zip(outputs, paths):
+                            self._store.adopt(archive_id, fmt, quality, path)
+                    except OSError as e:
+                        self.emit('log', f"⚠️ No se pudo guardar en el almacén: {str(e)}")
+                archive.add(archive_id)
+
+        conversions = []
+        index = self._worker_state.index
+        for path, archive_id, acodec, abr, title in session.downloaded:
+            if len(outputs) > 1:
+                # Fan-out: one FFmpeg run decodes the source once for every output
+                plan = [(fmt, quality, can_copy(acodec, abr, fmt, quality)) for fmt, quality in outputs]
+
+                def start(attempt, path=path, plan=plan):
+                    return self._transcode_pool.submit_outputs(path, plan)
+            else:
+                copy = can_copy(acodec, abr, settings.format_ext, settings.quality)
+                if copy:
+                    self.emit('log', f"⚡ Sin recodificar ({acodec}): {os.path.basename(path)}", index=index)
+
+                def start(attempt, path=path, copy=copy):
+                    return self._transcode_pool.submit(path, settings.format_ext, settings.quality, copy)
+            future = retry_future(start, self._retry_policy, self._deferred,
+                                  on_retry=lambda *retry: self._on_retry(index, *retry))
+            if settings.replaygain:
+                # Tagged before the content store takes the file, so every link shares the track tags
+                future = self._measured(future, index, getattr(self._worker_state, 'entry', None))
+            if archive_id:
+                future.add_done_callback(lambda f, archive_id=archive_id, title=title:
+                                         record_when_converted(f, archive_id, title))
+            conversions.append(future)
+        if conversions:
+            self._set_state(self._worker_state.index, job_journal.TRANSCODING)
+        if session.failed:
+            raise self._ydl_failure("yt-dlp reportó errores durante la descarga")
+        return conversions
+
+    def _measured(self, conversion, index, entry):
+        """Future for conversion's result once the output's loudness is measured and tagged.
+
+        A failed measurement is only logged; the converted files are kept.
+        """
+        measured = Future()
+
+        def analyze(future):
+            if future.cancelled():
+                measured.cancel()
+                return
+            if future.exception() is not None:
+                measured.set_exception(future.exception())
+                return
+            paths = future.result()
+            paths = [paths] if isinstance(paths, str) else paths
+            try:
+                job = self._transcode_pool.submit_task(measure_and_tag, paths)
+            except RuntimeError:
+                # The pool is shutting down (batch cancelled)
+                measured.set_result(future.result())
+                return
+            job.add_done_callback(lambda job: record(job, paths, future.result()))
+
+        def record(job, paths, result):
+            error = job.exception() if not job.cancelled() else None
+            if job.cancelled() or error is not None:
+                self.emit('log', f"⚠️ Sin ReplayGain para {os.path.basename(paths[0])}: {error or 'cancelado'}",
+                          index=index)
+            else:
+                measurement = job.result()
+                if measurement['loudness'] is not None:
+                    self.emit('log', f"🔊 {os.path.basename(paths[0])}: {measurement['loudness']:.1f} LUFS, "
+                                     f"ganancia {format_gain(measurement)}", index=index)
+                self._add_album_track(index, entry, paths, measurement)
+            measured.set_result(result)
+
+        conversion.add_done_callback(analyze)
+        return measured
+
+    def _add_archived_album_track(self, index, entry, base):
+        """Remember an entry skipped as archived by its existing outputs, or as unknown (paths None)"""
+        paths = [path for _, _, path in self._output_targets(base)]
+        self._add_album_track(index, entry, paths if all(os.path.isfile(path) for path in paths) else None)
+
+    def _add_album_track(self, index, entry, paths, measurement=None):
+        """Remember a playlist entry's outputs for its album gain; measurement None means not analyzed yet"""
+        if entry is None or not (self.settings.replaygain and self.settings.download_playlist):
+            return
+        with self._album_lock:
+            self._album_tracks.setdefault(index, {})[entry] = (paths, measurement)
+
+    def _tag_album(self, index, title, done):
+        """Write album gain on every entry of a finished playlist, then complete done"""
+        with self._album_lock:
+            tracks = self._album_tracks.pop(index, {})
+        pool = self._transcode_pool
+        if not tracks or pool is None:
+            done.set_result(None)
+            return
+        missing = sum(1 for paths, _ in tracks.values() if paths is None)
+        if missing:
+            # Album values from a subset would disagree with those already on the earlier entries
+            self.emit('log', f"⚠️ ReplayGain de álbum omitido en '{title}': no se encontraron los archivos de "
+                             f"{missing} elementos descargados antes", index=index)
+            done.set_result(None)
+            return
+
+        def failed(error):
+            self.emit('log', f"⚠️ ReplayGain de álbum incompleto en '{title}': {error}", index=index)
+            done.set_result(None)
+
+        def finish(album, count, error):
+            if error is not None:
+                failed(error)
+                return
+            self.emit('log', f"🔊 Álbum '{title}': {album['loudness']:.1f} LUFS, ganancia {format_gain(album)} "
+                             f"({count} pistas)", index=index)
+            done.set_result(None)
+
+        def write(_):
+            measurements = {entry: job.result() for entry, job in jobs.items()
+                            if not job.cancelled() and job.exception() is None}
+            album = album_measurement(list(measurements.values()))
+            if album['loudness'] is None:
+                done.set_result(None)
+                return
+            try:
+                writes = [pool.submit_task(write_tags, tracks[entry][0], replaygain_tags(measurement, album))
+                          for entry, measurement in measurements.items()]
+            except RuntimeError as e:
+                # The pool is shutting down (batch cancelled)
+                failed(e)
+                return
+            when_all_done(writes, lambda error: finish(album, len(measurements), error))
+
+        # Entries linked from the store or downloaded in an earlier run already have their track
+        # tags; they are only measured, then get the album tags like the rest
+        jobs = {}
+        try:
+            for entry in sorted(tracks):
+                paths, measurement = tracks[entry]
+                jobs[entry] = _resolved(measurement) if measurement else pool.submit_task(analyze_file, paths[0])
+        except RuntimeError as e:
+            failed(e)
+            return
+        when_all_done(list(jobs.values()), write)
+
+    def on_item_done(self, index, url, error, stats):
+        """Per-URL result from the scheduler"""
+        self._set_state(index, job_journal.DONE if error is None else job_journal.FAILED, error)
+        if self._job_leases is not None:
+            self._job_store.record(self._job_leases.pop(index), index, error)
+        category = None
+        self.metrics.count_item('success' if error is None else 'error')
+        if error is None:
+            message = f"✅ [{index}/{stats.total}] Descarga exitosa"
+        else:
+            category = classify_error(error)
+            message = f"❌ [{index}/{stats.total}] Error ({CATEGORY_LABELS[category]}): {error}"
+        self.emit('item_done', message, index=index, url=url, error=error, category=category,
+                  completed=stats.completed,
+                  total=stats.total, success=stats.success, errors=stats.errors)
+
+    def progress_hook(self, d):
+        """Progress hook for yt-dlp"""
+        filename = os.path.basename(d.get('filename') or 'Unknown')
+        if d['status'] == 'downloading':
+            # Sleeping here throttles yt-dlp's read loop to the shared bandwidth budget
+            self.limiter.track(d)
+            self.metrics.track_progress(d)
+            downloaded = d.get('downloaded_bytes') or 0
+            total = d.get('total_bytes') or d.get('total_bytes_estimate')
+            percent = d.get('_percent_str', '0%').strip()
+            speed = d.get('_speed_str', 'N/A').strip()
+            index = getattr(self._worker_state, 'index', None)
+            if self.journal and index is not None:
+                self.journal.set_progress(index, downloaded, total)
+            self.emit('progress', f"⬇️ {filename}: {percent} a {speed}", index=index,
+                      entry=getattr(self._worker_state, 'entry', None), filename=filename,
+                      downloaded_bytes=downloaded, total_bytes=total, speed=d.get('speed'), eta=d.get('eta'))
+        elif d['status'] == 'finished':
+            if d.get('elapsed') is not None:
+                # Absent when yt-dlp found the file already downloaded
+                self.metrics.observe(DOWNLOAD, d['elapsed'])
+            self.emit('file_done', f"✅ Completado: {filename}", filename=filename,
+                      index=getattr(self._worker_state, 'index', None),
+                      entry=getattr(self._worker_state, 'entry', None))
+
+
+def _call_now(fn):
+    """Run fn() on this thread and return a finished Future"""
+    future = Future()
+    try:
+        future.set_result(fn())
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def _resolved(value):
+    """A Future that already holds value"""
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def _outcome_error(future):
+    """Error text of a settled future, or None if it succeeded"""
+    if future.cancelled():
+        return "cancelado"
+    error = future.exception()
+    return (str(error) or error.__class__.__name__) if error is not None else None
+
+
+def _archive_id_of(info):
+    """Archive ID of an info dict or flat playlist entry, when it is known"""
+    extractor = info.get('extractor_key') or info.get('ie_key')
+    if extractor and info.get('id'):
+        return make_archive_id(extractor, info['id'])
+    return None
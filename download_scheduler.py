@@ -0,0 +1,217 @@
+"""
+Planificador de descargas concurrentes
+Ejecuta una tarea por URL en un pool acotado de hilos y lleva las estadísticas
+"""
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+DEFAULT_WORKERS = 3
+MAX_WORKERS = 8
+
+
+class BatchStats:
+    """Thread-safe per-URL success/error accounting"""
+
+    def __init__(self, total=0):
+        self.total = total
+        self.success = 0
+        self.errors = 0
+        self.results = []  # (index, url, error or None)
+        self._lock = threading.Lock()
+
+    @property
+    def completed(self):
+        return self.success + self.errors
+
+    def record(self, index, url, error=None):
+        """Record the outcome of one URL"""
+        with self._lock:
+            self.results.append((index, url, error))
+            if error is None:
+                self.success += 1
+            else:
+                self.errors += 1
+
+    def failed(self):
+        """Return (index, url, error) for every failed URL"""
+        with self._lock:
+            return [result for result in self.results if result[2] is not None]
+
+
+def _error_text(exc):
+    return str(exc) or exc.__class__.__name__
+
+
+def when_all_done(futures, callback):
+    """Call callback(error) once every future has finished; error is the first failure or None"""
+    remaining = [len(futures)]
+    errors = []
+    lock = threading.Lock()
+
+    def on_done(future):
+        if future.cancelled():
+            error = "cancelado"
+        else:
+            exc = future.exception()
+            error = _error_text(exc) if exc else None
+        with lock:
+            if error is not None:
+                errors.append(error)
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            callback(errors[0] if errors else None)
+
+    for future in futures:
+        future.add_done_callback(on_done)
+
+
+def resolve_with_followups(future, fn):
+    """Run fn() and complete future once it and any futures it returns have finished"""
+    try:
+        followups = fn() or []
+    except Exception as e:
+        future.set_exception(e)
+        return
+    if not followups:
+        future.set_result(None)
+        return
+
+    def on_followups_done(error):
+        if error is None:
+            future.set_result(None)
+        else:
+            future.set_exception(RuntimeError(error))
+
+    when_all_done(followups, on_followups_done)
+
+
+class DownloadScheduler:
+    """Run task(index, url) for every URL on a bounded worker pool.
+
+    A task may return a list of Futures for follow-up stages (e.g. transcoding);
+    the worker is freed immediately and the URL is recorded once they finish.
+    Tasks can also spawn() sub-tasks, such as playlist entries, onto the same pool.
+    """
+
+    def __init__(self, task, max_workers=DEFAULT_WORKERS, on_item_done=None, profiler=None):
+        self.task = task
+        self.max_workers = max(1, min(int(max_workers), MAX_WORKERS))
+        self.on_item_done = on_item_done
+        # Optional BatchProfiler that records what the worker threads run
+        self.profiler = profiler
+        self._finished = 0
+        self._finished_cond = threading.Condition()
+        self._cancelled = threading.Event()
+        self._executor = None
+        # BatchStats of the running batch; its total may grow while items are still being read
+        self.stats = None
+        # Tasks waiting for a worker and tasks running, for utilization metrics
+        self.queued = 0
+        self.busy = 0
+        self._load_lock = threading.Lock()
+
+    def spawn(self, fn):
+        """Run fn() on the worker pool from inside a task.
+
+        Returns a Future that completes when fn and its follow-ups have finished;
+        the calling task should return it as one of its follow-ups.
+        """
+        future = Future()
+        if self._cancelled.is_set():
+            future.cancel()
+            return future
+        self._submit(resolve_with_followups, future, fn)
+        return future
+
+    def cancel(self):
+        """Stop starting new URLs; running ones finish, the rest are left unrecorded"""
+        self._cancelled.set()
+
+    def run(self, urls, total=None):
+        """Process all URLs and block until every task has finished"""
+        if total is None:
+            total = len(urls)
+        return self.run_items(enumerate(urls, 1), total)
+
+    def run_items(self, items, total, already_done=0):
+        """Process (index, url) pairs, e.g. the unfinished part of a resumed job"""
+        stats = BatchStats(total)
+        stats.success = already_done
+        self.stats = stats
+
+        # Bound the number of queued tasks so large inputs are not all held at once
+        slots = threading.BoundedSemaphore(self.max_workers * 2)
+
+        submitted = 0
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                            thread_name_prefix="download")
+        try:
+            for index, url in items:
+                if self._cancelled.is_set():
+                    break
+                slots.acquire()
+                future = self._submit(self._run_one, stats, index, url)
+                future.add_done_callback(lambda _: slots.release())
+                submitted += 1
+
+            # Wait for spawned sub-tasks and follow-up stages still running
+            with self._finished_cond:
+                while self._finished < submitted:
+                    self._finished_cond.wait()
+                self._finished = 0
+        finally:
+            self._executor.shutdown()
+            self._executor = None
+
+        return stats
+
+    def _submit(self, fn, *args):
+        with self._load_lock:
+            self.queued += 1
+        return self._executor.submit(self._tracked, fn, *args)
+
+    def _tracked(self, fn, *args):
+        with self._load_lock:
+            self.queued -= 1
+            self.busy += 1
+        try:
+            if self.profiler:
+                return self.profiler.profiled(fn, *args)
+            return fn(*args)
+        finally:
+            with self._load_lock:
+                self.busy -= 1
+
+    def _run_one(self, stats, index, url):
+        if self._cancelled.is_set():
+            self._mark_finished()
+            return
+        try:
+            followups = self.task(index, url) or []
+        except Exception as e:
+            self._finish(stats, index, url, _error_text(e))
+            return
+
+        if not followups:
+            self._finish(stats, index, url, None)
+            return
+
+        # Record the URL when its last follow-up future completes
+        when_all_done(followups, lambda error: self._finish(stats, index, url, error))
+
+    def _finish(self, stats, index, url, error):
+        stats.record(index, url, error)
+
+        if self.on_item_done:
+            try:
+                self.on_item_done(index, url, error, stats)
+            except Exception:
+                pass
+        self._mark_finished()
+
+    def _mark_finished(self):
+        with self._finished_cond:
+            self._finished += 1
+            self._finished_cond.notify_all()
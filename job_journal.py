@@ -0,0 +1,198 @@
+"""
+Diario de trabajos reanudable
+Registra el estado de cada URL de un lote para poder continuar tras un cierre
+inesperado. El diario es un log JSONL de solo anexado que se compacta de forma
+atómica al iniciar o reanudar un trabajo.
+"""
+
+import json
+import os
+import threading
+import time
+
+JOURNAL_FILENAME = '.job_journal.jsonl'
+
+PENDING = 'pending'
+DOWNLOADING = 'downloading'
+TRANSCODING = 'transcoding'
+DONE = 'done'
+FAILED = 'failed'
+
+# Byte offsets are journaled at most this often per item
+PROGRESS_INTERVAL = 2.0
+
+
+class JournalItem:
+    """State of one URL in the job"""
+
+    __slots__ = ('index', 'url', 'state', 'downloaded_bytes', 'total_bytes', 'error')
+
+    def __init__(self, index, url, state=PENDING, downloaded_bytes=0, total_bytes=None, error=None):
+        self.index = index
+        self.url = url
+        self.state = state
+        self.downloaded_bytes = downloaded_bytes
+        self.total_bytes = total_bytes
+        self.error = error
+
+    def to_dict(self):
+        return {'i': self.index, 'url': self.url, 's': self.state,
+                'b': self.downloaded_bytes, 't': self.total_bytes, 'e': self.error}
+
+
+class JobJournal:
+    """Crash-safe journal of a batch job kept in the download folder"""
+
+    def __init__(self, path):
+        self.path = path
+        self.source = None
+        self.settings = {}
+        self.items = {}
+        # False while the input is still being read, so a resume reads the rest of it
+        self.complete = True
+        self._file = None
+        self._last_progress = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_folder(cls, folder):
+        return cls(os.path.join(folder, JOURNAL_FILENAME))
+
+    def load(self):
+        """Replay the journal from disk; returns False if there is none"""
+        try:
+            file = open(self.path, 'r', encoding='utf-8')
+        except OSError:
+            return False
+
+        with file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash mid-write; everything before it is valid
+                    break
+                self._replay(record)
+        return self.source is not None
+
+    def _replay(self, record):
+        if 'job' in record:
+            self.source = record['job'].get('source')
+            self.settings = record['job'].get('settings', {})
+            self.complete = record['job'].get('complete', True)
+        elif record.get('complete'):
+            self.complete = True
+        elif 'url' in record:
+            self.items[record['i']] = JournalItem(
+                record['i'], record['url'], record['s'],
+                record.get('b', 0), record.get('t'), record.get('e'))
+        elif record.get('i') in self.items:
+            item = self.items[record['i']]
+            item.state = record.get('s', item.state)
+            item.downloaded_bytes = record.get('b', item.downloaded_bytes)
+            item.total_bytes = record.get('t', item.total_bytes)
+            item.error = record.get('e', item.error)
+
+    def start(self, source, urls, settings, complete=True):
+        """Begin a new job, replacing any previous journal.
+
+        With complete=False the URLs are added with add() as the input is read,
+        and mark_complete() is called once it has been read to the end.
+        """
+        self.source = source
+        self.settings = dict(settings)
+        self.complete = complete
+        self.items = {index: JournalItem(index, url) for index, url in enumerate(urls, 1)}
+        self._compact()
+
+    def add(self, url):
+        """Append a pending URL read from the input; returns its index"""
+        with self._lock:
+            index = len(self.items) + 1
+            self.items[index] = JournalItem(index, url)
+            # Not synced: a URL lost in a crash is read again from the input on resume
+            self._append(self.items[index].to_dict())
+            return index
+
+    def mark_complete(self):
+        """Record that every URL of the input is in the journal"""
+        with self._lock:
+            self.complete = True
+            self._append({'complete': True}, sync=True)
+
+    def resume(self):
+        """Continue the loaded job; compacts the log and returns the unfinished items"""
+        self._compact()
+        return self.unfinished()
+
+    def unfinished(self):
+        """(index, url) of every item that is not done, in job order"""
+        return [(item.index, item.url) for index, item in sorted(self.items.items())
+                if item.state != DONE]
+
+    def count(self, state):
+        return sum(1 for item in self.items.values() if item.state == state)
+
+    def set_state(self, index, state, error=None):
+        with self._lock:
+            item = self.items.get(index)
+            if item is None:
+                return
+            item.state = state
+            item.error = error
+            self._append({'i': index, 's': state, 'e': error}, sync=True)
+
+    def set_progress(self, index, downloaded_bytes, total_bytes=None):
+        """Journal the partial byte offset of an item (throttled)"""
+        now = time.monotonic()
+        with self._lock:
+            item = self.items.get(index)
+            if item is None:
+                return
+            item.downloaded_bytes = downloaded_bytes
+            item.total_bytes = total_bytes
+            if now - self._last_progress.get(index, 0) < PROGRESS_INTERVAL:
+                return
+            self._last_progress[index] = now
+            self._append({'i': index, 'b': downloaded_bytes, 't': total_bytes})
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def discard(self):
+        """Delete the journal once the job has fully completed"""
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _append(self, record, sync=False):
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        # One write per record, so a crash can only tear the final line
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+
+    def _compact(self):
+        """Atomically rewrite the journal as a snapshot of the current state"""
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                header = {'source': self.source, 'settings': self.settings,
+                          'complete': self.complete, 'created': time.time()}
+                file.write(json.dumps({'job': header}, ensure_ascii=False) + '\n')
+                for index in sorted(self.items):
+                    file.write(json.dumps(self.items[index].to_dict(), ensure_ascii=False) + '\n')
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, self.path)
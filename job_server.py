@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Servicio local de cola de trabajos
+Servidor HTTP que recibe URLs o archivos de URLs como trabajos, los ordena por
+prioridad y los ejecuta en un único pool de descarga compartido. Expone el
+estado de cada trabajo y el progreso por elemento, con eventos en vivo (SSE).
+
+    POST   /jobs              {"urls": [...]} o {"file": "urls.txt"}, más opciones
+    GET    /jobs              lista de trabajos
+    GET    /jobs/<id>         estado y progreso por elemento
+    DELETE /jobs/<id>         cancela los elementos pendientes
+    GET    /events[?job=<id>] eventos en vivo (text/event-stream)
+    GET    /metrics           métricas por etapa en formato Prometheus
+"""
+
+import argparse
+import heapq
+import itertools
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from download_engine import DownloadEngine, DownloadSettings, QUALITIES, DEFAULT_REQUEST_INTERVAL
+from download_scheduler import DEFAULT_WORKERS, MAX_WORKERS, when_all_done, resolve_with_followups
+from rate_limiter import BandwidthLimiter, HostPacer, DEFAULT_CONNECTIONS, MAX_CONNECTIONS
+from transcoder import TranscodePool, FORMATS
+from metrics import Metrics
+from url_ingest import UrlIngest, iter_manifest
+
+DEFAULT_PORT = 8760
+
+# Per-item progress is published to SSE clients at most this often
+PROGRESS_PUBLISH_INTERVAL = 0.5
+SSE_KEEPALIVE = 15.0
+
+
+class EventHub:
+    """Fan out job events to every connected SSE client"""
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        subscriber = queue.Queue(maxsize=1000)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                # A stalled client loses events rather than blocking the downloads
+                pass
+
+
+class Job:
+    """One submitted batch and the state of each of its items"""
+
+    def __init__(self, job_id, settings, urls, priority, hub, limiter=None, pacer=None, metrics=None):
+        self.id = job_id
+        self.settings = settings
+        self.priority = priority
+        self.created = time.time()
+        self.status = 'queued'
+        self.items = {
+            index: {'index': index, 'url': url, 'status': 'pending', 'title': None,
+                    'downloaded_bytes': 0, 'total_bytes': None, 'speed': None, 'error': None}
+            for index, url in enumerate(urls, 1)
+        }
+        self.engine = DownloadEngine(settings, on_event=self.handle_event, limiter=limiter, pacer=pacer,
+                                     metrics=metrics)
+        self._hub = hub
+        self._finished = 0
+        self._last_publish = {}
+        self._lock = threading.Lock()
+
+    @property
+    def total(self):
+        return len(self.items)
+
+    def summary(self):
+        with self._lock:
+            counts = {}
+            for item in self.items.values():
+                counts[item['status']] = counts.get(item['status'], 0) + 1
+            return {'id': self.id, 'status': self.status, 'priority': self.priority,
+                    'created': self.created, 'total': self.total, 'counts': counts,
+                    'output': self.settings.download_folder, 'format': self.settings.format_ext,
+                    'quality': self.settings.quality}
+
+    def details(self):
+        summary = self.summary()
+        with self._lock:
+            summary['items'] = [dict(item) for _, item in sorted(self.items.items())]
+        return summary
+
+    def handle_event(self, event):
+        """Update item state from engine events and publish them"""
+        kind = event['event']
+        index = event.get('index')
+        with self._lock:
+            item = self.items.get(index)
+            if item is not None:
+                if kind == 'item_start':
+                    item['status'] = 'running'
+                elif kind == 'item_info':
+                    item['title'] = event.get('title')
+                elif kind == 'progress':
+                    item['downloaded_bytes'] = event['downloaded_bytes']
+                    item['total_bytes'] = event['total_bytes']
+                    item['speed'] = event['speed']
+                    now = time.monotonic()
+                    if now - self._last_publish.get(index, 0) < PROGRESS_PUBLISH_INTERVAL:
+                        return
+                    self._last_publish[index] = now
+                elif kind == 'item_skipped':
+                    item['status'] = 'skipped'
+                elif kind == 'item_retry':
+                    item['status'] = 'retrying'
+                    item['error'] = event['error']
+                    item['retries'] = item.get('retries', 0) + 1
+        self._hub.publish(dict(event, job=self.id))
+
+    def item_finished(self, index, error):
+        """Record the outcome of one item; returns True when the whole job is finished"""
+        with self._lock:
+            item = self.items[index]
+            if item['status'] != 'skipped':
+                item['status'] = 'done' if error is None else 'failed'
+            item['error'] = error
+            self._finished += 1
+            done = self._finished == self.total
+            if done and self.status != 'cancelled':
+                self.status = 'done'
+            message = f"✅ [{index}/{self.total}] Descarga exitosa" if error is None \
+                else f"❌ [{index}/{self.total}] Error: {error}"
+        self._hub.publish({'event': 'item_done', 'job': self.id, 'index': index, 'error': error,
+                           'message': message})
+        if done:
+            self._hub.publish({'event': 'job_done', 'job': self.id, 'summary': self.summary(),
+                               'message': f"🎉 Trabajo {self.id} completado"})
+        return done
+
+
+class JobService:
+    """Priority queue of job items served by one shared, bounded worker pool"""
+
+    def __init__(self, workers=DEFAULT_WORKERS, default_output=None, rate_limit=0,
+                 worker_rate_limit=0, request_interval=DEFAULT_REQUEST_INTERVAL):
+        self.workers = max(1, min(int(workers), MAX_WORKERS))
+        self.default_output = default_output
+        # Shared by every job so the limits hold across the whole service (KB/s)
+        self.limiter = BandwidthLimiter(rate_limit * 1024, worker_rate_limit * 1024)
+        self.pacer = HostPacer(request_interval)
+        self.metrics = Metrics()
+        self.hub = EventHub()
+        self.jobs = {}
+        self._ids = itertools.count(1)
+        self._sequence = itertools.count()
+        self._heap = []
+        self._cond = threading.Condition()
+        self._transcode_pool = None
+        self._threads = []
+        self._busy = 0
+
+    def start(self):
+        self._transcode_pool = TranscodePool('mp3', '192', metrics=self.metrics)
+        pool = self._transcode_pool
+        for name, source in (('download_queue_depth', lambda: len(self._heap)),
+                             ('workers_busy', lambda: self._busy),
+                             ('workers_total', lambda: self.workers),
+                             ('transcode_queue_depth', lambda: pool.pending),
+                             ('transcode_workers_total', lambda: pool.max_workers)):
+            self.metrics.set_gauge(name, source)
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{number + 1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, request):
+        """Create a job from a request body; returns the Job"""
+        # Normalized and de-duplicated across the inline list and the file
+        ingest = UrlIngest(noplaylist=not request.get('download_playlist', True))
+        urls = list(ingest.filter(url for url in request.get('urls') or [] if url and url.strip()))
+        if request.get('file'):
+            urls.extend(ingest.filter(iter_manifest(request['file'])))
+        if not urls:
+            raise ValueError("No se encontraron URLs válidas")
+
+        output = request.get('output') or self.default_output
+        if not output:
+            raise ValueError("Falta la carpeta de descarga ('output')")
+        format_ext = request.get('format', 'mp3')
+        quality = str(request.get('quality', '192'))
+        if format_ext not in FORMATS:
+            raise ValueError(f"Formato no soportado: {format_ext}")
+        if quality not in QUALITIES:
+            raise ValueError(f"Calidad no soportada: {quality}")
+        extra_outputs = []
+        for spec in request.get('also') or []:
+            extra_format, _, extra_quality = str(spec).partition(':')
+            extra_quality = extra_quality or quality
+            if extra_format not in FORMATS or extra_quality not in QUALITIES:
+                raise ValueError(f"Salida adicional no soportada: {spec}")
+            extra_outputs.append((extra_format, extra_quality))
+
+        settings = DownloadSettings(
+            output,
+            quality=quality,
+            format_ext=format_ext,
+            download_playlist=bool(request.get('download_playlist', True)),
+            skip_existing=bool(request.get('skip_existing', True)),
+            retries=int(request.get('retries', 3)),
+            concurrency=self.workers,
+            extra_outputs=extra_outputs,
+            connections=max(1, min(int(request.get('connections', DEFAULT_CONNECTIONS)), MAX_CONNECTIONS)),
+            replaygain=bool(request.get('replaygain', False)),
+        )
+        priority = int(request.get('priority', 0))
+
+        # The archive and store are opened inside the folder, so it must exist first
+        os.makedirs(output, exist_ok=True)
+        job = Job(next(self._ids), settings, urls, priority, self.hub,
+                  limiter=self.limiter, pacer=self.pacer, metrics=self.metrics)
+        job.engine.open(transcode_pool=self._transcode_pool, spawn=lambda fn: self._spawn(job, fn))
+        self.jobs[job.id] = job
+
+        # Higher priority first, then submission order
+        with self._cond:
+            for index, url in enumerate(urls, 1):
+                heapq.heappush(self._heap, (-priority, next(self._sequence), job.id, index, url, None))
+            self._cond.notify_all()
+
+        self.hub.publish({'event': 'job_queued', 'job': job.id, 'summary': job.summary(),
+                          'message': f"📋 Trabajo {job.id}: {job.total} URLs"})
+        return job
+
+    def _spawn(self, job, fn):
+        """Queue a sub-task (e.g. a playlist entry) with its job's priority"""
+        future = Future()
+        if job.status == 'cancelled':
+            future.cancel()
+            return future
+        with self._cond:
+            heapq.heappush(self._heap, (-job.priority, next(self._sequence), job.id, None, None,
+                                        (fn, future)))
+            self._cond.notify()
+        return future
+
+    def cancel(self, job_id):
+        """Drop a job's pending items from the queue"""
+        job = self.jobs[job_id]
+        with self._cond:
+            remaining = [entry for entry in self._heap if entry[2] != job_id]
+            dropped = [entry for entry in self._heap if entry[2] == job_id]
+            self._heap = remaining
+            heapq.heapify(self._heap)
+        job.status = 'cancelled'
+        # Items waiting for a retry fail now instead of coming back later
+        job.engine.cancel()
+        for _, _, _, index, _, subtask in dropped:
+            if subtask:
+                subtask[1].cancel()
+            else:
+                self._item_finished(job, index, "cancelado")
+        return len(dropped)
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                _, _, job_id, index, url, subtask = heapq.heappop(self._heap)
+                self._busy += 1
+            try:
+                self._run_entry(job_id, index, url, subtask)
+            finally:
+                with self._cond:
+                    self._busy -= 1
+
+    def _run_entry(self, job_id, index, url, subtask):
+        job = self.jobs[job_id]
+        if job.status == 'queued':
+            job.status = 'running'
+
+        if subtask:
+            fn, future = subtask
+            if future.set_running_or_notify_cancel():
+                resolve_with_followups(future, fn)
+            return
+
+        try:
+            conversions = job.engine.download_url(url, index, job.total)
+        except Exception as e:
+            self._item_finished(job, index, str(e) or e.__class__.__name__)
+            return
+
+        if conversions:
+            when_all_done(conversions, lambda error, job=job, index=index: self._item_finished(job, index, error))
+        else:
+            self._item_finished(job, index, None)
+
+    def _item_finished(self, job, index, error):
+        self.metrics.count_item('success' if error is None else 'error')
+        if job.item_finished(index, error):
+            job.engine.close()
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """JSON API and SSE stream for the job service"""
+
+    server_version = "YouTubeAudioDownloaderPro/2.0"
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _job_from_path(self, parts):
+        try:
+            return self.service.jobs[int(parts[1])]
+        except (IndexError, ValueError, KeyError):
+            self._send_json(404, {'error': 'Trabajo no encontrado'})
+            return None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split('/') if part]
+
+        if parts == ['jobs']:
+            jobs = [job.summary() for job in list(self.service.jobs.values())]
+            self._send_json(200, {'jobs': jobs})
+        elif len(parts) == 2 and parts[0] == 'jobs':
+            job = self._job_from_path(parts)
+            if job:
+                self._send_json(200, job.details())
+        elif parts == ['events']:
+            job_filter = parse_qs(url.query).get('job', [None])[0]
+            self._stream_events(int(job_filter) if job_filter else None)
+        elif parts == ['metrics']:
+            body = self.service.metrics.render_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json(404, {'error': 'Ruta no encontrada'})
+
+    def do_POST(self):
+        parts = [part for part in urlparse(self.path).path.split('/') if part]
+        if parts != ['jobs']:
+            self._send_json(404, {'error': 'Ruta no encontrada'})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            job = self.service.submit(request)
+        except (ValueError, OSError) as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        except sqlite3.Error as e:
+            self._send_json(500, {'error': str(e)})
+            return
+        self._send_json(201, job.summary())
+
+    def do_DELETE(self):
+        parts = [part for part in urlparse(self.path).path.split('/') if part]
+        if len(parts) != 2 or parts[0] != 'jobs':
+            self._send_json(404, {'error': 'Ruta no encontrada'})
+            return
+        job = self._job_from_path(parts)
+        if job:
+            dropped = self.service.cancel(job.id)
+            self._send_json(200, {'id': job.id, 'cancelled_items': dropped})
+
+    def _stream_events(self, job_id):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+
+        subscriber = self.service.hub.subscribe()
+        try:
+            while True:
+                try:
+                    event = subscriber.get(timeout=SSE_KEEPALIVE)
+                except queue.Empty:
+                    self.wfile.write(b": keepalive\n\n")
+                    self.wfile.flush()
+                    continue
+                if job_id is not None and event.get('job') != job_id:
+                    continue
+                data = json.dumps(event, ensure_ascii=False, default=str)
+                self.wfile.write(f"event: {event['event']}\ndata: {data}\n\n".encode('utf-8'))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            self.service.hub.unsubscribe(subscriber)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servicio local de cola de descargas")
+    parser.add_argument('--host', default='127.0.0.1', help="Dirección de escucha")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="Puerto de escucha")
+    parser.add_argument('-j', '--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f"Descargas simultáneas compartidas por todos los trabajos (1-{MAX_WORKERS})")
+    parser.add_argument('-o', '--output', help="Carpeta de descarga por defecto")
+    parser.add_argument('--limit-rate', type=int, default=0, metavar='KB/S',
+                        help="Ancho de banda total máximo en KB/s (0 = sin límite)")
+    parser.add_argument('--worker-limit-rate', type=int, default=0, metavar='KB/S',
+                        help="Ancho de banda máximo por descarga en KB/s (0 = sin límite)")
+    parser.add_argument('--request-interval', type=float, default=DEFAULT_REQUEST_INTERVAL,
+                        metavar='SEG', help="Pausa mínima entre peticiones al mismo sitio")
+    args = parser.parse_args(argv)
+
+    service = JobService(workers=args.workers, default_output=args.output,
+                         rate_limit=args.limit_rate, worker_rate_limit=args.worker_limit_rate,
+                         request_interval=args.request_interval)
+    service.start()
+
+    server = ThreadingHTTPServer((args.host, args.port), JobRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    print(f"🚀 Servicio de descargas en http://{args.host}:{args.port} ({service.workers} descargas simultáneas)",
+          flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
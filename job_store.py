@@ -0,0 +1,272 @@
+"""
+Almacén de trabajos compartido entre máquinas
+Reparte una lista de URLs muy grande entre varios procesos de descarga, en la
+misma máquina o en otras, a través de una carpeta compartida (por ejemplo en
+NFS) sin servidor central. Las URLs se guardan en lotes; cada proceso reclama
+lotes con un alquiler que renueva mientras trabaja, los lotes de procesos caídos
+se recuperan al caducar su alquiler y los resultados se registran de forma
+atómica.
+
+Solo se usan operaciones atómicas en sistemas de archivos de red: crear con
+O_EXCL, renombrar y reemplazar archivos.
+
+    <carpeta>/job.json           ajustes, total de URLs y si la lista está completa
+    <carpeta>/pending/<lote>     lotes sin reclamar
+    <carpeta>/leased/<lote>@<w>  lotes alquilados por el proceso <w>
+    <carpeta>/done/<lote>        resultados de cada lote terminado
+"""
+
+import json
+import os
+import re
+import socket
+import threading
+import time
+
+DEFAULT_BATCH_SIZE = 20
+# A lease not renewed for this long is considered abandoned
+DEFAULT_LEASE_SECONDS = 600
+# Idle workers look for reclaimable leases this often while others are still busy
+POLL_INTERVAL = 15.0
+
+JOB_FILENAME = 'job.json'
+
+_UNSAFE_CHARS = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+def default_worker_id():
+    return _UNSAFE_CHARS.sub('_', f"{socket.gethostname()}-{os.getpid()}")
+
+
+def _write_atomic(path, text):
+    tmp_path = f"{path}.tmp-{default_worker_id()}"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        file.write(text)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+class Lease:
+    """A claimed batch: its items and the lease file that proves ownership"""
+
+    def __init__(self, batch, path, items):
+        self.batch = batch
+        self.path = path
+        self.items = items  # [(index, url)]
+        self.results = {}  # index -> error or None
+
+    @property
+    def finished(self):
+        return len(self.results) == len(self.items)
+
+
+class JobStore:
+    """Shared folder of leased URL batches"""
+
+    def __init__(self, root, worker_id=None, lease_seconds=DEFAULT_LEASE_SECONDS, poll_interval=POLL_INTERVAL):
+        self.root = root
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.settings = {}
+        self.total = 0
+        self.complete = False
+        self._held = {}
+        self._lock = threading.Lock()
+        self._heartbeat = None
+        self._stopping = threading.Event()
+
+    def _dir(self, name):
+        return os.path.join(self.root, name)
+
+    def _list(self, name):
+        """Batch files in a store subfolder, skipping half-written temporaries"""
+        return sorted(entry for entry in os.listdir(self._dir(name)) if '.tmp-' not in entry)
+
+    # Creating the job
+
+    def create(self, urls, settings, batch_size=DEFAULT_BATCH_SIZE):
+        """Write the URLs as pending batches; returns False if another process created the job first.
+
+        Workers may start claiming batches while the rest are still being written.
+        """
+        for name in ('pending', 'leased', 'done'):
+            os.makedirs(self._dir(name), exist_ok=True)
+        header = {'settings': dict(settings), 'total': 0, 'complete': False, 'created': time.time()}
+        try:
+            # O_EXCL makes exactly one creator win, also on NFSv3 and later
+            fd = os.open(self._dir(JOB_FILENAME), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            json.dump(header, file)
+
+        batch, total = [], 0
+        for url in urls:
+            total += 1
+            batch.append((total, url))
+            if len(batch) >= batch_size:
+                self._write_batch(batch)
+                batch = []
+        if batch:
+            self._write_batch(batch)
+
+        header.update(total=total, complete=True)
+        _write_atomic(self._dir(JOB_FILENAME), json.dumps(header))
+        self.settings, self.total, self.complete = header['settings'], total, True
+        return True
+
+    def _write_batch(self, items):
+        # Zero-padded first index, so batches are claimed in input order
+        name = f"{items[0][0]:012d}"
+        lines = ''.join(json.dumps({'i': index, 'url': url}, ensure_ascii=False) + '\n'
+                        for index, url in items)
+        _write_atomic(os.path.join(self._dir('pending'), name), lines)
+
+    def load(self):
+        """Read the job header; returns False if the folder holds no job"""
+        try:
+            with open(self._dir(JOB_FILENAME), 'r', encoding='utf-8') as file:
+                header = json.load(file)
+        except (OSError, ValueError):
+            return False
+        self.settings = header.get('settings', {})
+        self.total = header.get('total', 0)
+        self.complete = header.get('complete', True)
+        return True
+
+    # Claiming and completing batches
+
+    def claim(self):
+        """Lease the next pending batch, or an expired one; returns a Lease or None"""
+        for name in self._list('pending'):
+            lease = self._take(os.path.join(self._dir('pending'), name), name)
+            if lease:
+                return lease
+
+        now = self._fs_now()
+        for name in self._list('leased'):
+            batch, _, owner = name.partition('@')
+            if owner == self.worker_id:
+                continue
+            path = os.path.join(self._dir('leased'), name)
+            try:
+                expired = os.stat(path).st_mtime + self.lease_seconds < now
+            except FileNotFoundError:
+                continue
+            if expired:
+                lease = self._take(path, batch)
+                if lease:
+                    return lease
+        return None
+
+    def _take(self, source, batch):
+        """Rename a batch file into our lease; only one of several racing workers succeeds"""
+        if os.path.exists(os.path.join(self._dir('done'), batch)):
+            # Finished by a worker that crashed before dropping its lease
+            try:
+                os.remove(source)
+            except FileNotFoundError:
+                pass
+            return None
+        target = os.path.join(self._dir('leased'), f"{batch}@{self.worker_id}")
+        try:
+            os.rename(source, target)
+            # rename keeps the old mtime; start the lease now
+            os.utime(target)
+            with open(target, 'r', encoding='utf-8') as file:
+                items = [(record['i'], record['url']) for record in map(json.loads, file)]
+        except FileNotFoundError:
+            return None
+        lease = Lease(batch, target, items)
+        with self._lock:
+            self._held[batch] = lease
+        return lease
+
+    def record(self, lease, index, error=None):
+        """Record one item's outcome; completes the batch after its last item"""
+        with self._lock:
+            lease.results[index] = error
+            if not lease.finished:
+                return
+            self._held.pop(lease.batch, None)
+        self.complete_batch(lease)
+
+    def complete_batch(self, lease):
+        """Atomically publish the batch results and drop the lease"""
+        lines = ''.join(json.dumps({'i': index, 'url': url, 'e': lease.results.get(index)},
+                                   ensure_ascii=False) + '\n' for index, url in lease.items)
+        _write_atomic(os.path.join(self._dir('done'), lease.batch), lines)
+        try:
+            os.remove(lease.path)
+        except FileNotFoundError:
+            # Reclaimed by another worker meanwhile; its results will match
+            pass
+
+    def release_held(self):
+        """Return every unfinished batch still held to the pending queue (e.g. on cancel); returns how many"""
+        with self._lock:
+            leases, self._held = list(self._held.values()), {}
+        released = 0
+        for lease in leases:
+            try:
+                os.rename(lease.path, os.path.join(self._dir('pending'), lease.batch))
+                released += 1
+            except FileNotFoundError:
+                pass
+        return released
+
+    def finished(self):
+        """True once every batch has results (nothing pending or leased)"""
+        return self.complete and not self._list('pending') and not self._list('leased')
+
+    def status(self):
+        """Counts of pending/leased batches and done/failed items"""
+        done = failed = 0
+        for name in self._list('done'):
+            with open(os.path.join(self._dir('done'), name), 'r', encoding='utf-8') as file:
+                for record in map(json.loads, file):
+                    if record.get('e') is None:
+                        done += 1
+                    else:
+                        failed += 1
+        return {'total': self.total, 'complete': self.complete,
+                'pending_batches': len(self._list('pending')),
+                'leased_batches': len(self._list('leased')),
+                'done': done, 'failed': failed}
+
+    # Lease renewal
+
+    def start_heartbeat(self):
+        """Renew the held leases from a background thread until stop_heartbeat()"""
+        self._stopping.clear()
+        self._heartbeat = threading.Thread(target=self._renew_loop, name="lease-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    def stop_heartbeat(self):
+        self._stopping.set()
+        if self._heartbeat:
+            self._heartbeat.join()
+            self._heartbeat = None
+
+    def _renew_loop(self):
+        while not self._stopping.wait(self.lease_seconds / 3):
+            with self._lock:
+                leases = list(self._held.values())
+            for lease in leases:
+                try:
+                    os.utime(lease.path)
+                except FileNotFoundError:
+                    # Reclaimed after a stall; finish anyway, the results are idempotent
+                    pass
+
+    def _fs_now(self):
+        """Current time as seen by the (possibly remote) filesystem, immune to clock skew"""
+        path = self._dir(f".clock-{self.worker_id}")
+        with open(path, 'w'):
+            pass
+        try:
+            return os.stat(path).st_mtime
+        finally:
+            os.remove(path)
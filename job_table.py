@@ -0,0 +1,384 @@
+"""
+Tabla de elementos del lote
+Muestra una fila por URL y por elemento de playlist con su estado, porcentaje,
+velocidad y tiempo restante. El modelo se alimenta desde los hilos de trabajo
+y la vista solo dibuja las filas visibles, aplicando los cambios por lotes, de
+modo que la interfaz sigue fluida con decenas de miles de elementos en cola.
+"""
+
+import bisect
+import threading
+import tkinter as tk
+from collections import Counter
+from tkinter import ttk
+
+PENDING = 'pending'
+RUNNING = 'running'
+CONVERTING = 'converting'
+RETRYING = 'retrying'
+DONE = 'done'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
+STATUS_LABELS = {
+    PENDING: '⏳ Pendiente',
+    RUNNING: '⬇️ Descargando',
+    CONVERTING: '🔄 Convirtiendo',
+    RETRYING: '🔁 Reintentando',
+    DONE: '✅ Completado',
+    SKIPPED: '⏭️ Omitido',
+    FAILED: '❌ Error',
+}
+
+# Filter name -> statuses it shows (None shows every row), in toolbar order
+FILTERS = {
+    'all': None,
+    'pending': {PENDING, RETRYING},
+    'running': {RUNNING, CONVERTING},
+    'failed': {FAILED},
+    'done': {DONE, SKIPPED},
+}
+
+FILTER_LABELS = {
+    'all': 'Todos',
+    'pending': 'Pendientes',
+    'running': 'En curso',
+    'failed': 'Fallidos',
+    'done': 'Completados',
+}
+
+# Column id -> (heading, width, stretch)
+COLUMNS = {
+    'item': ('#', 70, False),
+    'title': ('Título / URL', 300, True),
+    'status': ('Estado', 130, False),
+    'percent': ('%', 60, False),
+    'speed': ('Velocidad', 90, False),
+    'eta': ('Restante', 70, False),
+}
+
+# How often the view applies the model's changes
+REFRESH_MS = 250
+
+# Rows scrolled per mouse wheel notch
+WHEEL_ROWS = 3
+
+
+class _Row:
+    __slots__ = ('title', 'status', 'downloaded', 'total', 'speed', 'eta', 'error',
+                 'entries_done', 'entries_total')
+
+    def __init__(self, title):
+        self.title = title
+        self.status = PENDING
+        self.downloaded = 0
+        self.total = None
+        self.speed = None
+        self.eta = None
+        self.error = None
+        # Only set for playlist rows
+        self.entries_done = 0
+        self.entries_total = None
+
+
+class JobTableModel:
+    """Thread-safe per-item state of the batch, fed with the engine's events.
+
+    Rows are keyed (index, 0) for URLs and (index, playlist_index) for
+    playlist entries, so sorting the keys lists every entry under its URL.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._rows = {}
+            self._order = []
+            self._counts = Counter()
+            self._dirty = set()
+            self._structure_changed = True
+
+    def handle_event(self, event):
+        """Apply one engine event (called from worker threads)"""
+        kind = event['event']
+        index = event.get('index')
+        if index is None:
+            return
+        with self._lock:
+            if kind in ('item_queued', 'item_start'):
+                self._row((index, 0), event.get('url'))
+                if kind == 'item_start':
+                    self._set_status((index, 0), RUNNING)
+            elif kind == 'item_info':
+                row = self._row((index, 0))
+                row.title = event.get('title') or row.title
+                if event.get('kind') == 'playlist':
+                    row.entries_total = event.get('entries')
+                self._dirty.add((index, 0))
+            elif kind == 'playlist_progress':
+                self._row((index, 0)).entries_total = event.get('total') or event.get('queued')
+                self._dirty.add((index, 0))
+            elif kind == 'entry_queued':
+                self._row((index, event['entry']), event.get('title') or event.get('url'))
+            elif kind == 'progress':
+                key = (index, event.get('entry') or 0)
+                row = self._row(key)
+                row.downloaded = event.get('downloaded_bytes') or 0
+                row.total = event.get('total_bytes')
+                row.speed = event.get('speed')
+                row.eta = event.get('eta')
+                self._set_status(key, RUNNING)
+                if key[1]:
+                    self._set_status((index, 0), RUNNING)
+            elif kind == 'file_done':
+                key = (index, event.get('entry') or 0)
+                row = self._row(key)
+                row.speed = row.eta = None
+                self._set_status(key, CONVERTING)
+            elif kind == 'item_retry':
+                self._row((index, 0)).error = event.get('error')
+                self._set_status((index, 0), RETRYING)
+            elif kind == 'item_skipped':
+                self._set_status((index, 0), SKIPPED)
+            elif kind == 'entry_done':
+                key = (index, event['entry'])
+                self._finish(key, event.get('error'))
+                self._row((index, 0)).entries_done += 1
+                self._dirty.add((index, 0))
+            elif kind == 'item_done':
+                self._finish((index, 0), event.get('error'))
+
+    def _row(self, key, title=None):
+        row = self._rows.get(key)
+        if row is None:
+            row = self._rows[key] = _Row(title or '')
+            self._counts[PENDING] += 1
+            # Items are queued in order, so this is nearly always an append
+            if not self._order or key > self._order[-1]:
+                self._order.append(key)
+            else:
+                bisect.insort(self._order, key)
+            self._structure_changed = True
+        self._dirty.add(key)
+        return row
+
+    def _set_status(self, key, status):
+        row = self._row(key)
+        if row.status != status:
+            self._counts[row.status] -= 1
+            self._counts[status] += 1
+            row.status = status
+
+    def _finish(self, key, error):
+        row = self._row(key)
+        row.speed = row.eta = None
+        row.error = error
+        if error is not None:
+            self._set_status(key, FAILED)
+        elif row.status != SKIPPED:
+            self._set_status(key, DONE)
+
+    def take_changes(self):
+        """(rows added or removed since the last call, keys of rows whose values changed)"""
+        with self._lock:
+            structure_changed, dirty = self._structure_changed, self._dirty
+            self._structure_changed = False
+            self._dirty = set()
+        return structure_changed, dirty
+
+    def keys(self, name='all'):
+        """Keys of the rows shown by a filter, in table order"""
+        statuses = FILTERS[name]
+        with self._lock:
+            if statuses is None:
+                return list(self._order)
+            rows = self._rows
+            return [key for key in self._order if rows[key].status in statuses]
+
+    def counts(self):
+        """Filter name -> number of rows it shows"""
+        with self._lock:
+            return {name: len(self._rows) if statuses is None else sum(self._counts[s] for s in statuses)
+                    for name, statuses in FILTERS.items()}
+
+    def display(self, key):
+        """(column values, status) of one row; None if it no longer exists"""
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None:
+                return None
+            index, entry = key
+            label = f"{index}.{entry}" if entry else str(index)
+            if row.entries_total:
+                percent = f"{row.entries_done}/{row.entries_total}"
+            elif row.status in (CONVERTING, DONE):
+                percent = "100%"
+            elif row.total:
+                percent = f"{min(row.downloaded / row.total, 1):.0%}"
+            else:
+                percent = ""
+            status = STATUS_LABELS[row.status]
+            if row.error and row.status in (FAILED, RETRYING):
+                status = f"{status}: {row.error}"
+            title = f"   ↳ {row.title}" if entry else row.title
+            return (label, title, status, percent, _format_speed(row.speed), _format_eta(row.eta)), row.status
+
+
+def _format_speed(speed):
+    if not speed:
+        return ""
+    for unit in ('B/s', 'KB/s', 'MB/s'):
+        if speed < 1024:
+            return f"{speed:.0f} {unit}"
+        speed /= 1024
+    return f"{speed:.1f} GB/s"
+
+
+def _format_eta(eta):
+    if eta is None:
+        return ""
+    minutes, seconds = divmod(int(eta), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+class JobTable(ttk.Frame):
+    """Virtualized view of a JobTableModel.
+
+    The Treeview holds a fixed pool of rows, as many as fit in the widget,
+    and scrolling only changes which model rows they show; the scrollbar is
+    driven by the position in the filtered key list.
+    """
+
+    def __init__(self, parent, model, refresh_ms=REFRESH_MS, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.model = model
+        self.refresh_ms = refresh_ms
+        self.filter_var = tk.StringVar(value='all')
+        self._keys = []
+        self._top = 0
+        self._slots = []
+        self._shown = []  # (key, values, status) per slot, to skip unchanged rows
+        self._counts = None
+        self.grid_rowconfigure(1, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+        filter_frame = ttk.Frame(self)
+        filter_frame.grid(row=0, column=0, columnspan=2, sticky="w", pady=(0, 5))
+        self._filter_buttons = {}
+        for name in FILTERS:
+            button = ttk.Radiobutton(filter_frame, text=FILTER_LABELS[name], value=name,
+                                     variable=self.filter_var, style='Toolbutton', command=self._on_filter)
+            button.pack(side=tk.LEFT, padx=(0, 5))
+            self._filter_buttons[name] = button
+
+        self.tree = ttk.Treeview(self, columns=tuple(COLUMNS), show='headings', selectmode='none', height=1)
+        for column, (heading, width, stretch) in COLUMNS.items():
+            self.tree.heading(column, text=heading)
+            self.tree.column(column, width=width, minwidth=40, stretch=stretch,
+                             anchor=tk.W if stretch else tk.CENTER)
+        self.tree.tag_configure(FAILED, foreground='#d13438')
+        self.tree.tag_configure(DONE, foreground='#107c10')
+        self.tree.tag_configure(SKIPPED, foreground='gray')
+        self.tree.grid(row=1, column=0, sticky="nsew")
+
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self._on_scroll)
+        self.scrollbar.grid(row=1, column=1, sticky="ns")
+
+        self.tree.bind('<Configure>', self._on_resize)
+        self.tree.bind('<MouseWheel>', lambda e: self._scroll_by(-WHEEL_ROWS if e.delta > 0 else WHEEL_ROWS))
+        self.tree.bind('<Button-4>', lambda e: self._scroll_by(-WHEEL_ROWS))
+        self.tree.bind('<Button-5>', lambda e: self._scroll_by(WHEEL_ROWS))
+        self.after(self.refresh_ms, self.refresh)
+
+    def _row_height(self):
+        style = ttk.Style(self)
+        try:
+            return int(style.lookup('Treeview', 'rowheight') or 20)
+        except (tk.TclError, ValueError):
+            return 20
+
+    def _on_resize(self, event):
+        # The heading takes about one row
+        visible = max(1, event.height // self._row_height() - 1)
+        while len(self._slots) < visible:
+            self._slots.append(self.tree.insert('', tk.END, values=()))
+            self._shown.append(None)
+        while len(self._slots) > visible:
+            self.tree.delete(self._slots.pop())
+            self._shown.pop()
+        self._clamp()
+        self._render()
+
+    def _on_filter(self):
+        self._keys = self.model.keys(self.filter_var.get())
+        self._top = 0
+        self._render()
+
+    def _on_scroll(self, action, amount, unit=None):
+        if action == 'moveto':
+            self._top = int(float(amount) * len(self._keys))
+            self._clamp()
+            self._render()
+        else:
+            step = len(self._slots) if unit == 'pages' else 1
+            self._scroll_by(int(amount) * step)
+
+    def _scroll_by(self, rows):
+        self._top += rows
+        self._clamp()
+        self._render()
+        return 'break'
+
+    def _clamp(self):
+        self._top = max(0, min(self._top, len(self._keys) - len(self._slots)))
+
+    def refresh(self):
+        """Apply the model's pending changes (Tk main loop timer)"""
+        try:
+            structure_changed, dirty = self.model.take_changes()
+            name = self.filter_var.get()
+            # A status change can move rows in or out of a filtered view
+            if structure_changed or (dirty and FILTERS[name] is not None):
+                self._keys = self.model.keys(name)
+                self._clamp()
+                self._render()
+            elif dirty:
+                self._render(dirty)
+            if dirty or structure_changed:
+                self._update_counts()
+        finally:
+            self.after(self.refresh_ms, self.refresh)
+
+    def _render(self, only=None):
+        """Show the rows under the visible slots; with only, just those keys"""
+        keys = self._keys[self._top:self._top + len(self._slots)]
+        for position, slot in enumerate(self._slots):
+            key = keys[position] if position < len(keys) else None
+            if only is not None and key not in only:
+                continue
+            shown = self.model.display(key) if key is not None else None
+            current = (key,) + shown if shown else None
+            if current == self._shown[position]:
+                continue
+            if current is None:
+                self.tree.item(slot, values=(), tags=())
+            else:
+                values, status = shown
+                self.tree.item(slot, values=values, tags=(status,))
+            self._shown[position] = current
+        if self._keys:
+            self.scrollbar.set(self._top / len(self._keys),
+                               min(1.0, (self._top + len(self._slots)) / len(self._keys)))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def _update_counts(self):
+        counts = self.model.counts()
+        if counts == self._counts:
+            return
+        self._counts = counts
+        for name, button in self._filter_buttons.items():
+            button.configure(text=f"{FILTER_LABELS[name]} ({counts[name]})")
@@ -0,0 +1,53 @@
+"""
+Canal de registro con limitación de frecuencia
+Los hilos de trabajo encolan mensajes y la interfaz los vacía por lotes;
+el progreso de cada archivo se combina y solo se muestra el último valor
+"""
+
+import threading
+import time
+from collections import deque
+
+# How often the UI drains the queue, and how often merged progress lines are shown
+FLUSH_INTERVAL_MS = 100
+PROGRESS_INTERVAL = 1.0
+
+# Lines kept in the status widget; older lines are dropped
+MAX_LOG_LINES = 2000
+
+
+class LogQueue:
+    """Thread-safe log buffer; progress updates are merged per key"""
+
+    def __init__(self, progress_interval=PROGRESS_INTERVAL, max_pending=MAX_LOG_LINES):
+        self.progress_interval = progress_interval
+        self._lines = deque(maxlen=max_pending)
+        self._progress = {}
+        self._last_progress_flush = 0.0
+        self._lock = threading.Lock()
+
+    def put(self, line):
+        with self._lock:
+            self._lines.append(line)
+
+    def put_progress(self, key, line):
+        """Queue a progress line, replacing any not-yet-shown line for the same key"""
+        with self._lock:
+            self._progress[key] = line
+
+    def clear_progress(self, key):
+        """Drop a pending progress line, e.g. once the file has finished"""
+        with self._lock:
+            self._progress.pop(key, None)
+
+    def drain(self):
+        """Return the lines ready to display, oldest first"""
+        now = time.monotonic()
+        with self._lock:
+            lines = list(self._lines)
+            self._lines.clear()
+            if self._progress and now - self._last_progress_flush >= self.progress_interval:
+                lines.extend(self._progress.values())
+                self._progress.clear()
+                self._last_progress_flush = now
+        return lines
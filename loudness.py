@@ -0,0 +1,299 @@
+"""
+Análisis de sonoridad y etiquetas ReplayGain
+Decodifica cada audio a PCM una sola vez y calcula la sonoridad integrada
+EBU R128 (ITU-R BS.1770) y el pico real por bloques con NumPy; sin NumPy se
+usa el filtro ebur128 de FFmpeg. Con el resultado se escriben etiquetas
+ReplayGain 2.0 de pista y, en las playlists, de álbum, sin recodificar.
+"""
+
+import math
+import os
+import re
+import struct
+import subprocess
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# ReplayGain 2.0 plays every track as loud as a -18 LUFS reference
+REFERENCE_LUFS = -18.0
+
+# BS.1770 gating: 400 ms blocks every 100 ms, an absolute gate, then one 10 LU below the ungated mean
+SAMPLE_RATE = 48000
+HOP = SAMPLE_RATE // 10
+HOPS_PER_BLOCK = 4
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+
+# PCM read from FFmpeg per step, in samples per channel (about 10 s)
+CHUNK_SAMPLES = 1 << 19
+
+# K-weighting at 48 kHz (BS.1770-4, table 1 and 2): high-shelf, then the RLB high-pass
+K_WEIGHTING = (
+    ((1.53512485958697, -2.69169618940638, 1.19839281085285), (-1.69065929318241, 0.73248077421585)),
+    ((1.0, -2.0, 1.0), (-1.99004745483398, 0.99007225036621)),
+)
+# Length of the FIR that stands in for the two biquads; their response has died out long before
+K_WEIGHTING_TAPS = 4096
+# FFT size of the overlap-save frames the FIR is applied in, many frames per call
+FFT_SIZE = 1 << 15
+FFT_STEP = FFT_SIZE - K_WEIGHTING_TAPS + 1
+
+# True peak: 4x oversampling with a 12-tap-per-phase windowed sinc, as in BS.1770-4 annex 2
+OVERSAMPLING = 4
+INTERPOLATION_TAPS = 12
+KAISER_BETA = 5.0
+
+
+def loudness_of(power):
+    """LUFS of a mean channel-summed power"""
+    return -0.691 + 10 * math.log10(power) if power > 0 else -math.inf
+
+
+def gated_loudness(blocks):
+    """Integrated loudness of block powers already above the absolute gate; None if all are silent"""
+    if not len(blocks):
+        return None
+    threshold = loudness_of(sum(blocks) / len(blocks)) + RELATIVE_GATE
+    gated = [power for power in blocks if loudness_of(power) > threshold]
+    return loudness_of(sum(gated) / len(gated)) if gated else None
+
+
+def _k_weighting_fir(taps):
+    """Impulse response of the K-weighting biquads"""
+    signal = [1.0] + [0.0] * (taps - 1)
+    for (b0, b1, b2), (a1, a2) in K_WEIGHTING:
+        x1 = x2 = y1 = y2 = 0.0
+        out = []
+        for x in signal:
+            y = b0 * x + b1 * x1 + b2 * x2 - a1 * y1 - a2 * y2
+            x2, x1, y2, y1 = x1, x, y1, y
+            out.append(y)
+        signal = out
+    return np.array(signal)
+
+
+def _interpolation_matrix():
+    """(taps, phases) weights: column p interpolates the point p/4 of a sample after the window's centre"""
+    centre = INTERPOLATION_TAPS // 2 - 1
+    offsets = np.arange(INTERPOLATION_TAPS)[:, None] - centre
+    t = np.arange(OVERSAMPLING)[None, :] / OVERSAMPLING - offsets
+    half = INTERPOLATION_TAPS / 2
+    window = np.i0(KAISER_BETA * np.sqrt(np.clip(1 - (t / half) ** 2, 0, None))) / np.i0(KAISER_BETA)
+    weights = np.sinc(t) * window
+    return weights / weights.sum(axis=0)
+
+
+class _Meter:
+    """Streaming BS.1770 meter over (samples, channels) float chunks"""
+
+    def __init__(self, channels):
+        self._response = np.fft.rfft(_k_weighting_fir(K_WEIGHTING_TAPS), FFT_SIZE)
+        # Unfiltered input not yet covered by a frame, starting with the previous frame's tail
+        self._pending = np.zeros((K_WEIGHTING_TAPS - 1, channels))
+        # Filtered samples short of a whole 100 ms hop
+        self._leftover = np.zeros((0, channels))
+        interpolation = _interpolation_matrix()
+        self._phases = interpolation[:, 1:].astype(np.float32)
+        self._gain = float(np.abs(interpolation).sum(axis=0).max())
+        self._peak_history = np.zeros((INTERPOLATION_TAPS - 1, channels), dtype=np.float32)
+        self.hop_powers = []
+        self.peak = 0.0
+
+    def feed(self, samples):
+        self._true_peak(samples)
+        pending = np.concatenate((self._pending, samples))
+        if len(pending) < FFT_SIZE:
+            self._pending = pending
+            return
+        frames = (len(pending) - FFT_SIZE) // FFT_STEP + 1
+        self._pending = pending[frames * FFT_STEP:]
+        self._filter(pending[:(frames - 1) * FFT_STEP + FFT_SIZE], frames)
+
+    def finish(self):
+        """Filter the input still pending at the end of the stream"""
+        valid = len(self._pending) - (K_WEIGHTING_TAPS - 1)
+        if valid > 0:
+            padded = np.zeros((FFT_SIZE, self._pending.shape[1]))
+            padded[:len(self._pending)] = self._pending
+            self._filter(padded, 1, valid)
+
+    def _filter(self, pending, frames, valid=FFT_STEP):
+        # (frames, channels, FFT_SIZE) views of the input; the first taps - 1 outputs of each wrap around
+        windows = np.lib.stride_tricks.sliding_window_view(pending, FFT_SIZE, axis=0)[::FFT_STEP][:frames]
+        filtered = np.fft.irfft(np.fft.rfft(windows, axis=-1) * self._response, FFT_SIZE, axis=-1)
+        filtered = filtered[:, :, K_WEIGHTING_TAPS - 1:K_WEIGHTING_TAPS - 1 + valid]
+        filtered = np.concatenate((self._leftover, filtered.transpose(0, 2, 1).reshape(-1, pending.shape[1])))
+
+        # Mean square per 100 ms hop and channel, summed over channels (all weighted 1.0 in stereo)
+        hops = len(filtered) // HOP
+        self._leftover = filtered[hops * HOP:]
+        squares = filtered[:hops * HOP].reshape(hops, HOP, -1) ** 2
+        self.hop_powers.extend(squares.mean(axis=1).sum(axis=1).tolist())
+
+    def _true_peak(self, samples):
+        samples = samples.astype(np.float32)
+        self.peak = max(self.peak, float(np.abs(samples).max(initial=0.0)))
+        padded = np.concatenate((self._peak_history, samples))
+        self._peak_history = padded[-(INTERPOLATION_TAPS - 1):]
+        # An interpolated point is at most gain times the loudest sample under the filter, so only
+        # windows around samples above peak / gain can raise the peak
+        threshold = self.peak / self._gain
+        for channel in range(padded.shape[1]):
+            column = padded[:, channel]
+            loud = np.flatnonzero(np.abs(column) > threshold)
+            if not len(loud):
+                continue
+            windows = np.lib.stride_tricks.sliding_window_view(column, INTERPOLATION_TAPS)
+            if len(loud) * INTERPOLATION_TAPS < len(column) // 2:
+                starts = np.unique((loud[:, None] - np.arange(INTERPOLATION_TAPS)).ravel())
+                windows = windows[starts[(starts >= 0) & (starts < len(windows))]]
+            # Phase 0 is the samples themselves; the other three lie between them
+            for phase in self._phases.T:
+                self.peak = max(self.peak, float(np.abs(windows @ phase).max(initial=0.0)))
+
+    def block_powers(self):
+        """Powers of the 400 ms blocks that pass the absolute gate"""
+        hops = np.array(self.hop_powers)
+        if len(hops) < HOPS_PER_BLOCK:
+            return []
+        blocks = np.lib.stride_tricks.sliding_window_view(hops, HOPS_PER_BLOCK).mean(axis=1)
+        gate = 10 ** ((ABSOLUTE_GATE + 0.691) / 10)
+        return blocks[blocks > gate].tolist()
+
+
+def _read_wav_header(stream):
+    """Channel count of FFmpeg's streamed float WAV; leaves the stream at the samples"""
+    riff = stream.read(12)
+    if len(riff) < 12 or riff[:4] != b'RIFF' or riff[8:] != b'WAVE':
+        raise RuntimeError("FFmpeg no devolvió audio")
+    channels = None
+    while True:
+        header = stream.read(8)
+        if len(header) < 8:
+            raise RuntimeError("FFmpeg no devolvió audio")
+        chunk, size = header[:4], struct.unpack('<I', header[4:])[0]
+        if chunk == b'data':
+            if channels is None:
+                raise RuntimeError("Cabecera WAV sin formato")
+            return channels
+        body = stream.read(size + (size & 1))
+        if chunk == b'fmt ':
+            channels = struct.unpack('<H', body[2:4])[0]
+
+
+def _analyze_numpy(path):
+    # Surround sources are folded to stereo; BS.1770 weights only differ for the rear channels
+    command = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-nostdin', '-i', path,
+               '-map', '0:a:0', '-af', 'aformat=channel_layouts=mono|stereo',
+               '-ar', str(SAMPLE_RATE), '-c:a', 'pcm_f32le', '-f', 'wav', '-']
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        channels = _read_wav_header(process.stdout)
+        meter = _Meter(channels)
+        frame = 4 * channels
+        while True:
+            data = process.stdout.read(CHUNK_SAMPLES * frame)
+            usable = len(data) - len(data) % frame
+            if usable:
+                meter.feed(np.frombuffer(data[:usable], dtype='<f4').reshape(-1, channels).astype(np.float64))
+            if len(data) < CHUNK_SAMPLES * frame:
+                break
+        meter.finish()
+    finally:
+        process.stdout.close()
+        stderr = process.stderr.read().decode('utf-8', 'replace')
+        process.stderr.close()
+        returncode = process.wait()
+    if returncode != 0:
+        detail = stderr.strip().splitlines()[-1:] or ['sin detalles']
+        raise RuntimeError(f"FFmpeg falló al analizar {os.path.basename(path)}: {detail[0]}")
+    return meter.block_powers(), meter.peak
+
+
+# One line per 100 ms of the ebur128 filter's frame log; M is the loudness of the last 400 ms
+_FRAME_LINE = re.compile(r't:\s*([\d.]+)\s+TARGET:.*?\sM:\s*(-?[\d.]+|-inf|nan)')
+_PEAK_LINE = re.compile(r'Peak:\s+(-?[\d.]+|-inf)\s+dBFS')
+
+
+def _analyze_ffmpeg(path):
+    """Fallback without NumPy: FFmpeg's ebur128 filter reports the same 400 ms blocks"""
+    command = ['ffmpeg', '-hide_banner', '-nostdin', '-nostats', '-i', path, '-map', '0:a:0',
+               '-af', 'ebur128=peak=true:framelog=info', '-f', 'null', '-']
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            text=True, errors='replace')
+    if result.returncode != 0:
+        detail = result.stderr.strip().splitlines()[-1:] or ['sin detalles']
+        raise RuntimeError(f"FFmpeg falló al analizar {os.path.basename(path)}: {detail[0]}")
+    blocks = []
+    for match in _FRAME_LINE.finditer(result.stderr):
+        # The first frames cover less than a whole block
+        if float(match.group(1)) < 0.4 - 1e-6 or match.group(2) in ('-inf', 'nan'):
+            continue
+        loudness = float(match.group(2))
+        if loudness > ABSOLUTE_GATE:
+            blocks.append(10 ** ((loudness + 0.691) / 10))
+    peaks = [float(value) for value in _PEAK_LINE.findall(result.stderr) if value != '-inf']
+    return blocks, 10 ** (max(peaks) / 20) if peaks else 0.0
+
+
+def analyze_file(path):
+    """Measure one file: {'loudness': LUFS or None, 'peak': linear true peak, 'blocks': gated block powers}"""
+    blocks, peak = (_analyze_numpy if np is not None else _analyze_ffmpeg)(path)
+    return {'loudness': gated_loudness(blocks), 'peak': peak, 'blocks': blocks}
+
+
+def album_measurement(measurements):
+    """Album loudness over every track's blocks together, and the album's highest peak"""
+    blocks = [power for measurement in measurements for power in measurement['blocks']]
+    return {'loudness': gated_loudness(blocks),
+            'peak': max((measurement['peak'] for measurement in measurements), default=0.0),
+            'blocks': blocks}
+
+
+def format_gain(measurement):
+    """ReplayGain tag value of a measurement with a known loudness, e.g. '-6.20 dB'"""
+    return f"{REFERENCE_LUFS - measurement['loudness']:.2f} dB"
+
+
+def replaygain_tags(track, album=None):
+    """ReplayGain 2.0 tags for a track measurement, plus the album's if given"""
+    tags = {}
+    for prefix, measurement in (('TRACK', track), ('ALBUM', album)):
+        if measurement and measurement['loudness'] is not None:
+            tags[f'REPLAYGAIN_{prefix}_GAIN'] = format_gain(measurement)
+            tags[f'REPLAYGAIN_{prefix}_PEAK'] = f"{measurement['peak']:.6f}"
+    return tags
+
+
+def write_tags(paths, tags):
+    """Add tags to each file by remuxing it, without re-encoding (runs inside a pool process)"""
+    if not tags:
+        return paths
+    for path in paths:
+        base, ext = os.path.splitext(path)
+        tmp = f"{base}.tmp{ext}"
+        metadata = [argument for key, value in tags.items() for argument in ('-metadata', f"{key}={value}")]
+        # The MP4 muxer drops tags it has no atom for unless told to keep them
+        extra = ['-movflags', 'use_metadata_tags'] if ext == '.m4a' else []
+        command = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-nostdin', '-y', '-i', path,
+                   '-map', '0', '-c', 'copy', '-map_metadata', '0', *metadata, *extra, tmp]
+        result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                text=True, errors='replace')
+        if result.returncode != 0:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            detail = result.stderr.strip().splitlines()[-1:] or ['sin detalles']
+            raise RuntimeError(f"FFmpeg no pudo etiquetar {os.path.basename(path)}: {detail[0]}")
+        # Replacing (not rewriting) the file keeps other playlists' links to the stored copy intact
+        os.replace(tmp, path)
+    return paths
+
+
+def measure_and_tag(paths):
+    """Analyze the first of an item's outputs and write its track tags on all of them"""
+    measurement = analyze_file(paths[0])
+    write_tags(paths, replaygain_tags(measurement))
+    return measurement
@@ -0,0 +1,219 @@
+"""
+Caché de metadatos de extracción
+Guarda en SQLite los resultados de extract_info (título, duración, formatos y
+elementos de cada playlist) por URL normalizada o ID de video, con caducidad y
+un tamaño máximo con expulsión LRU, para no repetir peticiones de red en
+ejecuciones posteriores.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from download_archive import make_archive_id
+
+CACHE_FILENAME = 'metadata_cache.sqlite3'
+
+# Titles, durations and archive IDs stay valid this long
+DEFAULT_TTL = 7 * 24 * 3600
+# Playlists gain new entries, so their listing is refreshed sooner
+PLAYLIST_TTL = 3600
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+# Signed format URLs are not reused this close to their 'expire' time
+FORMAT_EXPIRY_MARGIN = 600
+
+# Large fields never used for audio downloads
+_DROPPED_FIELDS = ('automatic_captions', 'subtitles', 'heatmap')
+_TRACKING_PARAMS = ('si', 'feature', 'pp', 'fbclid', 'gclid')
+
+_extractor_classes = None
+
+
+def default_cache_path():
+    """Per-user cache file, shared by every download folder"""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'youtube-audio-downloader', CACHE_FILENAME)
+
+
+def normalize_url(url):
+    """Drop fragments and tracking parameters and lowercase the scheme and host"""
+    parts = urlsplit(url.strip())
+    query = [(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+             if name not in _TRACKING_PARAMS and not name.startswith('utm_')]
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, urlencode(query), ''))
+
+
+def cache_key(url, ie_key=None, noplaylist=False):
+    """Cache key for a URL: yt-dlp's '<extractor> <id>' when the ID is known without a request"""
+    from yt_dlp.extractor import gen_extractor_classes, get_info_extractor
+
+    global _extractor_classes
+    url = normalize_url(url)
+    if ie_key:
+        candidates = [get_info_extractor(ie_key)]
+    else:
+        if _extractor_classes is None:
+            _extractor_classes = list(gen_extractor_classes())
+        candidates = _extractor_classes
+
+    key = url
+    for ie in candidates:
+        if ie.ie_key() == 'Generic':
+            break
+        if ie.suitable(url):
+            temp_id = ie.get_temp_id(url)
+            if temp_id:
+                key = make_archive_id(ie.ie_key(), temp_id)
+            break
+    # The same URL resolves differently when playlists are disabled
+    return f"{key} noplaylist" if noplaylist else key
+
+
+def _format_expiry(info):
+    """Earliest 'expire' timestamp among the signed format URLs, or None"""
+    expiry = None
+    for fmt in info.get('formats') or []:
+        for name, value in parse_qsl(urlsplit(fmt.get('url') or '').query):
+            if name == 'expire' and value.isdigit():
+                expiry = min(expiry or int(value), int(value))
+    return expiry
+
+
+class CachedMetadata:
+    """One cache row; info is None once the stored extraction result has expired"""
+
+    def __init__(self, kind, archive_id, title, duration, info):
+        self.kind = kind
+        self.archive_id = archive_id
+        self.title = title
+        self.duration = duration
+        self.info = info
+
+
+class MetadataCache:
+    """Thread-safe, size-bounded cache of extract_info results"""
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path or default_cache_path()
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS metadata ("
+            " key TEXT PRIMARY KEY,"
+            " kind TEXT NOT NULL,"
+            " archive_id TEXT,"
+            " title TEXT,"
+            " duration REAL,"
+            " info BLOB,"
+            " info_expires REAL NOT NULL,"
+            " fetched_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL,"
+            " size INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS metadata_accessed ON metadata (accessed_at)")
+        self.prune()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM metadata").fetchone()[0]
+
+    def get(self, key):
+        """Return the CachedMetadata for key, or None if missing or expired"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT kind, archive_id, title, duration, info, info_expires FROM metadata"
+                " WHERE key = ? AND fetched_at > ?",
+                (key, now - self.ttl),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE metadata SET accessed_at = ? WHERE key = ?", (now, key))
+
+        kind, archive_id, title, duration, blob, info_expires = row
+        info = None
+        if blob is not None and info_expires > now:
+            info = json.loads(zlib.decompress(blob))
+        return CachedMetadata(kind, archive_id, title, duration, info)
+
+    def put(self, key, info, entries=None):
+        """Store an extract_info(process=False) result.
+
+        For a playlist, entries is the complete list of its (unprocessed) entries.
+        """
+        from yt_dlp import YoutubeDL
+
+        now = time.time()
+        info = YoutubeDL.sanitize_info(dict(info), remove_private_keys=True)
+        for field in _DROPPED_FIELDS:
+            info.pop(field, None)
+
+        if entries is not None:
+            kind = 'playlist'
+            info['entries'] = [YoutubeDL.sanitize_info(dict(entry), remove_private_keys=True)
+                               if entry else None for entry in entries]
+            info_expires = now + min(PLAYLIST_TTL, self.ttl)
+        else:
+            kind = 'video'
+            info_expires = now + self.ttl
+            format_expiry = _format_expiry(info)
+            if format_expiry:
+                info_expires = min(info_expires, format_expiry - FORMAT_EXPIRY_MARGIN)
+
+        archive_id = None
+        if info.get('extractor_key') and info.get('id'):
+            archive_id = make_archive_id(info['extractor_key'], info['id'])
+        blob = zlib.compress(json.dumps(info, ensure_ascii=False).encode('utf-8'))
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO metadata (key, kind, archive_id, title, duration, info,"
+                " info_expires, fetched_at, accessed_at, size) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, kind, archive_id, info.get('title'), info.get('duration'), blob,
+                 info_expires, now, now, len(blob)),
+            )
+            self._evict()
+
+    def discard(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM metadata WHERE key = ?", (key,))
+
+    def _evict(self):
+        """Drop least recently used rows until the cache fits in max_bytes (lock held)"""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM metadata").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM metadata ORDER BY accessed_at"):
+            if total <= self.max_bytes:
+                break
+            victims.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM metadata WHERE key = ?", victims)
+
+    def prune(self):
+        """Delete rows older than the TTL; returns how many were removed"""
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute("DELETE FROM metadata WHERE fetched_at <= ?", (time.time() - self.ttl,))
+            return self._conn.total_changes - before
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,260 @@
+"""
+Métricas de rendimiento por etapa
+Mide el tiempo de extracción, descarga, conversión y escritura en disco de cada
+elemento, los bytes por segundo, la profundidad de las colas y la ocupación de
+los hilos, para saber si un lote está limitado por la red, la CPU o el sitio
+remoto. Las métricas se muestran en la interfaz y se exportan en el formato de
+texto de Prometheus, a un archivo o en un endpoint local.
+"""
+
+import collections
+import os
+import threading
+import time
+
+EXTRACT = 'extract'
+DOWNLOAD = 'download'
+POSTPROCESS = 'postprocess'
+WRITE = 'write'
+STAGES = (EXTRACT, DOWNLOAD, POSTPROCESS, WRITE)
+
+STAGE_LABELS = {
+    EXTRACT: 'Extracción',
+    DOWNLOAD: 'Descarga',
+    POSTPROCESS: 'Conversión',
+    WRITE: 'Escritura',
+}
+
+# Histogram bucket bounds in seconds, from a cached lookup to an hour-long download
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900, 3600)
+
+# Throughput is averaged over this many seconds
+RATE_WINDOW = 10.0
+
+PREFIX = 'ytaudio'
+DEFAULT_METRICS_PORT = 9464
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for position, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[position] += 1
+                break
+
+
+class Metrics:
+    """Thread-safe registry of stage timings, byte counters and live gauges"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {stage: _Histogram() for stage in STAGES}
+        self._items = collections.Counter()
+        self._bytes = 0
+        self._samples = collections.deque()  # (monotonic time, bytes) for the throughput window
+        self._gauges = {}
+        self._local = threading.local()
+
+    # Recording
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            self._stages[stage].observe(seconds)
+
+    def time(self, stage):
+        """Context manager that observes the duration of its block"""
+        return _StageTimer(self, stage)
+
+    def count_item(self, result):
+        """result is 'success', 'error' or 'skipped'"""
+        with self._lock:
+            self._items[result] += 1
+
+    def track_progress(self, d):
+        """Count the bytes received since this thread's previous yt-dlp progress tick"""
+        filename = d.get('tmpfilename') or d.get('filename')
+        downloaded = d.get('downloaded_bytes') or 0
+        last_file, last_bytes = getattr(self._local, 'last', (None, 0))
+        self._local.last = (filename, downloaded)
+        if filename == last_file and downloaded > last_bytes:
+            self.add_bytes(downloaded - last_bytes)
+
+    def add_bytes(self, nbytes):
+        now = time.monotonic()
+        with self._lock:
+            self._bytes += nbytes
+            self._samples.append((now, nbytes))
+            self._trim(now)
+
+    def _trim(self, now):
+        while self._samples and self._samples[0][0] < now - RATE_WINDOW:
+            self._samples.popleft()
+
+    def set_gauge(self, name, source):
+        """Register a callable returning the gauge's current value (None unregisters it)"""
+        with self._lock:
+            if source is None:
+                self._gauges.pop(name, None)
+            else:
+                self._gauges[name] = source
+
+    # Reading
+
+    def bytes_per_second(self):
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            return sum(nbytes for _, nbytes in self._samples) / RATE_WINDOW
+
+    def gauges(self):
+        with self._lock:
+            sources = dict(self._gauges)
+        values = {}
+        for name, source in sources.items():
+            try:
+                values[name] = source()
+            except Exception:
+                # A gauge whose owner just closed; skip it this round
+                continue
+        return values
+
+    def snapshot(self):
+        """Plain dict for the GUI: per-stage count/mean, items, bytes, rate and gauges"""
+        rate = self.bytes_per_second()
+        with self._lock:
+            stages = {stage: {'count': histogram.count,
+                              'mean': histogram.sum / histogram.count if histogram.count else None}
+                      for stage, histogram in self._stages.items()}
+            items = dict(self._items)
+            total_bytes = self._bytes
+        return {'stages': stages, 'items': items, 'bytes': total_bytes,
+                'bytes_per_second': rate, 'gauges': self.gauges()}
+
+    def render_prometheus(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        rate = self.bytes_per_second()
+        gauges = self.gauges()
+        lines = []
+        with self._lock:
+            lines += [f"# HELP {PREFIX}_stage_seconds Time spent per item in each pipeline stage.",
+                      f"# TYPE {PREFIX}_stage_seconds histogram"]
+            for stage, histogram in self._stages.items():
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{PREFIX}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{PREFIX}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{PREFIX}_stage_seconds_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+                lines.append(f'{PREFIX}_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+            lines += [f"# HELP {PREFIX}_items_total Finished URLs by result; skipped ones also count as success.",
+                      f"# TYPE {PREFIX}_items_total counter"]
+            for result in ('success', 'error', 'skipped'):
+                lines.append(f'{PREFIX}_items_total{{result="{result}"}} {self._items[result]}')
+
+            lines += [f"# HELP {PREFIX}_downloaded_bytes_total Bytes received from remote hosts.",
+                      f"# TYPE {PREFIX}_downloaded_bytes_total counter",
+                      f"{PREFIX}_downloaded_bytes_total {self._bytes}"]
+
+        lines += [f"# HELP {PREFIX}_download_bytes_per_second Throughput over the last {RATE_WINDOW:g} seconds.",
+                  f"# TYPE {PREFIX}_download_bytes_per_second gauge",
+                  f"{PREFIX}_download_bytes_per_second {rate:.1f}"]
+        for name, value in sorted(gauges.items()):
+            lines += [f"# TYPE {PREFIX}_{name} gauge", f"{PREFIX}_{name} {value}"]
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path):
+        """Atomically write the metrics for node_exporter's textfile collector"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.write(self.render_prometheus())
+        os.replace(tmp_path, path)
+
+
+class _StageTimer:
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.stage, time.perf_counter() - self.started)
+
+
+class MetricsExporter:
+    """Rewrite a Prometheus textfile periodically and/or serve /metrics on localhost"""
+
+    def __init__(self, metrics, path=None, port=None, interval=5.0, host='127.0.0.1'):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._threads = []
+        self._server = None
+        if port:
+            # Imported here so the GUI, which never serves metrics, starts without http.server
+            from http.server import ThreadingHTTPServer
+            self._server = ThreadingHTTPServer((host, port), _metrics_handler(metrics))
+            self._server.daemon_threads = True
+
+    def start(self):
+        if self.path:
+            self._spawn(self._write_loop, "metrics-textfile")
+        if self._server:
+            self._spawn(self._server.serve_forever, "metrics-http")
+        return self
+
+    def _spawn(self, target, name):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _write_loop(self):
+        while not self._stop.wait(self.interval):
+            self._write()
+
+    def _write(self):
+        try:
+            self.metrics.write_textfile(self.path)
+        except OSError:
+            pass
+
+    def close(self):
+        self._stop.set()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        if self.path:
+            # Final values, so a finished batch is not reported as still running
+            self._write()
+
+
+def _metrics_handler(metrics):
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.render_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MetricsHandler
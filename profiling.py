@@ -0,0 +1,173 @@
+"""
+Perfilado de lotes
+Modo de diagnóstico opcional que registra estadísticas de cProfile y capturas
+de tracemalloc durante un lote y las guarda junto a los audios descargados, con
+un resumen de las funciones más costosas, los sitios que más memoria asignan y
+la parte del tiempo dedicada a actualizar la interfaz Tk frente al resto.
+"""
+
+import cProfile
+import datetime
+import importlib.util
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+# Rows in each top-N table of the summary
+DEFAULT_TOP = 25
+# Stack depth kept per allocation; deeper traces make tracing noticeably slower
+TRACEMALLOC_FRAMES = 5
+
+# Since Python 3.12 cProfile is built on sys.monitoring: one profiler covers
+# every thread, and only one may be active in the process
+_GLOBAL_PROFILER = sys.version_info >= (3, 12)
+
+# Located without importing it, so the CLI stays free of tkinter
+_TKINTER_SPEC = importlib.util.find_spec('tkinter')
+_TKINTER_DIR = os.path.dirname(os.path.abspath(_TKINTER_SPEC.origin)) if _TKINTER_SPEC else None
+
+
+def _is_ui_function(key, ui_files):
+    """True for Tk and GUI-module code, including the C calls into the Tcl interpreter"""
+    filename, _, name = key
+    if filename == '~':
+        return '_tkinter' in name
+    filename = os.path.abspath(filename)
+    return (_TKINTER_DIR is not None and filename.startswith(_TKINTER_DIR)) or filename in ui_files
+
+
+def describe(result):
+    """One-line summary of BatchProfiler.stop()'s result for the log"""
+    return (f"📊 Perfil guardado en {os.path.basename(result['report'])} "
+            f"(interfaz Tk {result['ui_share']:.1%}, memoria máx. {result['peak_bytes'] / 1024 / 1024:.1f} MB)")
+
+
+class BatchProfiler:
+    """cProfile + tracemalloc recording of one batch.
+
+    start() and stop() must be called on the same thread (the Tk thread in the
+    GUI). Worker threads take part by running their tasks through profiled();
+    the FFmpeg conversions run in separate processes and are not included.
+    """
+
+    def __init__(self, directory, ui_files=(), top=DEFAULT_TOP):
+        self.directory = directory
+        self.ui_files = {os.path.abspath(path) for path in ui_files}
+        self.top = top
+        self._profiles = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._main = None
+        self._baseline = None
+        self._owns_tracemalloc = False
+        self._started = None
+        self._started_at = None
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._started_at = datetime.datetime.now()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._owns_tracemalloc = True
+        tracemalloc.reset_peak()
+        self._baseline = tracemalloc.take_snapshot()
+        self._main = self._new_profile()
+        self._main.enable()
+        return self
+
+    def _new_profile(self):
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        return profile
+
+    def profiled(self, fn, *args):
+        """Call fn(*args), recording it in this thread's profile"""
+        if _GLOBAL_PROFILER or getattr(self._local, 'active', False):
+            return fn(*args)
+        profile = getattr(self._local, 'profile', None)
+        if profile is None:
+            profile = self._local.profile = self._new_profile()
+        self._local.active = True
+        profile.enable()
+        try:
+            return fn(*args)
+        finally:
+            profile.disable()
+            self._local.active = False
+
+    def stop(self):
+        """Stop recording and write the reports; returns a dict with their paths and headline numbers"""
+        self._main.disable()
+        duration = time.perf_counter() - self._started
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+
+        with self._lock:
+            profiles = list(self._profiles)
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, f"perfil-{self._started_at:%Y%m%d-%H%M%S}")
+        stats.dump_stats(f"{base}.prof")
+        snapshot.dump(f"{base}.tracemalloc")
+
+        ui_seconds, total_seconds = self._ui_split(stats)
+        ui_share = ui_seconds / total_seconds if total_seconds else 0.0
+        with open(f"{base}.txt", 'w', encoding='utf-8') as file:
+            file.write(self._summary(stats, snapshot, duration, peak, len(profiles), ui_seconds, total_seconds))
+
+        return {'report': f"{base}.txt", 'stats': f"{base}.prof", 'snapshot': f"{base}.tracemalloc",
+                'duration': duration, 'peak_bytes': peak, 'ui_share': ui_share}
+
+    def _ui_split(self, stats):
+        """(seconds in Tk/GUI code, seconds in all profiled code), by own time per function"""
+        ui_seconds = total_seconds = 0.0
+        for key, (_, _, own_time, _, _) in stats.stats.items():
+            total_seconds += own_time
+            if _is_ui_function(key, self.ui_files):
+                ui_seconds += own_time
+        return ui_seconds, total_seconds
+
+    def _summary(self, stats, snapshot, duration, peak, threads, ui_seconds, total_seconds):
+        lines = [
+            f"Perfil del lote iniciado el {self._started_at:%Y-%m-%d %H:%M:%S}",
+            f"Duración: {duration:.1f} s | Memoria máxima (tracemalloc): {peak / 1024 / 1024:.1f} MB"
+            f" | Hilos perfilados: {threads}",
+            "",
+            "Tiempo propio por tipo de código (los hilos en paralelo suman, y las esperas de red cuentan)",
+        ]
+        if total_seconds:
+            other = total_seconds - ui_seconds
+            lines += [f"  Interfaz Tk: {ui_seconds:.2f} s ({ui_seconds / total_seconds:.1%})",
+                      f"  Resto (descarga, extracción, esperas): {other:.2f} s ({other / total_seconds:.1%})"]
+        lines.append("")
+
+        for title, order in (("Funciones con más tiempo propio", 'tottime'),
+                             ("Funciones con más tiempo acumulado", 'cumulative')):
+            stream = io.StringIO()
+            stats.stream = stream
+            stats.sort_stats(order).print_stats(self.top)
+            # Skip pstats' own header lines up to the table
+            table = stream.getvalue()
+            table = table[table.find('   ncalls'):] if '   ncalls' in table else table
+            lines += [f"== {title} (top {self.top}) ==", table.rstrip(), ""]
+
+        lines.append(f"== Sitios con más memoria asignada durante el lote (top {self.top}) ==")
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__),
+                   tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+                   tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>')]
+        differences = snapshot.filter_traces(filters).compare_to(self._baseline.filter_traces(filters), 'lineno')
+        for difference in differences[:self.top]:
+            frame = difference.traceback[0]
+            lines.append(f"  {frame.filename}:{frame.lineno}: {difference.size_diff / 1024:+.1f} KB "
+                         f"({difference.count_diff:+d} bloques, {difference.size / 1024:.1f} KB en uso)")
+        return '\n'.join(lines) + '\n'
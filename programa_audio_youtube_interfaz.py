@@ -5,19 +5,30 @@ YouTube Audio Downloader Pro
 Aplicación moderna para descargar audio de YouTube con interfaz responsive
 """
 
-import yt_dlp
+import time
+
+# Startup is timed from here; yt-dlp and the download engine are loaded after the window is up
+STARTED = time.perf_counter()
+
 import os
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-from threading import Thread
+from threading import Thread, Lock
 import datetime
 
-# Fallback para dependencias opcionales
-try:
-    import tkinterdnd2 as tkdnd
-    DND_AVAILABLE = True
-except ImportError:
-    DND_AVAILABLE = False
+from download_scheduler import DEFAULT_WORKERS, MAX_WORKERS
+from transcoder import FORMATS
+from rate_limiter import DEFAULT_REQUEST_INTERVAL, DEFAULT_CONNECTIONS, MAX_CONNECTIONS
+from job_journal import JobJournal
+from url_ingest import MANIFEST_EXTENSIONS
+from warmup import Warmup
+from metrics import Metrics, STAGES, STAGE_LABELS
+from profiling import BatchProfiler, describe
+from log_pipeline import LogQueue, FLUSH_INTERVAL_MS, MAX_LOG_LINES
+from job_table import JobTable, JobTableModel
+
+# The stats panel is refreshed this often
+METRICS_REFRESH_MS = 1000
 
 class ModernYouTubeDownloader:
     def __init__(self, root):
@@ -27,14 +38,47 @@ class ModernYouTubeDownloader:
         # Initialize variables
         self.quality_var = tk.StringVar(value="192")
         self.format_var = tk.StringVar(value="mp3")
+        # Extra formats made from the same download (one subfolder per format)
+        self.extra_format_vars = {fmt: tk.BooleanVar(value=False) for fmt in FORMATS}
         self.download_playlist_var = tk.BooleanVar(value=True)
         self.skip_existing_var = tk.BooleanVar(value=True)
         self.retry_var = tk.IntVar(value=3)
+        self.concurrency_var = tk.IntVar(value=DEFAULT_WORKERS)
+        self.connections_var = tk.IntVar(value=DEFAULT_CONNECTIONS)
+        self.rate_limit_var = tk.IntVar(value=0)
+        self.worker_rate_limit_var = tk.IntVar(value=0)
+        self.request_interval_var = tk.DoubleVar(value=DEFAULT_REQUEST_INTERVAL)
+        self.profile_var = tk.BooleanVar(value=False)
+        self.replaygain_var = tk.BooleanVar(value=False)
+        for var in (self.rate_limit_var, self.worker_rate_limit_var, self.request_interval_var):
+            var.trace_add('write', lambda *args: self.apply_network_limits())
+        self.engine = None
+        # Kept across batches so the stats panel shows the whole session
+        self.metrics = Metrics()
+        # BatchProfiler of the running batch when profiling is enabled
+        self.profiler = None
+        
+        self.log_queue = LogQueue()
+        # Per-item rows of the job table, updated from worker threads
+        self.job_model = JobTableModel()
+        
+        # Batch progress, updated from worker threads and shown by the flush_log tick
+        self.progress_lock = Lock()
+        self.batch_total = 0
+        self.batch_completed = 0
+        self.playlist_progress = {}
+        self.progress_changed = False
+        self.pending_stats = None
+        self.batch_finished = False
+        
+        # Drag & drop and the download engine are loaded once the window is shown
+        self.dnd_available = False
+        self.warmup = Warmup(on_ready=self.on_warmup_ready, on_extractor=self.on_extractor_loaded)
         
         self.setup_window()
         self.create_widgets()
-        if DND_AVAILABLE:
-            self.setup_drag_drop()
+        self.root.after(FLUSH_INTERVAL_MS, self.flush_log)
+        self.root.after(METRICS_REFRESH_MS, self.update_metrics_panel)
         
     def setup_window(self):
         """Configure main window"""
@@ -93,6 +137,7 @@ class ModernYouTubeDownloader:
         self.url_entry = ttk.Entry(input_frame, textvariable=self.url_var, font=('Arial', 10))
         self.url_entry.grid(row=0, column=1, sticky="ew", padx=(0, 10))
         self.url_var.trace('w', lambda *args: self.update_download_button_state())
+        self.url_var.trace('w', lambda *args: self.warmup.prime_for(self.url_var.get()))
         
         ttk.Button(input_frame, text="📋 Pegar", command=self.paste_from_clipboard).grid(row=0, column=2)
         
@@ -105,12 +150,9 @@ class ModernYouTubeDownloader:
         self.drop_frame.grid(row=2, column=0, columnspan=3, sticky="ew", pady=(15, 0))
         self.drop_frame.grid_propagate(False)
         
-        drop_text = "🎯 Arrastra archivos de texto aquí"
-        if not DND_AVAILABLE:
-            drop_text += " (Drag & Drop no disponible)"
-            
-        tk.Label(self.drop_frame, text=drop_text, bg='#E3F2FD', 
-                font=('Arial', 9)).place(relx=0.5, rely=0.5, anchor='center')
+        self.drop_label = tk.Label(self.drop_frame, text="🎯 Arrastra archivos de texto aquí", bg='#E3F2FD',
+                                   font=('Arial', 9))
+        self.drop_label.place(relx=0.5, rely=0.5, anchor='center')
         
         # Control buttons
         control_frame = ttk.Frame(main_frame)
@@ -131,7 +173,7 @@ class ModernYouTubeDownloader:
         # Progress section
         progress_frame = ttk.LabelFrame(main_frame, text="📊 Progreso y Estado", padding="15")
         progress_frame.grid(row=3, column=0, sticky="nsew", pady=(0, 15))
-        progress_frame.grid_rowconfigure(2, weight=1)
+        progress_frame.grid_rowconfigure(3, weight=1)
         progress_frame.grid_columnconfigure(0, weight=1)
         
         # Folder path display
@@ -144,9 +186,24 @@ class ModernYouTubeDownloader:
         self.progress_bar = ttk.Progressbar(progress_frame, variable=self.progress_var, maximum=100)
         self.progress_bar.grid(row=1, column=0, sticky="ew", pady=(0, 10))
         
-        # Status text
-        status_frame = ttk.Frame(progress_frame)
-        status_frame.grid(row=2, column=0, sticky="nsew")
+        # Live stats: throughput, queues and time per stage
+        metrics_frame = ttk.Frame(progress_frame)
+        metrics_frame.grid(row=2, column=0, sticky="ew", pady=(0, 10))
+        self.throughput_var = tk.StringVar(value="⚡ 0 KB/s | Cola: 0 | Hilos: 0/0 | FFmpeg: 0 en cola")
+        self.stage_times_var = tk.StringVar(value="⏱️ Sin datos todavía")
+        ttk.Label(metrics_frame, textvariable=self.throughput_var, font=('Arial', 9)).pack(anchor=tk.W)
+        ttk.Label(metrics_frame, textvariable=self.stage_times_var, font=('Arial', 9),
+                  foreground='gray').pack(anchor=tk.W)
+        
+        # Per-item table and log, one tab each
+        notebook = ttk.Notebook(progress_frame)
+        notebook.grid(row=3, column=0, sticky="nsew")
+        
+        self.job_table = JobTable(notebook, self.job_model, padding=5)
+        notebook.add(self.job_table, text="📋 Elementos")
+        
+        status_frame = ttk.Frame(notebook, padding=5)
+        notebook.add(status_frame, text="📝 Registro")
         status_frame.grid_rowconfigure(0, weight=1)
         status_frame.grid_columnconfigure(0, weight=1)
         
@@ -161,21 +218,28 @@ class ModernYouTubeDownloader:
         # Footer
         footer_frame = ttk.Frame(main_frame)
         footer_frame.grid(row=4, column=0, sticky="ew")
-        footer_frame.grid_columnconfigure((0, 1), weight=1)
+        footer_frame.grid_columnconfigure((0, 2), weight=1)
         
         self.stats_label = ttk.Label(footer_frame, text="📈 Descargas: 0 | Exitosas: 0 | Errores: 0",
                                     font=('Arial', 9))
         self.stats_label.grid(row=0, column=0, sticky="w")
         
-        ttk.Label(footer_frame, text="v2.0 Pro", font=('Arial', 9)).grid(row=0, column=1, sticky="e")
+        ttk.Button(footer_frame, text="📤 Exportar métricas",
+                   command=self.export_metrics).grid(row=0, column=1, padx=(10, 10))
+        ttk.Label(footer_frame, text="v2.0 Pro", font=('Arial', 9)).grid(row=0, column=2, sticky="e")
         
     def setup_drag_drop(self):
-        """Setup drag and drop functionality"""
+        """Load tkdnd into the running Tk root and register the drop area; False if unavailable"""
         try:
-            self.drop_frame.drop_target_register(tkdnd.DND_FILES)
+            import tkinterdnd2
+            # What tkinterdnd2.Tk() does at construction, done after the window is shown
+            self.root.TkdndVersion = tkinterdnd2.TkinterDnD._require(self.root)
+            self.drop_frame.drop_target_register(tkinterdnd2.DND_FILES)
             self.drop_frame.dnd_bind('<<Drop>>', self.on_drop)
-        except:
-            pass
+        except (ImportError, AttributeError, RuntimeError, tk.TclError):
+            self.drop_label.config(text="🎯 Arrastra archivos de texto aquí (Drag & Drop no disponible)")
+            return False
+        return True
             
     def paste_from_clipboard(self):
         """Paste URL from clipboard"""
@@ -190,7 +254,8 @@ class ModernYouTubeDownloader:
         """Choose a file containing URLs"""
         file_path = filedialog.askopenfilename(
             title="Seleccionar archivo con URLs",
-            filetypes=[("Archivos de texto", "*.txt"), ("Todos los archivos", "*.*")]
+            filetypes=[("Listas de URLs", " ".join(f"*{ext}" for ext in MANIFEST_EXTENSIONS)),
+                       ("Todos los archivos", "*.*")]
         )
         if file_path:
             self.url_var.set(file_path)
@@ -198,17 +263,18 @@ class ModernYouTubeDownloader:
     
     def on_drop(self, event):
         """Handle drag and drop files"""
-        if not DND_AVAILABLE:
+        if not self.dnd_available:
             return
             
         files = self.root.tk.splitlist(event.data)
         if files:
             file_path = files[0]
-            if os.path.isfile(file_path) and file_path.endswith('.txt'):
+            if os.path.isfile(file_path) and file_path.lower().endswith(MANIFEST_EXTENSIONS):
                 self.url_var.set(file_path)
                 self.log_status(f"🎯 Archivo arrastrado: {os.path.basename(file_path)}")
             else:
-                messagebox.showwarning("Advertencia", "Solo se aceptan archivos de texto (.txt)")
+                messagebox.showwarning("Advertencia",
+                                       f"Solo se aceptan listas de URLs ({', '.join(MANIFEST_EXTENSIONS)})")
         
     def choose_folder(self):
         """Choose download folder"""
@@ -218,8 +284,21 @@ class ModernYouTubeDownloader:
             folder_display = folder if len(folder) <= 60 else "..." + folder[-57:]
             self.folder_path_var.set(f"📂 {folder_display}")
             self.log_status(f"📂 Carpeta configurada: {folder}")
+            self.check_unfinished_job()
             self.update_download_button_state()
     
+    def check_unfinished_job(self):
+        """Offer to resume a job interrupted in the selected folder"""
+        journal = JobJournal.for_folder(self.download_folder)
+        # A cli.py job with several inputs cannot be shown in the single input field
+        if not journal.load() or not isinstance(journal.source, str):
+            return
+        pending = len(journal.unfinished())
+        if pending:
+            self.url_var.set(journal.source)
+            self.log_status(f"♻️ Trabajo sin terminar encontrado: {pending} de {len(journal.items)} pendientes. "
+                            "Pulsa Descargar para reanudar")
+    
     def update_download_button_state(self):
         """Update download button state"""
         url_or_file = self.url_var.get().strip()
@@ -231,22 +310,40 @@ class ModernYouTubeDownloader:
         else:
             self.download_btn.config(state='disabled')
     
-    def log_status(self, message):
-        """Log status with timestamp"""
+    def log_status(self, message, progress_key=None):
+        """Log status with timestamp (safe to call from any thread)"""
         timestamp = datetime.datetime.now().strftime("%H:%M:%S")
         formatted_message = f"[{timestamp}] {message}\n"
         
-        self.status_text.config(state=tk.NORMAL)
-        self.status_text.insert(tk.END, formatted_message)
-        self.status_text.see(tk.END)
-        self.status_text.config(state=tk.DISABLED)
-        self.root.update_idletasks()
+        if progress_key is None:
+            self.log_queue.put(formatted_message)
+        else:
+            self.log_queue.put_progress(progress_key, formatted_message)
+    
+    def flush_log(self):
+        """Write queued log lines and the latest progress to the window (Tk main loop timer)"""
+        try:
+            lines = self.log_queue.drain()
+            if lines:
+                self.status_text.config(state=tk.NORMAL)
+                self.status_text.insert(tk.END, ''.join(lines))
+                
+                # Cap the buffer so long sessions don't grow without bound
+                line_count = int(self.status_text.index('end-1c').split('.')[0])
+                if line_count > MAX_LOG_LINES:
+                    self.status_text.delete('1.0', f'{line_count - MAX_LOG_LINES + 1}.0')
+                
+                self.status_text.see(tk.END)
+                self.status_text.config(state=tk.DISABLED)
+            self.apply_progress()
+        finally:
+            self.root.after(FLUSH_INTERVAL_MS, self.flush_log)
     
     def show_settings(self):
         """Show settings dialog"""
         settings_window = tk.Toplevel(self.root)
         settings_window.title("⚙️ Configuración Avanzada")
-        settings_window.geometry("450x400")
+        settings_window.geometry("450x750")
         settings_window.transient(self.root)
         settings_window.grab_set()
         
@@ -254,7 +351,7 @@ class ModernYouTubeDownloader:
         settings_window.update_idletasks()
         x = self.root.winfo_x() + 50
         y = self.root.winfo_y() + 50
-        settings_window.geometry(f"450x400+{x}+{y}")
+        settings_window.geometry(f"450x750+{x}+{y}")
         
         main_frame = ttk.Frame(settings_window, padding="20")
         main_frame.pack(fill=tk.BOTH, expand=True)
@@ -281,6 +378,16 @@ class ModernYouTubeDownloader:
         ttk.Radiobutton(format_frame, text="OGG (Open Source)", 
                        variable=self.format_var, value="ogg").pack(anchor=tk.W)
         
+        extra_frame = ttk.Frame(format_frame)
+        extra_frame.pack(anchor=tk.W, pady=(5, 0))
+        ttk.Label(extra_frame, text="Generar también:").pack(side=tk.LEFT)
+        for fmt in FORMATS:
+            ttk.Checkbutton(extra_frame, text=fmt.upper(),
+                           variable=self.extra_format_vars[fmt]).pack(side=tk.LEFT, padx=(5, 0))
+        
+        ttk.Checkbutton(format_frame, text="🔊 Etiquetas ReplayGain (mismo volumen en todas las pistas)",
+                       variable=self.replaygain_var).pack(anchor=tk.W, pady=(5, 0))
+        
         # Advanced options
         advanced_frame = ttk.LabelFrame(main_frame, text="🔧 Opciones Avanzadas", padding="10")
         advanced_frame.pack(fill=tk.X, pady=(0, 10))
@@ -303,6 +410,36 @@ class ModernYouTubeDownloader:
                  orient=tk.HORIZONTAL).pack(side=tk.LEFT, fill=tk.X, expand=True)
         ttk.Label(retry_frame, textvariable=self.retry_var).pack(side=tk.RIGHT, padx=(5, 0))
         
+        ttk.Label(advanced_frame, text="Descargas simultáneas:").pack(anchor=tk.W, pady=(10, 0))
+        
+        concurrency_frame = ttk.Frame(advanced_frame)
+        concurrency_frame.pack(fill=tk.X, pady=(5, 0))
+        
+        ttk.Scale(concurrency_frame, from_=1, to=MAX_WORKERS, variable=self.concurrency_var, 
+                 orient=tk.HORIZONTAL).pack(side=tk.LEFT, fill=tk.X, expand=True)
+        ttk.Label(concurrency_frame, textvariable=self.concurrency_var).pack(side=tk.RIGHT, padx=(5, 0))
+        
+        ttk.Checkbutton(advanced_frame, text="Perfilar rendimiento (informe en la carpeta de descarga)",
+                       variable=self.profile_var).pack(anchor=tk.W, pady=(10, 0))
+        
+        # Network limits (applied live to a running download)
+        network_frame = ttk.LabelFrame(main_frame, text="🌐 Red (0 = sin límite)", padding="10")
+        network_frame.pack(fill=tk.X, pady=(0, 10))
+        network_frame.grid_columnconfigure(0, weight=1)
+        
+        ttk.Label(network_frame, text="Ancho de banda total (KB/s):").grid(row=0, column=0, sticky="w")
+        ttk.Spinbox(network_frame, from_=0, to=100000, increment=100, width=8,
+                    textvariable=self.rate_limit_var).grid(row=0, column=1, sticky="e")
+        ttk.Label(network_frame, text="Ancho de banda por descarga (KB/s):").grid(row=1, column=0, sticky="w", pady=(5, 0))
+        ttk.Spinbox(network_frame, from_=0, to=100000, increment=100, width=8,
+                    textvariable=self.worker_rate_limit_var).grid(row=1, column=1, sticky="e", pady=(5, 0))
+        ttk.Label(network_frame, text="Pausa entre peticiones al mismo sitio (s):").grid(row=2, column=0, sticky="w", pady=(5, 0))
+        ttk.Spinbox(network_frame, from_=0, to=30, increment=0.5, width=8,
+                    textvariable=self.request_interval_var).grid(row=2, column=1, sticky="e", pady=(5, 0))
+        ttk.Label(network_frame, text="Conexiones máx. por audio largo:").grid(row=3, column=0, sticky="w", pady=(5, 0))
+        ttk.Spinbox(network_frame, from_=1, to=MAX_CONNECTIONS, increment=1, width=8,
+                    textvariable=self.connections_var).grid(row=3, column=1, sticky="e", pady=(5, 0))
+        
         # Buttons
         button_frame = ttk.Frame(main_frame)
         button_frame.pack(fill=tk.X, pady=(20, 0))
@@ -331,121 +468,148 @@ class ModernYouTubeDownloader:
         self.status_text.config(state=tk.NORMAL)
         self.status_text.delete(1.0, tk.END)
         self.status_text.config(state=tk.DISABLED)
+        self.job_model.clear()
         
         self.log_status("🚀 Iniciando descarga...")
         
+        # Started here so the Tk thread's own work is part of the profile
+        if self.profile_var.get():
+            self.profiler = BatchProfiler(self.download_folder, ui_files=(__file__,)).start()
+        
         # Start download thread
         download_thread = Thread(target=self.download_videos, args=(url_or_file,))
         download_thread.daemon = True
         download_thread.start()
 
     def download_videos(self, url_or_file):
-        """Download videos function"""
+        """Download videos function (runs the engine on a background thread)"""
+        try:
+            # Usually already imported by the warm-up; otherwise waits for it
+            from download_engine import DownloadEngine, DownloadSettings
+        except Exception as e:
+            self.log_status(f"❌ Error crítico: no se pudo cargar el motor de descarga: {str(e)}")
+            self.finish_batch()
+            return
+        settings = DownloadSettings(
+            self.download_folder,
+            quality=self.quality_var.get(),
+            format_ext=self.format_var.get(),
+            download_playlist=self.download_playlist_var.get(),
+            skip_existing=self.skip_existing_var.get(),
+            retries=self.retry_var.get(),
+            concurrency=self.concurrency_var.get(),
+            connections=max(1, min(self.connections_var.get(), MAX_CONNECTIONS)),
+            extra_outputs=[(fmt, self.quality_var.get()) for fmt, var in self.extra_format_vars.items()
+                           if var.get()],
+            replaygain=self.replaygain_var.get(),
+        )
+        limits = self.network_limits()
+        if limits:
+            settings.rate_limit, settings.worker_rate_limit, settings.request_interval = limits
         try:
-            # Get URLs
-            video_urls = []
-            if os.path.isfile(url_or_file):
-                self.log_status(f"📄 Leyendo archivo: {os.path.basename(url_or_file)}")
-                with open(url_or_file, 'r', encoding='utf-8') as file:
-                    video_urls = [line.strip() for line in file.readlines() if line.strip()]
+            self.engine = DownloadEngine(settings, on_event=self.on_engine_event, metrics=self.metrics,
+                                         profiler=self.profiler)
+            if self.profiler:
+                self.profiler.profiled(self.engine.run, url_or_file)
             else:
-                video_urls = [url_or_file]
-            
-            if not video_urls:
-                self.log_status("❌ No se encontraron URLs válidas")
-                return
-            
-            self.log_status(f"📋 Total URLs: {len(video_urls)}")
-            
-            # Get settings
-            quality = self.quality_var.get()
-            format_ext = self.format_var.get()
-            download_playlist = self.download_playlist_var.get()
-            
-            # yt-dlp options
-            ydl_opts = {
-                'format': 'bestaudio/best',
-                'outtmpl': os.path.join(
-                    self.download_folder, 
-                    '%(playlist_index)02d - %(title)s.%(ext)s' if download_playlist 
-                    else '%(title)s.%(ext)s'
-                ),
-                'noplaylist': not download_playlist,
-                'ignoreerrors': True,
-                'progress_hooks': [self.progress_hook],
-                'postprocessors': [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': format_ext,
-                    'preferredquality': quality,
-                }],
-                'retries': self.retry_var.get(),
-                'socket_timeout': 30,
-            }
-            
-            # Statistics
-            total_count = len(video_urls)
-            success_count = 0
-            error_count = 0
-            
-            # Download each URL
-            for i, url in enumerate(video_urls, 1):
-                try:
-                    self.log_status(f"🎵 [{i}/{total_count}] Procesando: {url[:50]}...")
-                    
-                    # Check if playlist
-                    with yt_dlp.YoutubeDL({'quiet': True, 'extract_flat': True}) as ydl:
-                        try:
-                            info_dict = ydl.extract_info(url, download=False)
-                            if 'entries' in info_dict:
-                                playlist_title = info_dict.get('title', 'Unknown Playlist')
-                                entry_count = len(list(info_dict['entries']))
-                                if download_playlist:
-                                    self.log_status(f"🎼 Playlist: '{playlist_title}' ({entry_count} elementos) - Descargando todos")
-                                else:
-                                    self.log_status(f"🎼 Playlist: '{playlist_title}' ({entry_count} elementos) - Solo el primero")
-                            else:
-                                video_title = info_dict.get('title', 'Unknown Video')
-                                self.log_status(f"🎵 Video: '{video_title}'")
-                        except Exception as e:
-                            self.log_status(f"⚠️ No se pudo obtener info previa: {str(e)}")
-                    
-                    # Download
-                    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                        ydl.download([url])
-                        success_count += 1
-                        self.log_status(f"✅ Descarga exitosa")
-                        
-                except Exception as e:
-                    error_count += 1
-                    self.log_status(f"❌ Error: {str(e)}")
-                
-                # Update progress
-                progress = (i / total_count) * 100
-                self.progress_var.set(progress)
-                self.root.update_idletasks()
-            
-            # Final status
-            self.log_status(f"🎉 Completado! Exitosas: {success_count}, Errores: {error_count}")
-            self.update_stats(total_count, success_count, error_count)
-            
+                self.engine.run(url_or_file)
         except Exception as e:
             self.log_status(f"❌ Error crítico: {str(e)}")
         finally:
-            self.root.after(0, self.reset_download_button)
+            self.engine = None
+            self.finish_batch()
+
+    def finish_batch(self):
+        """Let the flush_log tick reset the button once the batch thread ends"""
+        with self.progress_lock:
+            self.batch_finished = True
     
-    def progress_hook(self, d):
-        """Progress hook for yt-dlp"""
-        if d['status'] == 'downloading':
-            try:
-                filename = os.path.basename(d.get('filename', 'Unknown'))
-                percent = d.get('_percent_str', '0%')
-                speed = d.get('_speed_str', 'N/A')
-                self.log_status(f"⬇️ {filename}: {percent} a {speed}")
-            except:
-                pass
-        elif d['status'] == 'finished':
-            filename = os.path.basename(d.get('filename', 'Unknown'))
-            self.log_status(f"✅ Completado: {filename}")
+    def network_limits(self):
+        """Current (total KB/s, per-download KB/s, seconds between requests) from the settings"""
+        try:
+            return (max(0, self.rate_limit_var.get()), max(0, self.worker_rate_limit_var.get()),
+                    max(0.0, self.request_interval_var.get()))
+        except (tk.TclError, ValueError):
+            # Spinbox is mid-edit (e.g. empty); keep the previous limits
+            return None
+    
+    def apply_network_limits(self):
+        """Push edited limits to a running download"""
+        limits = self.network_limits()
+        engine = self.engine
+        if engine and limits:
+            engine.update_limits(*limits)
+            self.log_status(f"🌐 Límites actualizados: total {limits[0] or '∞'} KB/s, "
+                            f"por descarga {limits[1] or '∞'} KB/s, pausa {limits[2]} s")
+    
+    def on_engine_event(self, event):
+        """Show engine events in the UI (called from worker threads)"""
+        kind = event['event']
+        self.job_model.handle_event(event)
+        if kind == 'progress':
+            self.log_status(event['message'], progress_key=event['filename'])
+            return
+        if kind == 'file_done':
+            self.log_queue.clear_progress(event['filename'])
+        
+        if event['message']:
+            self.log_status(event['message'])
+        
+        if kind == 'batch_start':
+            with self.progress_lock:
+                self.batch_total = event['total']
+                self.batch_completed = event['total'] - event['pending']
+                self.playlist_progress = {}
+        elif kind in ('ingest_progress', 'ingest_done'):
+            # The URL file is read while downloading, so the batch keeps growing
+            with self.progress_lock:
+                self.batch_total = event['total']
+                self.progress_changed = True
+        elif kind == 'playlist_progress':
+            # Playlist size grows as pages arrive; the bar fills in as it becomes known
+            with self.progress_lock:
+                done, _ = self.playlist_progress.get(event['index'], (0, 0))
+                self.playlist_progress[event['index']] = (done, event['total'] or event['queued'])
+                self.progress_changed = True
+        elif kind == 'entry_done':
+            with self.progress_lock:
+                done, known = self.playlist_progress.get(event['index'], (0, 0))
+                self.playlist_progress[event['index']] = (done + 1, max(known, done + 1))
+                self.progress_changed = True
+        elif kind == 'item_done':
+            with self.progress_lock:
+                self.batch_completed = event['completed']
+                self.batch_total = max(self.batch_total, event['total'])
+                self.playlist_progress.pop(event['index'], None)
+                self.progress_changed = True
+        
+        if kind in ('item_done', 'batch_done'):
+            # Only the latest counts are shown, on the next flush_log tick
+            with self.progress_lock:
+                self.pending_stats = (event['total'], event['success'], event['errors'])
+    
+    def apply_progress(self):
+        """Show the latest progress and stats from the worker threads (Tk main loop timer).
+
+        Overall progress is the finished URLs plus the finished share of
+        running playlists.
+        """
+        with self.progress_lock:
+            progress = None
+            if self.progress_changed and self.batch_total:
+                partial = sum(done / known for done, known in self.playlist_progress.values() if known)
+                progress = min(100.0, (self.batch_completed + partial) / self.batch_total * 100)
+            self.progress_changed = False
+            stats, self.pending_stats = self.pending_stats, None
+            finished, self.batch_finished = self.batch_finished, False
+        if progress is not None:
+            self.progress_var.set(progress)
+        if stats:
+            self.update_stats(*stats)
+        if finished:
+            self.reset_download_button()
+            if self.profiler:
+                self.finish_profile()
     
     def reset_download_button(self):
         """Reset download button"""
@@ -453,6 +617,66 @@ class ModernYouTubeDownloader:
         self.progress_var.set(0)
         self.update_download_button_state()
     
+    def on_window_ready(self):
+        """Report the startup time, then load drag & drop and warm up the engine in the background"""
+        self.root.update_idletasks()
+        self.log_status(f"⚡ Ventana lista en {time.perf_counter() - STARTED:.2f} s")
+        self.dnd_available = self.setup_drag_drop()
+        if not self.dnd_available:
+            self.log_status("⚠️ Drag & Drop no disponible (instalar tkinterdnd2)")
+        self.warmup.start()
+    
+    def on_warmup_ready(self, warmup):
+        """Log the import times of the background warm-up (called from its thread)"""
+        if warmup.error is not None:
+            self.log_status(f"⚠️ No se pudo precargar el motor de descarga: {str(warmup.error)}")
+            return
+        steps = " · ".join(f"{label} {seconds:.2f} s" for label, seconds in warmup.timings)
+        self.log_status(f"🚀 Motor de descarga listo en {warmup.total_seconds:.2f} s ({steps})")
+    
+    def on_extractor_loaded(self, name, seconds):
+        self.log_status(f"🧩 Extractor {name} precargado ({seconds:.2f} s)")
+    
+    def finish_profile(self):
+        """Stop the batch profiler and write its reports (on the Tk thread that started it)"""
+        profiler, self.profiler = self.profiler, None
+        try:
+            self.log_status(describe(profiler.stop()))
+        except OSError as e:
+            self.log_status(f"⚠️ No se pudo guardar el perfil: {str(e)}")
+    
+    def update_metrics_panel(self):
+        """Refresh the live stats from the shared metrics (runs on the Tk thread)"""
+        snapshot = self.metrics.snapshot()
+        gauges = snapshot['gauges']
+        rate = snapshot['bytes_per_second']
+        rate_text = f"{rate / 1024 / 1024:.1f} MB/s" if rate >= 1024 * 1024 else f"{rate / 1024:.0f} KB/s"
+        self.throughput_var.set(
+            f"⚡ {rate_text} | Cola: {gauges.get('download_queue_depth', 0)}"
+            f" | Hilos: {gauges.get('workers_busy', 0)}/{gauges.get('workers_total', 0)}"
+            f" | FFmpeg: {gauges.get('transcode_queue_depth', 0)} en cola"
+            f" | Reintentos: {gauges.get('retry_queue_depth', 0)}")
+        stages = [f"{STAGE_LABELS[stage]} {snapshot['stages'][stage]['mean']:.1f}s"
+                  for stage in STAGES if snapshot['stages'][stage]['mean'] is not None]
+        if stages:
+            self.stage_times_var.set("⏱️ Media por elemento: " + " · ".join(stages))
+        self.root.after(METRICS_REFRESH_MS, self.update_metrics_panel)
+    
+    def export_metrics(self):
+        """Save the session metrics in Prometheus text format"""
+        path = filedialog.asksaveasfilename(
+            title="Exportar métricas",
+            defaultextension=".prom",
+            filetypes=[("Métricas Prometheus", "*.prom"), ("Todos los archivos", "*.*")]
+        )
+        if not path:
+            return
+        try:
+            self.metrics.write_textfile(path)
+            self.log_status(f"📤 Métricas exportadas: {os.path.basename(path)}")
+        except OSError as e:
+            messagebox.showerror("❌ Error", f"No se pudieron exportar las métricas: {str(e)}")
+    
     def update_stats(self, total, success, errors):
         """Update statistics"""
         stats_text = f"📈 Descargas: {total} | Exitosas: {success} | Errores: {errors}"
@@ -460,19 +684,15 @@ class ModernYouTubeDownloader:
 
 def main():
     """Main function"""
-    # Create root window
-    if DND_AVAILABLE:
-        root = tkdnd.Tk()
-    else:
-        root = tk.Tk()
+    # Create root window (tkdnd is loaded into it once it is shown)
+    root = tk.Tk()
     
     # Create app
     app = ModernYouTubeDownloader(root)
     
     # Initial messages
     app.log_status("🎵 YouTube Audio Downloader Pro iniciado")
-    if not DND_AVAILABLE:
-        app.log_status("⚠️ Drag & Drop no disponible (instalar tkinterdnd2)")
+    root.after(0, app.on_window_ready)
     
     # Run
     root.mainloop()
@@ -0,0 +1,143 @@
+"""
+Limitación de ancho de banda y ritmo de peticiones
+Cubetas de fichas compartidas para el ancho de banda total y por hilo, y un
+espaciado mínimo entre peticiones de extracción al mismo host. Los límites se
+pueden cambiar en vivo mientras hay descargas en curso.
+"""
+
+import threading
+import time
+from urllib.parse import urlparse
+
+# Longest single sleep, so live rate changes take effect quickly
+MAX_SLEEP = 0.5
+
+# Minimum seconds between extraction requests to the same host
+DEFAULT_REQUEST_INTERVAL = 0.5
+
+# Connections per long download (see segmented_download); kept here, free of
+# yt-dlp imports, so the GUI can build its settings before yt-dlp is loaded
+DEFAULT_CONNECTIONS = 4
+MAX_CONNECTIONS = 16
+
+
+class TokenBucket:
+    """Token bucket in bytes/second; a rate of None or 0 means unlimited"""
+
+    def __init__(self, rate=None):
+        self._lock = threading.Lock()
+        self._tokens = 0.0
+        self._updated = time.monotonic()
+        self.rate = None
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._refill()
+            self.rate = rate or None
+            # Allow one second of burst at the new rate
+            self._tokens = min(self._tokens, self.rate or 0.0)
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def consume(self, amount):
+        """Take amount tokens, sleeping while the bucket is in debt"""
+        with self._lock:
+            if not self.rate:
+                return
+            self._refill()
+            self._tokens -= amount
+
+        while True:
+            with self._lock:
+                if not self.rate:
+                    self._tokens = 0.0
+                    return
+                self._refill()
+                if self._tokens >= 0:
+                    return
+                wait = -self._tokens / self.rate
+            time.sleep(min(wait, MAX_SLEEP))
+
+
+class BandwidthLimiter:
+    """Shared total limit plus a per-worker-thread limit, fed from yt-dlp progress hooks"""
+
+    def __init__(self, total_rate=None, worker_rate=None):
+        self.total = TokenBucket(total_rate)
+        self.worker_rate = worker_rate or None
+        self._worker_buckets = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def set_rates(self, total_rate=None, worker_rate=None):
+        """Change both limits live (bytes/second; None or 0 for unlimited)"""
+        self.total.set_rate(total_rate)
+        with self._lock:
+            self.worker_rate = worker_rate or None
+            buckets = list(self._worker_buckets)
+        for bucket in buckets:
+            bucket.set_rate(self.worker_rate)
+
+    def _worker_bucket(self):
+        bucket = getattr(self._local, 'bucket', None)
+        if bucket is None:
+            bucket = TokenBucket(self.worker_rate)
+            self._local.bucket = bucket
+            with self._lock:
+                self._worker_buckets.append(bucket)
+        return bucket
+
+    def track(self, d):
+        """Account for the bytes received since the last progress tick of this thread"""
+        filename = d.get('tmpfilename') or d.get('filename')
+        downloaded = d.get('downloaded_bytes') or 0
+        last_file, last_bytes = getattr(self._local, 'last', (None, 0))
+        self._local.last = (filename, downloaded)
+        if filename != last_file or downloaded < last_bytes:
+            # New (or resumed) file: the first tick only sets the baseline
+            return
+
+        delta = downloaded - last_bytes
+        if delta > 0:
+            self._worker_bucket().consume(delta)
+            self.total.consume(delta)
+
+
+def host_key(url):
+    """Group subdomains of a site (www., music., m.) under one pacing key"""
+    host = (urlparse(url).hostname or '').lower()
+    if host in ('youtu.be',):
+        return 'youtube.com'
+    parts = host.split('.')
+    return '.'.join(parts[-2:]) if len(parts) > 2 else host
+
+
+class HostPacer:
+    """Keep a minimum interval between extraction requests to the same host"""
+
+    def __init__(self, interval=0.0):
+        self.interval = interval
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def set_interval(self, interval):
+        with self._lock:
+            self.interval = max(0.0, interval or 0.0)
+
+    def wait(self, url):
+        """Block until this thread may send its next request to the URL's host"""
+        host = host_key(url)
+        with self._lock:
+            if not self.interval or not host:
+                return
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, 0.0))
+            # Reserve the slot so concurrent workers queue up behind each other
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
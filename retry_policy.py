@@ -0,0 +1,184 @@
+"""
+Política de reintentos
+Clasifica los errores (red, limitación, no disponible, FFmpeg) y reintenta los
+transitorios con espera exponencial y aleatoria desde una cola diferida, sin
+ocupar un hilo de descarga mientras esperan. Los errores permanentes fallan
+de inmediato.
+"""
+
+import heapq
+import itertools
+import random
+import re
+import socket
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+NETWORK = 'network'
+THROTTLED = 'throttled'
+UNAVAILABLE = 'unavailable'
+FFMPEG = 'ffmpeg'
+UNKNOWN = 'unknown'
+
+CATEGORY_LABELS = {
+    NETWORK: 'red',
+    THROTTLED: 'limitado por el servidor',
+    UNAVAILABLE: 'no disponible',
+    FFMPEG: 'FFmpeg',
+    UNKNOWN: 'desconocido',
+}
+
+# Checked in order; the first match wins
+_PATTERNS = [
+    (FFMPEG, re.compile(r'ffmpeg|postprocess|process pool', re.I)),
+    (THROTTLED, re.compile(r'\b429\b|too many requests|rate.?limit|confirm you.?re not a bot', re.I)),
+    (UNAVAILABLE, re.compile(
+        r'video unavailable|private video|has been removed|been terminated|not available|'
+        r'members.?only|copyright|age.?restricted|unsupported url|not a valid url|'
+        r'\b(?:401|403|404|410)\b|no video formats|premieres in|live event will begin', re.I)),
+    (NETWORK, re.compile(
+        r'timed? ?out|connection|network|temporary failure|name resolution|getaddrinfo|'
+        r'unreachable|reset by peer|incomplete ?read|remote end closed|\b50[0-4]\b|ssl|'
+        r'unable to download|eof occurred', re.I)),
+]
+
+# (base delay in seconds, how many of the allowed retries the category may use)
+_BACKOFF = {
+    NETWORK: (2.0, None),
+    THROTTLED: (30.0, None),
+    UNAVAILABLE: (0.0, 0),
+    FFMPEG: (1.0, 1),
+    UNKNOWN: (2.0, 1),
+}
+
+MAX_DELAY = 300.0
+
+
+def classify_error(error):
+    """Return the failure category of an exception or error message"""
+    if isinstance(error, BrokenProcessPool):
+        return FFMPEG
+    if isinstance(error, (socket.timeout, ConnectionError, TimeoutError)):
+        return NETWORK
+    text = error if isinstance(error, str) else (str(error) or error.__class__.__name__)
+    for category, pattern in _PATTERNS:
+        if pattern.search(text):
+            return category
+    return UNKNOWN
+
+
+class RetryPolicy:
+    """Exponential backoff with jitter; max_retries replaces yt-dlp's flat retry count"""
+
+    def __init__(self, max_retries=3, max_delay=MAX_DELAY):
+        self.max_retries = max(0, int(max_retries))
+        self.max_delay = max_delay
+
+    def retries_for(self, category):
+        _, limit = _BACKOFF[category]
+        return self.max_retries if limit is None else min(limit, self.max_retries)
+
+    def delay(self, category, attempt):
+        """Seconds to wait before retrying a failed attempt (1-based), or None to give up"""
+        if attempt > self.retries_for(category):
+            return None
+        base, _ = _BACKOFF[category]
+        ceiling = min(self.max_delay, base * 2 ** (attempt - 1))
+        # Jitter spreads retries of a batch that failed together
+        return random.uniform(ceiling / 2, ceiling)
+
+
+class DeferredQueue:
+    """Run callbacks after a delay from a single timer thread"""
+
+    def __init__(self, name="retry-queue"):
+        self._heap = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._heap)
+
+    def schedule(self, delay, fn, on_cancel=None):
+        """Call fn() after delay seconds; on_cancel() instead if the queue is cancelled first"""
+        with self._cond:
+            if not self._closed:
+                heapq.heappush(self._heap, (time.monotonic() + delay, next(self._sequence), fn, on_cancel))
+                self._cond.notify()
+                return
+        if on_cancel:
+            on_cancel()
+
+    def cancel(self):
+        """Drop every pending callback, calling its on_cancel; later schedules are cancelled too"""
+        with self._cond:
+            self._closed = True
+            pending, self._heap = self._heap, []
+            self._cond.notify()
+        for _, _, _, on_cancel in sorted(pending):
+            if on_cancel:
+                on_cancel()
+
+    close = cancel
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed and not self._heap:
+                        return
+                    now = time.monotonic()
+                    if self._heap and self._heap[0][0] <= now:
+                        _, _, fn, _ = heapq.heappop(self._heap)
+                        break
+                    self._cond.wait(self._heap[0][0] - now if self._heap else None)
+            try:
+                fn()
+            except Exception:
+                pass
+
+
+def retry_future(start, policy, deferred, on_retry=None):
+    """Return a Future for start(attempt) that re-runs transient failures later.
+
+    start(attempt) returns a Future for one attempt (or raises). Failed attempts
+    are classified and, while the policy allows, started again from the deferred
+    queue; on_retry(error, category, attempt, delay) is called before each wait.
+    The returned Future has the result of the first successful attempt, or the
+    last error.
+    """
+    outcome = Future()
+
+    def launch(attempt):
+        try:
+            future = start(attempt)
+        except Exception as e:
+            future = Future()
+            future.set_exception(e)
+        future.add_done_callback(lambda f: settle(f, attempt))
+
+    def settle(future, attempt):
+        if future.cancelled():
+            outcome.cancel()
+            return
+        error = future.exception()
+        if error is None:
+            outcome.set_result(future.result())
+            return
+        category = classify_error(error)
+        delay = policy.delay(category, attempt)
+        if delay is None:
+            outcome.set_exception(error)
+            return
+        if on_retry:
+            on_retry(error, category, attempt, delay)
+        deferred.schedule(delay, lambda: launch(attempt + 1), lambda: outcome.set_exception(error))
+
+    launch(1)
+    return outcome
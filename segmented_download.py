@@ -0,0 +1,360 @@
+"""
+Descarga segmentada por varias conexiones
+Descarga los audios largos (sesiones de DJ, podcasts de horas) por rangos de
+bytes en varias conexiones HTTP a la vez y escribe cada segmento en su posición
+del archivo .part. El número de conexiones se adapta al rendimiento observado y
+los segmentos terminados se recuerdan para poder reanudar.
+"""
+
+import json
+import os
+import threading
+import time
+
+from yt_dlp.downloader.http import HttpFD
+from yt_dlp.networking import Request
+from yt_dlp.networking.exceptions import HTTPError, TransportError
+from yt_dlp.utils import ContentTooShortError, DownloadError, determine_protocol
+
+from rate_limiter import MAX_CONNECTIONS
+
+# Shorter streams gain little from extra connections
+MIN_SEGMENTED_BYTES = 32 * 1024 * 1024
+SEGMENT_BYTES = 4 * 1024 * 1024
+READ_BYTES = 64 * 1024
+# Connections may run this far ahead of the last progress report, so
+# bandwidth limits applied in the progress hooks also hold them back
+CREDIT_BYTES = 2 * 1024 * 1024
+PROGRESS_INTERVAL = 0.5
+
+# A new connection is kept only if it raises total throughput by this factor
+GROWTH_GAIN = 1.15
+# Throughput falling below this share of the best seen drops a connection
+BACKOFF_RATIO = 0.7
+MIN_WINDOW_SECONDS = 1.0
+
+
+class AdaptiveConcurrency:
+    """Connection limit that grows while each extra connection still adds throughput"""
+
+    def __init__(self, maximum, initial=2):
+        self.maximum = max(1, maximum)
+        self.target = min(initial, self.maximum)
+        self._active = 0
+        self._best = 0.0
+        self._cond = threading.Condition()
+        self._reset_window()
+
+    def _reset_window(self):
+        self._window_start = time.monotonic()
+        self._window_bytes = 0
+        self._window_segments = 0
+
+    def acquire(self, stop):
+        """Wait for a connection slot; returns False if stop is set first"""
+        with self._cond:
+            while self._active >= self.target:
+                if stop.is_set():
+                    return False
+                self._cond.wait(PROGRESS_INTERVAL)
+            self._active += 1
+            return True
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def record(self, nbytes):
+        """Account for a finished segment and adjust the target once per window"""
+        with self._cond:
+            self._window_bytes += nbytes
+            self._window_segments += 1
+            elapsed = time.monotonic() - self._window_start
+            # One segment per connection gives every connection a say in the measurement
+            if self._window_segments < self.target or elapsed < MIN_WINDOW_SECONDS:
+                return
+            throughput = self._window_bytes / elapsed
+            if throughput >= self._best * GROWTH_GAIN:
+                self._best = throughput
+                self.target = min(self.maximum, self.target + 1)
+            elif throughput < self._best * BACKOFF_RATIO:
+                self._best = throughput
+                self.target = max(1, self.target - 1)
+            self._reset_window()
+            self._cond.notify_all()
+
+
+class _SegmentState:
+    """Finished segment offsets of a .part file, kept in a sidecar for resuming"""
+
+    def __init__(self, path, total):
+        self.path = path
+        self.total = total
+        self.done = set()
+
+    @classmethod
+    def load(cls, tmpfilename, total):
+        state = cls(f"{tmpfilename}.segments", total)
+        try:
+            with open(state.path, 'r', encoding='utf-8') as file:
+                saved = json.load(file)
+            if saved.get('total') == total:
+                state.done = set(saved.get('done', []))
+        except (OSError, ValueError):
+            # A .part left by a single-connection download holds a contiguous prefix. One of
+            # full size without a sidecar was preallocated here and says nothing about its content
+            size = os.path.getsize(tmpfilename) if os.path.isfile(tmpfilename) else 0
+            if size < total:
+                state.done = {start for start in range(0, size, SEGMENT_BYTES)
+                              if min(start + SEGMENT_BYTES, total) <= size}
+        return state
+
+    def mark_done(self, start):
+        self.done.add(start)
+        self.save()
+
+    def save(self):
+        """Atomically write the finished offsets to the sidecar"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({'total': self.total, 'done': sorted(self.done)}, file)
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class SegmentedHttpFD(HttpFD):
+    """HttpFD that fetches large files as byte ranges over several connections.
+
+    The maximum number of connections is yt-dlp's 'concurrent_fragment_downloads'
+    option, which also sets the parallelism of DASH/HLS fragment downloads.
+    Servers without range support and files under MIN_SEGMENTED_BYTES go
+    through the regular single-connection HttpFD.
+    """
+
+    FD_NAME = 'segmented'
+
+    @classmethod
+    def can_download(cls, info_dict, params):
+        headers = info_dict.get('http_headers') or {}
+        return (
+            (params.get('concurrent_fragment_downloads') or 1) > 1
+            and determine_protocol(info_dict) in ('http', 'https')
+            and not params.get('test')
+            and not params.get('external_downloader')
+            and not info_dict.get('is_live')
+            and not info_dict.get('request_data')
+            and info_dict.get('impersonate') is None
+            and not (info_dict.get('section_start') or info_dict.get('section_end'))
+            and not any(name.lower() == 'range' for name in headers)
+            and (info_dict.get('filesize') or MIN_SEGMENTED_BYTES) >= MIN_SEGMENTED_BYTES
+        )
+
+    def real_download(self, filename, info_dict):
+        url = info_dict['url']
+        headers = {'Accept-Encoding': 'identity', **(info_dict.get('http_headers') or {})}
+
+        total, last_modified = self._probe(url, headers)
+        if not total or total < MIN_SEGMENTED_BYTES:
+            return super().real_download(filename, info_dict)
+
+        tmpfilename = self.temp_name(filename)
+        if self.params.get('continuedl', True):
+            state = _SegmentState.load(tmpfilename, total)
+        else:
+            state = _SegmentState(f"{tmpfilename}.segments", total)
+        segments = [(start, min(start + SEGMENT_BYTES, total)) for start in range(0, total, SEGMENT_BYTES)
+                    if start not in state.done]
+        if state.done:
+            self.to_screen(f"[download] Resuming {len(state.done)} finished segments")
+
+        # The sidecar must exist before the .part is grown, or a crash would leave a
+        # full-size file that the next run could not tell apart from a finished one
+        state.save()
+        with open(tmpfilename, 'r+b' if os.path.isfile(tmpfilename) else 'w+b') as file:
+            file.truncate(total)
+
+        run = _SegmentedRun(self, url, headers, tmpfilename, segments, state,
+                            self.params.get('concurrent_fragment_downloads'))
+        started = time.time()
+        already = total - sum(end - start for start, end in segments)
+        run.start()
+        try:
+            while True:
+                received, finished = run.wait_for_progress()
+                downloaded = already + received
+                elapsed = time.time() - started
+                speed = received / elapsed if elapsed > 0 else None
+                self._hook_progress({
+                    'status': 'downloading',
+                    'downloaded_bytes': downloaded,
+                    'total_bytes': total,
+                    'tmpfilename': tmpfilename,
+                    'filename': filename,
+                    'eta': (total - downloaded) / speed if speed else None,
+                    'speed': speed,
+                    'elapsed': elapsed,
+                }, info_dict)
+                if finished:
+                    break
+                run.grant(received + CREDIT_BYTES)
+        finally:
+            run.stop()
+
+        if run.error is not None:
+            raise run.error
+        if os.path.getsize(tmpfilename) != total:
+            raise ContentTooShortError(os.path.getsize(tmpfilename), total)
+
+        state.remove()
+        self.try_rename(tmpfilename, filename)
+        if self.params.get('updatetime'):
+            info_dict['filetime'] = self.try_utime(filename, last_modified)
+        self._hook_progress({
+            'downloaded_bytes': total,
+            'total_bytes': total,
+            'filename': filename,
+            'status': 'finished',
+            'elapsed': time.time() - started,
+        }, info_dict)
+        return True
+
+    def _probe(self, url, headers):
+        """(total size, Last-Modified) from a one-byte range request, or (None, None) without range support"""
+        try:
+            response = self.ydl.urlopen(Request(url, headers={**headers, 'Range': 'bytes=0-0'}))
+        except (HTTPError, TransportError):
+            return None, None
+        with response:
+            content_range = response.headers.get('Content-Range') or ''
+            if response.status != 206 or '/' not in content_range:
+                return None, None
+            total = content_range.rpartition('/')[2]
+            return (int(total) if total.isdigit() else None), response.headers.get('Last-Modified')
+
+    def fetch_range(self, url, headers, start, end):
+        """Open a response for bytes [start, end) of url"""
+        response = self.ydl.urlopen(Request(url, headers={**headers, 'Range': f'bytes={start}-{end - 1}'}))
+        if response.status != 206:
+            response.close()
+            raise DownloadError(f"El servidor ignoró el rango de bytes (HTTP {response.status})")
+        return response
+
+
+class _SegmentedRun:
+    """Connection threads of one segmented download and their shared progress"""
+
+    def __init__(self, fd, url, headers, tmpfilename, segments, state, max_connections):
+        self.fd = fd
+        self.url = url
+        self.headers = headers
+        self.tmpfilename = tmpfilename
+        self.state = state
+        self.error = None
+        self.retries = fd.params.get('retries', 10)
+        self.concurrency = AdaptiveConcurrency(min(int(max_connections), MAX_CONNECTIONS))
+        self._segments = list(reversed(segments))
+        self._remaining = len(segments)
+        self._received = 0
+        self._allowance = CREDIT_BYTES
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for number in range(self.concurrency.maximum):
+            thread = threading.Thread(target=self._connection, name=f"segment-{number + 1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    def wait_for_progress(self):
+        """Block until a connection needs more credit or a report is due; returns (received, finished)"""
+        with self._cond:
+            if not self._done():
+                self._cond.wait_for(lambda: self._done() or self._received >= self._allowance,
+                                    PROGRESS_INTERVAL)
+            return self._received, self._done()
+
+    def grant(self, allowance):
+        with self._cond:
+            self._allowance = allowance
+            self._cond.notify_all()
+
+    def _done(self):
+        return self._remaining == 0 or self.error is not None
+
+    def _next_segment(self):
+        with self._cond:
+            return self._segments.pop() if self._segments and self.error is None else None
+
+    def _connection(self):
+        with open(self.tmpfilename, 'r+b') as file:
+            while not self._stop.is_set():
+                if not self.concurrency.acquire(self._stop):
+                    return
+                try:
+                    segment = self._next_segment()
+                    if segment is None:
+                        return
+                    self._download_segment(file, *segment)
+                except Exception as e:
+                    with self._cond:
+                        if self.error is None:
+                            self.error = e
+                        self._cond.notify_all()
+                    return
+                finally:
+                    self.concurrency.release()
+
+    def _download_segment(self, file, start, end):
+        began = time.monotonic()
+        offset = start
+        attempt = 0
+        while offset < end:
+            try:
+                with self.fd.fetch_range(self.url, self.headers, offset, end) as response:
+                    while offset < end:
+                        self._wait_for_credit()
+                        data = response.read(min(READ_BYTES, end - offset))
+                        if not data:
+                            raise ContentTooShortError(offset - start, end - start)
+                        file.seek(offset)
+                        file.write(data)
+                        offset += len(data)
+                        with self._cond:
+                            self._received += len(data)
+                            if self._received >= self._allowance:
+                                self._cond.notify_all()
+            except (HTTPError, TransportError, ContentTooShortError, OSError) as e:
+                attempt += 1
+                if attempt > self.retries or self._stop.is_set():
+                    raise
+                self.fd.report_retry(e, attempt, self.retries)
+        file.flush()
+
+        with self._cond:
+            self.state.mark_done(start)
+            self._remaining -= 1
+            self._cond.notify_all()
+        self.concurrency.record(end - start)
+        self.fd.ydl.write_debug(f"Segment {start}-{end} in {time.monotonic() - began:.1f}s; "
+                                f"{self.concurrency.target} connections")
+
+    def _wait_for_credit(self):
+        with self._cond:
+            while self._received >= self._allowance and not self._stop.is_set():
+                self._cond.wait(PROGRESS_INTERVAL)
+            if self._stop.is_set():
+                raise DownloadError("Descarga segmentada interrumpida")
@@ -0,0 +1,223 @@
+"""
+Etapa de transcodificación
+Convierte los audios descargados con FFmpeg en un pool de procesos,
+separado de los hilos de descarga
+"""
+
+import multiprocessing
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from metrics import POSTPROCESS
+
+# FFmpeg encoder for each output format offered in the settings dialog
+CODECS = {
+    'mp3': 'libmp3lame',
+    'm4a': 'aac',
+    'ogg': 'libvorbis',
+}
+FORMATS = tuple(CODECS)
+
+# Source codecs (yt-dlp 'acodec' prefixes) each output container holds without re-encoding
+COPY_CODECS = {
+    'mp3': ('mp3',),
+    'm4a': ('mp4a', 'aac'),
+    'ogg': ('vorbis', 'opus'),
+}
+
+# A source stream between these shares of the requested bitrate is copied; one far
+# below it is re-encoded from the best stream instead of keeping its lower quality
+BITRATE_TOLERANCE = 1.1
+BITRATE_FLOOR = 0.8
+
+
+def format_selector(format_ext, quality):
+    """yt-dlp format spec that prefers an audio stream the output can stream-copy"""
+    floor, limit = int(int(quality) * BITRATE_FLOOR), int(int(quality) * BITRATE_TOLERANCE)
+    preferred = [f"bestaudio[acodec^={codec}][abr>=?{floor}][abr<=?{limit}]" for codec in COPY_CODECS[format_ext]]
+    return '/'.join(preferred + ['bestaudio', 'best'])
+
+
+def can_copy(acodec, abr, format_ext, quality):
+    """Whether a downloaded stream can go into format_ext without decoding it"""
+    if not acodec or not acodec.lower().startswith(COPY_CODECS[format_ext]):
+        return False
+    return not abr or int(quality) * BITRATE_FLOOR <= abr <= int(quality) * BITRATE_TOLERANCE
+
+
+def build_ffmpeg_command(source, target, format_ext, quality, copy=False):
+    """Build the FFmpeg command line for one conversion (or a stream copy)"""
+    codec = ['-c:a', 'copy'] if copy else ['-c:a', CODECS[format_ext], '-b:a', f'{quality}k']
+    return [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-nostdin', '-y',
+        '-i', source,
+        '-vn', '-map_metadata', '0',
+        *codec,
+        target,
+    ]
+
+
+def output_folder(format_ext, quality, outputs):
+    """Subfolder of one fan-out output: the format, plus the bitrate if the format repeats"""
+    if sum(1 for other, _ in outputs if other == format_ext) > 1:
+        return f"{format_ext}_{quality}k"
+    return format_ext
+
+
+def build_fanout_command(source, outputs):
+    """One FFmpeg command writing every (target, format_ext, quality, copy) output.
+
+    The input is read and decoded once and fed to each encoder.
+    """
+    command = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-nostdin', '-y', '-i', source]
+    for target, format_ext, quality, copy in outputs:
+        codec = ['-c:a', 'copy'] if copy else ['-c:a', CODECS[format_ext], '-b:a', f'{quality}k']
+        command += ['-map', '0:a:0', '-vn', '-map_metadata', '0', *codec, target]
+    return command
+
+
+def transcode_outputs(source, outputs):
+    """Write several (format_ext, quality, copy) outputs of source into per-format subfolders.
+
+    Runs inside a pool process; removes the raw download and returns the output paths.
+    """
+    folder, filename = os.path.split(source)
+    base = os.path.splitext(filename)[0]
+    formats = [(format_ext, quality) for format_ext, quality, _ in outputs]
+
+    planned = []
+    for format_ext, quality, copy in outputs:
+        subfolder = os.path.join(folder, output_folder(format_ext, quality, formats))
+        os.makedirs(subfolder, exist_ok=True)
+        target = os.path.join(subfolder, f"{base}.{format_ext}")
+        planned.append((target, f"{os.path.splitext(target)[0]}.tmp.{format_ext}", format_ext, quality, copy))
+
+    command = build_fanout_command(source, [(tmp, format_ext, quality, copy)
+                                            for _, tmp, format_ext, quality, copy in planned])
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            text=True, errors='replace')
+    if result.returncode != 0:
+        for _, tmp, _, _, _ in planned:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        detail = result.stderr.strip().splitlines()[-1:] or ['sin detalles']
+        raise RuntimeError(f"FFmpeg falló con {filename}: {detail[0]}")
+
+    for target, tmp, _, _, _ in planned:
+        os.replace(tmp, target)
+    os.remove(source)
+    return [target for target, _, _, _, _ in planned]
+
+
+def transcode_file(source, format_ext, quality, copy=False):
+    """Convert source to format_ext and remove the raw download.
+
+    With copy, the audio stream is only remuxed, or left untouched when it is
+    already in the right container. Runs inside a pool process; returns the
+    path of the converted file.
+    """
+    base, ext = os.path.splitext(source)
+    target = f"{base}.{format_ext}"
+    if copy and target == source:
+        return target
+    # FFmpeg cannot overwrite its own input
+    output = f"{base}.tmp.{format_ext}" if target == source else target
+
+    command = build_ffmpeg_command(source, output, format_ext, quality, copy)
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            text=True, errors='replace')
+    if result.returncode != 0:
+        if os.path.exists(output):
+            os.remove(output)
+        detail = result.stderr.strip().splitlines()[-1:] or ['sin detalles']
+        raise RuntimeError(f"FFmpeg falló con {os.path.basename(source)}: {detail[0]}")
+
+    if output != target:
+        os.replace(output, target)
+    else:
+        os.remove(source)
+    return target
+
+
+def _timed(fn, *args):
+    """Run fn in a worker process and return (result, seconds)"""
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+class TranscodePool:
+    """Process pool that runs FFmpeg conversions off the download threads"""
+
+    def __init__(self, format_ext, quality, max_workers=None, metrics=None):
+        if format_ext not in CODECS:
+            raise ValueError(f"Formato no soportado: {format_ext}")
+        self.format_ext = format_ext
+        self.quality = quality
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.metrics = metrics
+        # Conversions queued or running
+        self.pending = 0
+        self._lock = threading.Lock()
+        # 'spawn' avoids forking a process that holds Tk state and running threads
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+
+    def submit(self, source, format_ext=None, quality=None, copy=False):
+        """Queue a raw download for conversion; returns a Future with the output path.
+
+        format_ext and quality default to the pool's; a shared pool can serve
+        jobs with different settings. copy stream-copies instead of re-encoding.
+        """
+        format_ext = format_ext or self.format_ext
+        if format_ext not in CODECS:
+            raise ValueError(f"Formato no soportado: {format_ext}")
+        return self._submit(transcode_file, source, format_ext, quality or self.quality, copy)
+
+    def submit_outputs(self, source, outputs):
+        """Queue one FFmpeg run producing several (format_ext, quality, copy) outputs"""
+        for format_ext, _, _ in outputs:
+            if format_ext not in CODECS:
+                raise ValueError(f"Formato no soportado: {format_ext}")
+        return self._submit(transcode_outputs, source, list(outputs))
+
+    def submit_task(self, fn, *args):
+        """Queue another post-processing step, a picklable top-level function, on the same processes"""
+        return self._submit(fn, *args)
+
+    def _submit(self, fn, *args):
+        """Run fn in the pool; the Future has its result, and the FFmpeg time goes to metrics"""
+        outcome = Future()
+        with self._lock:
+            self.pending += 1
+
+        def settle(future):
+            with self._lock:
+                self.pending -= 1
+            if future.cancelled():
+                outcome.cancel()
+            elif future.exception() is not None:
+                outcome.set_exception(future.exception())
+            else:
+                result, seconds = future.result()
+                if self.metrics is not None:
+                    # Time in the worker process only, not waiting in the queue
+                    self.metrics.observe(POSTPROCESS, seconds)
+                outcome.set_result(result)
+
+        self._executor.submit(_timed, fn, *args).add_done_callback(settle)
+        return outcome
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
@@ -0,0 +1,208 @@
+"""
+Lectura de URLs en streaming
+Lee archivos de URLs (texto, CSV o JSONL) línea a línea, normaliza cada URL a
+su ID de video sin peticiones de red y descarta duplicados con un conjunto de
+memoria acotada, entregando las URLs a la cola de descargas a medida que se leen.
+"""
+
+import csv
+import hashlib
+import json
+import os
+import re
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs
+
+from metadata_cache import normalize_url
+
+# Keys remembered for duplicate detection; older ones are forgotten first
+DEFAULT_SEEN_CAPACITY = 1_000_000
+
+# Manifest columns/fields that hold the URL, in order of preference
+URL_FIELDS = ('url', 'webpage_url', 'link', 'href')
+
+MANIFEST_EXTENSIONS = ('.txt', '.csv', '.tsv', '.jsonl', '.ndjson')
+
+_YOUTUBE_HOST = re.compile(r'(?:^|\.)(?:youtube\.com|youtube-nocookie\.com)$')
+_VIDEO_ID = re.compile(r'^[0-9A-Za-z_-]{11}$')
+_VIDEO_PATH = re.compile(r'^/(?:shorts|embed|live|v|e)/([0-9A-Za-z_-]{11})')
+
+
+_SCHEMELESS = ('www.', 'youtu.be/', 'youtube.com/', 'm.youtube.com/', 'music.youtube.com/')
+# yt-dlp pseudo-URLs such as 'ytsearch:query' or 'ytsearch5:query'
+_PSEUDO_URL = re.compile(r'^[a-z][a-z0-9]*:\S')
+
+
+def looks_like_url(text):
+    return text.startswith(('http://', 'https://') + _SCHEMELESS)
+
+
+def prepare_url(raw):
+    """Normalized URL for a raw input line, or None if it is not something yt-dlp accepts"""
+    raw = (raw or '').strip()
+    if raw.startswith(_SCHEMELESS):
+        raw = f"https://{raw}"
+    if raw.startswith(('http://', 'https://')):
+        return normalize_url(raw)
+    if _VIDEO_ID.match(raw) or _PSEUDO_URL.match(raw):
+        return raw
+    return None
+
+
+def canonical_key(url, noplaylist=False):
+    """Dedup key for a normalized URL: yt-dlp's archive ID for YouTube forms, else the URL itself.
+
+    youtu.be, /shorts/, /embed/, m./music. hosts and watch?v= all map to
+    'youtube <id>'; playlists map to 'youtubetab <list id>'. No request is made.
+    """
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    query = parse_qs(parts.query)
+    video_id = None
+    if host == 'youtu.be':
+        video_id = parts.path.strip('/').split('/')[0]
+    elif _YOUTUBE_HOST.search(host):
+        match = _VIDEO_PATH.match(parts.path)
+        if match:
+            video_id = match.group(1)
+        elif parts.path in ('/watch', '/watch/'):
+            video_id = (query.get('v') or [None])[0]
+        playlist_id = (query.get('list') or [None])[0]
+        if playlist_id and not noplaylist and (parts.path == '/playlist' or video_id):
+            return f"youtubetab {playlist_id}"
+    elif not parts.scheme.startswith('http') and _VIDEO_ID.match(url):
+        # A bare video ID, as yt-dlp accepts it
+        video_id = url
+    if video_id and _VIDEO_ID.match(video_id):
+        return f"youtube {video_id}"
+    return url
+
+
+def _url_from_record(record):
+    if isinstance(record, str):
+        return record
+    if isinstance(record, dict):
+        lowered = {str(name).lower(): value for name, value in record.items()}
+        for field in URL_FIELDS:
+            if isinstance(lowered.get(field), str):
+                return lowered[field]
+    return None
+
+
+def iter_text(file):
+    """One URL per line; blank lines and '#' comments are skipped, extra columns ignored"""
+    for line in file:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line.split()[0]
+
+
+def iter_csv(file, delimiter=','):
+    """URL column of a CSV manifest (by header name), or the first URL-like cell of each row"""
+    reader = csv.reader(file, delimiter=delimiter)
+    column = None
+    for row_number, row in enumerate(reader):
+        cells = [cell.strip() for cell in row]
+        if row_number == 0:
+            names = [cell.lower() for cell in cells]
+            for field in URL_FIELDS:
+                if field in names:
+                    column = names.index(field)
+                    break
+            if column is not None:
+                continue
+        if column is not None:
+            if column < len(cells) and cells[column]:
+                yield cells[column]
+            continue
+        url = next((cell for cell in cells if looks_like_url(cell)), None)
+        if url:
+            yield url
+
+
+def iter_jsonl(file):
+    """'url' field of each JSON object (or a bare JSON string) per line"""
+    for line in file:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            url = _url_from_record(json.loads(line))
+        except ValueError:
+            url = None
+        # Unparseable lines are passed through so they are counted as invalid
+        yield url or line
+
+
+def iter_manifest(path):
+    """Raw URLs of a text, CSV/TSV or JSONL file, read lazily"""
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, 'r', encoding='utf-8-sig', newline='') as file:
+        if extension == '.csv':
+            yield from iter_csv(file)
+        elif extension == '.tsv':
+            yield from iter_csv(file, delimiter='\t')
+        elif extension in ('.jsonl', '.ndjson'):
+            yield from iter_jsonl(file)
+        else:
+            yield from iter_text(file)
+
+
+class SeenSet:
+    """Bounded set of 8-byte key digests; evicts the oldest once capacity is reached"""
+
+    def __init__(self, capacity=DEFAULT_SEEN_CAPACITY):
+        self.capacity = capacity
+        self._digests = OrderedDict()
+
+    def __len__(self):
+        return len(self._digests)
+
+    def add(self, key):
+        """Remember key; returns False if it was already there"""
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+        if digest in self._digests:
+            self._digests.move_to_end(digest)
+            return False
+        self._digests[digest] = None
+        if len(self._digests) > self.capacity:
+            self._digests.popitem(last=False)
+        return True
+
+
+class UrlIngest:
+    """Turn raw input into a stream of normalized, de-duplicated URLs with counters"""
+
+    def __init__(self, noplaylist=False, capacity=DEFAULT_SEEN_CAPACITY):
+        self.noplaylist = noplaylist
+        self.seen = SeenSet(capacity)
+        self.read = 0
+        self.accepted = 0
+        self.duplicates = 0
+        self.invalid = 0
+
+    def mark_seen(self, url):
+        """Treat url as already queued (e.g. by the job being resumed)"""
+        url = prepare_url(url)
+        if url:
+            self.seen.add(canonical_key(url, self.noplaylist))
+
+    def filter(self, raw_urls):
+        """Yield each new URL from an iterable of raw strings"""
+        for raw in raw_urls:
+            self.read += 1
+            url = prepare_url(raw)
+            if url is None:
+                self.invalid += 1
+                continue
+            if not self.seen.add(canonical_key(url, self.noplaylist)):
+                self.duplicates += 1
+                continue
+            self.accepted += 1
+            yield url
+
+    def stream(self, url_or_file):
+        """URLs of a manifest file, or the single URL given"""
+        if os.path.isfile(url_or_file):
+            return self.filter(iter_manifest(url_or_file))
+        return self.filter([url_or_file])
@@ -0,0 +1,96 @@
+"""
+Precarga del motor de descarga
+La ventana se muestra antes de importar yt-dlp: el motor de descarga y el
+registro de extractores se importan en un hilo en segundo plano mientras el
+usuario pega una URL, y en cuanto se conoce la URL se carga solo el extractor
+de su sitio. Cada paso se cronometra para informar al arrancar.
+"""
+
+import importlib
+import queue
+import threading
+import time
+
+from url_ingest import prepare_url
+
+# Imported in this order; download_engine pulls in the rest of the pipeline
+WARMUP_MODULES = (
+    ('yt-dlp', 'yt_dlp'),
+    ('motor', 'download_engine'),
+)
+
+
+class Warmup:
+    """Import the download engine on a background thread and time each step.
+
+    on_ready(warmup) and on_extractor(name, seconds) are called from that
+    thread. Importing the engine from another thread meanwhile is safe: the
+    import system makes it wait for the module being loaded here.
+    """
+
+    def __init__(self, on_ready=None, on_extractor=None):
+        self.on_ready = on_ready
+        self.on_extractor = on_extractor
+        self.timings = []  # (label, seconds)
+        self.error = None
+        self.ready = threading.Event()
+        self._urls = queue.Queue()
+        self._loaded = set()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+        self._thread.start()
+        return self
+
+    @property
+    def total_seconds(self):
+        return sum(seconds for _, seconds in self.timings)
+
+    def prime_for(self, url):
+        """Load the extractor that will handle url, once the engine is imported"""
+        url = prepare_url(url)
+        if url:
+            self._urls.put(url)
+
+    def _run(self):
+        try:
+            for label, module in WARMUP_MODULES:
+                self._timed(label, importlib.import_module, module)
+            extractor = importlib.import_module('yt_dlp.extractor')
+            # Only the lazy registry when yt-dlp ships one; every extractor module otherwise
+            self._timed('extractores', extractor.import_extractors)
+        except Exception as e:
+            # Reported again by the import in the download thread
+            self.error = e
+        finally:
+            self.ready.set()
+            if self.on_ready:
+                self.on_ready(self)
+        if self.error is None:
+            self._prime_loop(extractor)
+
+    def _timed(self, label, fn, *args):
+        started = time.perf_counter()
+        fn(*args)
+        self.timings.append((label, time.perf_counter() - started))
+
+    def _prime_loop(self, extractor):
+        while True:
+            url = self._urls.get()
+            # Only the newest URL matters while the user is still typing
+            while not self._urls.empty():
+                url = self._urls.get()
+            started = time.perf_counter()
+            try:
+                ie = next((ie for ie in extractor.gen_extractor_classes()
+                           if ie.ie_key() != 'Generic' and ie.suitable(url)), None)
+                if ie is None or ie.ie_key() in self._loaded:
+                    continue
+                # Lazy extractor stubs import their real module on first use
+                getattr(ie, 'real_class', ie)
+            except Exception:
+                continue
+            self._loaded.add(ie.ie_key())
+            if self.on_extractor:
+                self.on_extractor(ie.ie_key(), time.perf_counter() - started)
@@ -0,0 +1,104 @@
+"""
+Instancias de yt-dlp por hilo de trabajo
+Cada hilo reutiliza un único YoutubeDL durante todo el lote
+"""
+
+import threading
+
+import yt_dlp
+from yt_dlp.postprocessor.common import PostProcessor
+
+from download_archive import make_archive_id
+from segmented_download import SegmentedHttpFD
+
+
+class _CollectDownloaded(PostProcessor):
+    """Record (filepath, archive_id, acodec, abr, title) for every file yt-dlp finishes"""
+
+    def __init__(self, downloaded):
+        super().__init__()
+        self._downloaded = downloaded
+
+    def run(self, info):
+        archive_id = None
+        if info.get('id') and info.get('extractor_key'):
+            archive_id = make_archive_id(info['extractor_key'], info['id'])
+        self._downloaded.append((info['filepath'], archive_id, info.get('acodec'), info.get('abr'),
+                                 info.get('title')))
+        return [], info
+
+
+class _SegmentingYoutubeDL(yt_dlp.YoutubeDL):
+    """YoutubeDL that hands large plain-HTTP downloads to SegmentedHttpFD"""
+
+    def dl(self, name, info, subtitle=False, test=False):
+        if test or subtitle or name == '-' or not SegmentedHttpFD.can_download(info, self.params):
+            return super().dl(name, info, subtitle, test)
+        fd = SegmentedHttpFD(self, self.params)
+        for hook in self._progress_hooks:
+            fd.add_progress_hook(hook)
+        self.write_debug(f'Invoking {fd.FD_NAME} downloader on "{info["url"]}"')
+        new_info = self._copy_infodict(info)
+        if new_info.get('http_headers') is None:
+            new_info['http_headers'] = self._calc_headers(new_info)
+        return fd.download(name, new_info, subtitle)
+
+
+class WorkerSession:
+    """A worker thread's YoutubeDL plus the files it finished for the current URL"""
+
+    def __init__(self, ydl_opts, extractors=()):
+        self.downloaded = []
+        if extractors:
+            # Registered ahead of the built-in extractors, which end in the catch-all generic one
+            self.ydl = _SegmentingYoutubeDL(dict(ydl_opts), auto_init=False)
+            for extractor in extractors:
+                self.ydl.add_info_extractor(extractor())
+            self.ydl.add_default_info_extractors()
+        else:
+            self.ydl = _SegmentingYoutubeDL(dict(ydl_opts))
+        self.ydl.add_post_processor(_CollectDownloaded(self.downloaded), when='after_move')
+
+    def reset(self):
+        """Prepare the session for the next URL"""
+        self.downloaded.clear()
+        # YoutubeDL keeps the return code for its whole lifetime; count per URL instead
+        self.ydl._download_retcode = 0
+
+    @property
+    def failed(self):
+        return bool(self.ydl._download_retcode)
+
+
+class YDLWorkerPool:
+    """One long-lived YoutubeDL instance per worker thread"""
+
+    def __init__(self, ydl_opts, extractors=()):
+        self.ydl_opts = ydl_opts
+        self.extractors = tuple(extractors)
+        self._local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    def session(self):
+        """Return the calling thread's session, creating it on first use"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = WorkerSession(self.ydl_opts, self.extractors)
+            self._local.session = session
+            with self._lock:
+                self._sessions.append(session)
+        session.reset()
+        return session
+
+    def close(self):
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            session.ydl.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()